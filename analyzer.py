@@ -0,0 +1,208 @@
+"""
+This file is the library entry point to the log cleaning, for programs
+that analyse many participants in one long running process rather than
+running clean_log.py once for each.
+
+    from analyzer import Analyzer
+
+    with Analyzer(by_timestamp=True, jobs=4) as analyzer:
+        for result in analyzer.analyze_many(participant_folders):
+            if result.error is None:
+                sessions = result.sessions()
+
+An Analyzer is set up once with the options of clean_log.py and keeps the
+event handlers, the log cache, the sentiments the animation classifier
+has worked out and, with more than one job, its worker processes from
+one analysis to the next, so they are only paid for once per process. 
+The workers are stopped by close() or at the end of the with block.
+Importing it does not load numpy or the command line modules.
+
+A source is a log folder, an archive of one, a single log file, a binary
+file object or the bytes of a log file. Log folders and archives are put
+into sessions as clean_log.py does. A single log file, file object or
+bytes is put into sessions by the times of its log lines, as a file
+object or bytes has no file time to go by.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import io
+import os
+import traceback
+
+from archive import is_log_archive, read_log_file
+from clean_log import (analyse_by_timestamp, extract_log_bytes_events,
+                       get_usage_details, get_usage_details_by_timestamp)
+from das_reader import merge_read_stats
+from dedup import DuplicateFilter
+from event_handlers import EVENT_REGISTRY
+from writers import iter_sessions, TextWriter, write_usage_log
+
+
+class AnalysisResult:
+    """
+    The usage log of one source with the counts of what was read from it
+    """
+    def __init__(self, source, usage_log, read_stats, duplicate_count=0,
+                 error=None):
+        """
+        @param source: The source as given to the Analyzer
+        @param usage_log: dict of DailyData by date string
+        @param read_stats: dict of the record, error and skipped counts
+        @param duplicate_count: Number of duplicate log lines dropped
+        @param error: The error text if the source could not be analysed
+        """
+        self.source = source
+        self.usage_log = usage_log
+        self.read_stats = read_stats
+        self.duplicate_count = duplicate_count
+        self.error = error
+
+    def days(self):
+        """
+        @return: List of (date string, DailyData) in date order
+        """
+        return sorted(self.usage_log.items())
+
+    def sessions(self):
+        """
+        @return: List of the session summary of each session in time
+                 order, as written by the jsonl format
+        """
+        return [session for day, daily_record in self.days()
+                            for session in iter_sessions(day, daily_record)]
+
+    def format_text(self):
+        """
+        @return: The report as clean_log.py prints it
+        """
+        output = io.StringIO()
+        write_usage_log(self.usage_log, TextWriter(output))
+        return output.getvalue()
+
+
+class Analyzer:
+    """
+    Analyses log sources into usage logs with the same options each time
+    """
+    def __init__(self, prefilter=True, by_timestamp=False, jobs=1,
+                 log_cache=None, lazy=False, dedup=False,
+                 registry=EVENT_REGISTRY):
+        """
+        @param prefilter: If True log lines without a tracked event key are
+                          dropped before json decoding
+        @param by_timestamp: If True log folders and archives are put into
+                             sessions by the times of their log lines
+        @param jobs: Number of worker processes to parse the log files of
+                     a folder in, started on first use and kept until
+                     close()
+        @param log_cache: Optional LogCache kept open by the caller, so
+                          only new or changed log files are parsed
+        @param lazy: If True log lines are read as LogLineView objects,
+                     for every kind of source
+        @param dedup: If True the log lines of a source already read from
+                      another of its log files are dropped
+        @param registry: The EventRegistry of the handlers of each event
+                         key, a copy of EVENT_REGISTRY to add handlers to.
+                         The log lines carrying any key it has a handler
+                         for are read.
+        """
+        self.prefilter = prefilter
+        self.by_timestamp = by_timestamp
+        self.jobs = jobs
+        self.log_cache = log_cache
+        self.lazy = lazy
+        self.dedup = dedup
+        self.registry = registry
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Stops the worker processes. The log cache is the caller's to close.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _parse_executor(self):
+        """
+        @return: The ProcessPoolExecutor to parse the log files of folders
+                 in, or None with one job
+        """
+        if self.jobs > 1 and self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.jobs)
+        return self._executor
+
+    def analyze(self, source, event_log=None):
+        """
+        @param source: Path to a log folder, an archive of one or a log
+                       file, a binary file object or the bytes of a log file
+        @param event_log: Optional EventLog to collect every tracked event in
+        @return: The AnalysisResult of the source
+        """
+        read_stats = {}
+        dedup = DuplicateFilter() if self.dedup else None
+        if hasattr(source, '__fspath__'):
+            source = source.__fspath__()
+        if isinstance(source, str) and (os.path.isdir(source) or
+                                        is_log_archive(source)):
+            usage_details = get_usage_details
+            if self.by_timestamp:
+                usage_details = get_usage_details_by_timestamp
+            # An archive is read in one pass without the workers
+            executor = None
+            if os.path.isdir(source):
+                executor = self._parse_executor()
+            usage_log = usage_details(source, self.jobs, self.prefilter,
+                                      read_stats, self.log_cache, event_log,
+                                      lazy=self.lazy, dedup=dedup,
+                                      registry=self.registry,
+                                      executor=executor)
+        else:
+            usage_log = self._analyze_log_file(source, read_stats, event_log,
+                                               dedup)
+        return AnalysisResult(source, usage_log, read_stats,
+                              dedup.duplicate_count if dedup else 0)
+
+    def _analyze_log_file(self, source, read_stats, event_log, dedup):
+        """
+        Puts a single log file into sessions by the times of its log lines
+        @return: dict of DailyData by date string
+        """
+        log_file_path = None
+        if isinstance(source, str):
+            log_file_path = source
+            log_bytes = read_log_file(source)
+        elif hasattr(source, 'read'):
+            log_bytes = source.read()
+            if isinstance(log_bytes, str):
+                log_bytes = log_bytes.encode('utf-8')
+        else:
+            log_bytes = bytes(source)
+        log_events, file_stats = extract_log_bytes_events(
+                                        log_bytes, self.prefilter,
+                                        log_file_path,
+                                        self.registry.event_keys(),
+                                        self.lazy)
+        merge_read_stats(read_stats, file_stats)
+        if dedup is not None:
+            log_events = list(dedup.filter(log_events, log_file_path))
+        return analyse_by_timestamp([log_events], event_log, self.registry)
+
+    def analyze_many(self, sources):
+        """
+        Analyses each source in turn. A source that fails is given back
+        with its error rather than stopping the rest.
+        @param sources: iterable of the sources, as for analyze
+        @return: Generator of the AnalysisResult of each source in order
+        """
+        for source in sources:
+            try:
+                yield self.analyze(source)
+            except Exception:
+                yield AnalysisResult(source, {}, {},
+                                     error=traceback.format_exc())
@@ -0,0 +1,159 @@
+"""
+This file classifies cozmo animations as positive, negative or mixed/neutral
+from the words in their names.
+
+Animation names come from a small fixed vocabulary, so each name is only
+worked out once and remembered.
+"""
+import re
+
+from events import trie_regex
+
+POSITIVE = 1
+NEGATIVE = -1
+MIXED_NEUTRAL = 0
+
+POSITIVE_ANIM_STRINGS = ('admire',
+                         'ask',
+                         'celebrat',
+                         'find',
+                         'found',
+                         'giggle',
+                         'happy',
+                         'hello',
+                         'highenergy',
+                         'ideatoplay',
+                         'like',
+                         'newarea',
+                         'petdetection',
+                         'playeryes',
+                         'request',
+                         'reacttocube',
+                         'reenrollment',
+                         'thankyou',
+                         'upgrade',
+                         'wheely',
+                         'wiggle',
+                         'turbo')
+
+NEGATIVE_ANIM_STRINGS = ('badword',
+                         'bored',
+                         'dizzy',
+                         'frustrated',
+                         'lowenergy',
+                         'match_no',
+                         'playerno', 
+                         'struggle',
+                         'stuck',
+                         'upset',
+                         'turtleroll',
+                         'hiccup')
+
+# Words that decide the sentiment ahead of the lists above
+RULE_ANIM_STRINGS = ('cure',
+                     'win',
+                     'success',
+                     'lose',
+                     'fail',
+                     'player',
+                     'solo',
+                     'reacttoface',
+                     'unidentified',
+                     'petdetection',
+                     'misc')
+
+# Names are only remembered up to this many, in case the log holds
+# something other than the usual animations
+MAX_REMEMBERED_NAMES = 100000
+
+
+class AnimationClassifier:
+    """
+    Works out the sentiment of animation names with one regex pass over
+    the name and remembers the result for each name
+    """
+    def __init__(self):
+        words = set(POSITIVE_ANIM_STRINGS + NEGATIVE_ANIM_STRINGS +
+                    RULE_ANIM_STRINGS)
+        # The lookahead finds the words starting at every position, and the
+        # words inside a longer match (player in playerno) are added after
+        self._word_pattern = re.compile('(?=(%s))' % trie_regex(words))
+        self._contained_words = {word: frozenset(other for other in words
+                                                           if other in word)
+                                 for word in words}
+        self._positive = frozenset(POSITIVE_ANIM_STRINGS)
+        self._negative = frozenset(NEGATIVE_ANIM_STRINGS)
+        self._sentiments = {}
+
+    def _find_words(self, anim_name):
+        """
+        @param anim_name: The name of the animation
+        @return: set of the vocabulary words found in the name
+        """
+        found = set()
+        for match in self._word_pattern.finditer(anim_name):
+            found.update(self._contained_words[match.group(1)])
+        return found
+
+    def _work_out(self, anim_name):
+        """
+        Applies the sentiment rules to an animation name
+        @param anim_name: The name of the animation
+        @return: POSITIVE, NEGATIVE or MIXED_NEUTRAL
+        """
+        found = self._find_words(anim_name)
+        anim_id = MIXED_NEUTRAL
+        if 'cure' in found:
+            # To handle cure of hiccups
+            anim_id = POSITIVE
+        if 'win' in found or 'success' in found:
+            if 'player' in found and not 'solo' in found:
+                anim_id = NEGATIVE
+            else:
+                anim_id = POSITIVE
+        elif 'lose' in found or 'fail' in found:
+            if 'player' in found and not 'solo' in found:
+                anim_id = POSITIVE
+            else:
+                anim_id = NEGATIVE
+        elif 'reacttoface' in found and not 'unidentified' in found:
+            # positive reactions seems to be for known people only
+            anim_id = POSITIVE
+        elif 'petdetection' in found and 'misc' in found:
+            # the sneeze
+            anim_id = NEGATIVE
+        
+        if not anim_id and not found.isdisjoint(self._positive):
+            anim_id = POSITIVE
+        if not anim_id and not found.isdisjoint(self._negative):
+            anim_id = NEGATIVE
+        return anim_id
+
+    def classify(self, anim_name):
+        """
+        @param anim_name: The name of the animation
+        @return: POSITIVE, NEGATIVE or MIXED_NEUTRAL
+        """
+        try:
+            return self._sentiments[anim_name]
+        except KeyError:
+            pass
+        if len(self._sentiments) >= MAX_REMEMBERED_NAMES:
+            self._sentiments.clear()
+        anim_id = self._sentiments[anim_name] = self._work_out(anim_name)
+        return anim_id
+
+    def classify_many(self, anim_names):
+        """
+        Classifies a whole sequence of animation names, working out each 
+        distinct name once
+        @param anim_names: iterable of animation names
+        @return: list of the sentiment of each name in order
+        """
+        anim_names = list(anim_names)
+        sentiments = {name: self.classify(name) for name in set(anim_names)}
+        return [sentiments[name] for name in anim_names]
+
+
+ANIMATION_CLASSIFIER = AnimationClassifier()
+classify_animation = ANIMATION_CLASSIFIER.classify
@@ -0,0 +1,126 @@
+"""
+This file reads the log files of participant folders kept in archives:
+tarballs (.tar, .tar.gz, .tar.bz2, .tar.xz and, with the zstandard module,
+.tar.zst), zipped folders and single gzipped log files (.das.gz).
+
+An archive is read in one pass in the order its members are stored,
+decompressing each log file into memory on its own, so nothing is
+extracted to disk and a gzipped tarball is never rewound. As with a log
+folder every file in it is read as a log file, gunzipped if its name ends
+in .gz. The time of a log file is the modified time kept for its member.
+"""
+import gzip
+import os
+import tarfile
+import time
+import zipfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz',
+                  '.txz')
+
+ZSTD_TAR_EXTENSIONS = ('.tar.zst', '.tzst')
+
+ZIP_EXTENSIONS = ('.zip',)
+
+ARCHIVE_EXTENSIONS = TAR_EXTENSIONS + ZSTD_TAR_EXTENSIONS + ZIP_EXTENSIONS
+
+GZIP_EXTENSION = '.gz'
+
+
+def is_log_archive(path):
+    """
+    @param path: Path to a participant folder or archive
+    @return: True if the path is an archive file this module can read
+    """
+    return path.lower().endswith(ARCHIVE_EXTENSIONS) and os.path.isfile(path)
+
+def read_log_file(log_file_path):
+    """
+    @param log_file_path: The full path to a log file, gzipped if it ends
+                          in .gz
+    @return: The bytes of the whole log file
+    """
+    if log_file_path.endswith(GZIP_EXTENSION):
+        with gzip.open(log_file_path, 'rb') as file_pointer:
+            return file_pointer.read()
+    with open(log_file_path, 'rb') as file_pointer:
+        return file_pointer.read()
+
+def _iter_tar_members(tar_file):
+    """
+    @param tar_file: TarFile opened in stream mode
+    @return: Generator of (name, modified time, file object) of each file
+    """
+    for member in tar_file:
+        if member.isfile():
+            yield member.name, member.mtime, tar_file.extractfile(member)
+
+def iter_archive_members(archive_path):
+    """
+    Goes through the files of an archive in the order they are stored.
+    Each file object is only good until the next member is reached.
+    @param archive_path: Path to the archive
+    @return: Generator of (name, modified time, file object) of each file
+    """
+    lower_path = archive_path.lower()
+    if lower_path.endswith(ZIP_EXTENSIONS):
+        with zipfile.ZipFile(archive_path) as zip_file:
+            for info in zip_file.infolist():
+                if info.filename.endswith('/'):
+                    continue
+                # Zip keeps the local time the file was written at
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+                with zip_file.open(info) as file_pointer:
+                    yield info.filename, mtime, file_pointer
+    elif lower_path.endswith(ZSTD_TAR_EXTENSIONS):
+        if zstandard is None:
+            raise RuntimeError("zstandard is needed to read %s" %
+                                                                archive_path)
+        with open(archive_path, 'rb') as compressed_file:
+            reader = zstandard.ZstdDecompressor().stream_reader(
+                                                            compressed_file)
+            with tarfile.open(fileobj=reader, mode='r|') as tar_file:
+                for member in _iter_tar_members(tar_file):
+                    yield member
+    else:
+        with tarfile.open(archive_path, mode='r|*') as tar_file:
+            for member in _iter_tar_members(tar_file):
+                yield member
+
+def iter_archive_logs(archive_path):
+    """
+    Reads the files of an archive in the order they are stored
+    @param archive_path: Path to the archive
+    @return: Generator of (modified time, path, bytes) of each log file,
+             the path being the archive path joined to the member name
+    """
+    for name, mtime, file_pointer in iter_archive_members(archive_path):
+        log_bytes = file_pointer.read()
+        if name.endswith(GZIP_EXTENSION):
+            log_bytes = gzip.decompress(log_bytes)
+        yield mtime, os.path.join(archive_path, name), log_bytes
+
+def read_archive_member(archive_path, file_names):
+    """
+    @param archive_path: Path to the archive
+    @param file_names: Base names of the files wanted, in order of
+                       preference
+    @return: The bytes of the most preferred of the files found in the
+             archive, or None if there are none
+    """
+    found = {}
+    for name, mtime, file_pointer in iter_archive_members(archive_path):
+        base_name = os.path.basename(name)
+        if base_name in file_names and base_name not in found:
+            found[base_name] = file_pointer.read()
+            if base_name == file_names[0]:
+                break
+    for file_name in file_names:
+        if file_name in found:
+            return found[file_name]
+    return None
@@ -0,0 +1,254 @@
+"""
+This file puts the usage sessions together from a cozmo log folder through
+an asyncio pipeline, so the log files are opened and read while earlier
+ones are still being parsed and analysed. This helps most when the logs
+sit on network storage where opening each file is slow.
+
+The stages are
+    scan    : list the log folder and sort the files by time
+    read    : read whole log files in threads
+    parse   : decode the tracked events in an executor
+    analyse : put the events into sessions in log file order
+Bounded queues between the stages hold back the earlier ones when a later
+one falls behind.
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+import os
+import sys
+
+from archive import read_log_file
+from clean_log import (analyse_log_data, extract_log_bytes_events,
+                       get_file_session, sort_logs_by_time)
+from das_reader import merge_read_stats
+from event_handlers import EVENT_REGISTRY
+
+# Number of log files being read at the same time
+DEFAULT_IO_WORKERS = 4
+
+# Number of log files waiting between two stages
+DEFAULT_QUEUE_SIZE = 8
+
+
+def scan_log_files(log_dir):
+    """
+    @param log_dir: The directory containing all the log files to read
+    @return: List of (modified time, path, os.stat_result) of the log files
+             sorted by time
+    """
+    # Don't want to get into directories
+    return [(fdate, fpath, os.stat(fpath)) for fdate, fpath in
+                                                sort_logs_by_time(log_dir)
+                                                    if os.path.isfile(fpath)]
+
+
+class UsagePipeline:
+    """
+    Runs the stages of the pipeline for one log folder. The analyse stage
+    runs in the event loop thread so the usage log, the log cache and the
+    event log are only ever touched from there.
+    """
+    def __init__(self, jobs=1, prefilter=True, read_stats=None,
+                 log_cache=None, event_log=None,
+                 io_workers=DEFAULT_IO_WORKERS, queue_size=DEFAULT_QUEUE_SIZE,
+                 dedup=None, usage_log=None, registry=EVENT_REGISTRY):
+        """
+        @param jobs: Number of worker processes to parse the log files in
+        @param prefilter: If True skip decoding log lines without tracked keys
+        @param read_stats: Optional dict in which the read counts are added up
+        @param log_cache: Optional LogCache so only new or changed log files
+                          are read and parsed
+        @param event_log: Optional EventLog to collect every tracked event in
+        @param io_workers: Number of log files read at the same time
+        @param queue_size: Number of log files waiting between two stages
+        @param dedup: Optional DuplicateFilter dropping the log lines 
+                      already read from another log file
+        @param usage_log: Optional mapping to put the DailyData of each 
+                          day in, a dict if not given
+        @param registry: The EventRegistry of the handlers of each event key
+        """
+        self.jobs = jobs
+        self.prefilter = prefilter
+        self.read_stats = read_stats
+        self.log_cache = log_cache
+        self.event_log = event_log
+        self.io_workers = max(1, io_workers)
+        self.queue_size = max(1, queue_size)
+        self.dedup = dedup
+        self.usage_log = usage_log
+        self.registry = registry
+        self.event_keys = registry.event_keys()
+
+    def run(self, log_dir):
+        """
+        @param log_dir: The directory containing all the log files to read
+        @return: dict of DailyData by date string
+        """
+        loop = asyncio.new_event_loop()
+        io_executor = ThreadPoolExecutor(max_workers=self.io_workers)
+        if self.jobs > 1:
+            parse_executor = ProcessPoolExecutor(max_workers=self.jobs)
+        else:
+            parse_executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            return loop.run_until_complete(self._run(loop, log_dir,
+                                                     io_executor,
+                                                     parse_executor))
+        finally:
+            io_executor.shutdown()
+            parse_executor.shutdown()
+            loop.close()
+
+    async def _run(self, loop, log_dir, io_executor, parse_executor):
+        read_queue = asyncio.Queue(maxsize=self.queue_size)
+        result_queue = asyncio.Queue(maxsize=self.queue_size)
+        # Files read ahead of the one being analysed, so a slow file
+        # cannot leave the later ones piling up waiting for it
+        read_ahead = asyncio.Semaphore(self.queue_size + self.io_workers)
+
+        log_files = await loop.run_in_executor(io_executor, scan_log_files,
+                                               log_dir)
+        tasks = [asyncio.ensure_future(self._feed(log_files, read_queue,
+                                                  result_queue, read_ahead))]
+        tasks.extend(asyncio.ensure_future(self._read(loop, read_queue,
+                                                      result_queue,
+                                                      io_executor,
+                                                      parse_executor))
+                     for reader in range(self.io_workers))
+        analyse = asyncio.ensure_future(self._analyse(log_files, result_queue,
+                                                      read_ahead))
+        tasks.append(analyse)
+        try:
+            # A stage that fails before the analyse stage is done would
+            # otherwise leave it waiting for results that never come
+            done, pending = await asyncio.wait(tasks, return_when=
+                                                    asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+            return analyse.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _feed(self, log_files, read_queue, result_queue, read_ahead):
+        """
+        Hands the log files to the readers in time order, taking the ones
+        the log cache already holds straight to the analyse stage
+        """
+        for index, (fdate, fpath, file_stat) in enumerate(log_files):
+            await read_ahead.acquire()
+            log_events = None
+            if self.log_cache is not None:
+                log_events = self.log_cache.get(fpath, file_stat,
+                                                self.event_keys.version)
+            if log_events is not None:
+                await result_queue.put((index, log_events, None, None))
+            else:
+                await read_queue.put((index, fpath))
+        for reader in range(self.io_workers):
+            await read_queue.put(None)
+
+    async def _read(self, loop, read_queue, result_queue, io_executor,
+                    parse_executor):
+        """
+        Reads and parses log files until told to stop. A file that fails
+        is passed on with its error so it is reported in log file order
+        """
+        parse_log = partial(extract_log_bytes_events, prefilter=self.prefilter,
+                            event_keys=self.event_keys)
+        while True:
+            item = await read_queue.get()
+            if item is None:
+                return
+            index, fpath = item
+            try:
+                log_bytes = await loop.run_in_executor(io_executor,
+                                                       read_log_file, fpath)
+                log_events, file_stats = await loop.run_in_executor(
+                                                parse_executor,
+                                                partial(parse_log, 
+                                                        log_file_path=fpath),
+                                                log_bytes)
+            except Exception as error:
+                await result_queue.put((index, None, None, error))
+            else:
+                await result_queue.put((index, log_events, file_stats, None))
+
+    async def _analyse(self, log_files, result_queue, read_ahead):
+        """
+        Puts the parsed log files back into time order and analyses them
+        into sessions
+        """
+        usage_log = self.usage_log
+        if usage_log is None:
+            usage_log = {}
+        last_log_time = None
+        waiting = {}
+        for index, (fdate, fpath, file_stat) in enumerate(log_files):
+            while index not in waiting:
+                result = await result_queue.get()
+                waiting[result[0]] = result[1:]
+            log_events, file_stats, error = waiting.pop(index)
+            read_ahead.release()
+
+            cur_log_time = datetime.utcfromtimestamp(fdate)
+            try:
+                if error is not None:
+                    raise error
+                if file_stats is not None:
+                    if self.read_stats is not None:
+                        merge_read_stats(self.read_stats, file_stats)
+                    if self.log_cache is not None:
+                        self.log_cache.put(fpath, file_stat, log_events,
+                                           self.event_keys.version)
+                if self.dedup is not None:
+                    duplicate_count = self.dedup.duplicate_count
+                    log_events = list(self.dedup.filter(log_events, fpath))
+                    if not log_events and \
+                                self.dedup.duplicate_count > duplicate_count:
+                        # A copy of log files already read is no session
+                        continue
+                session_record = get_file_session(usage_log, cur_log_time,
+                                                  last_log_time)
+                last_log_time = cur_log_time
+                analyse_log_data(log_events, session_record, self.event_log,
+                                 self.registry)
+            except:
+                # If a file is creating problem then tell us what it is
+                print("Issue in %s" % fpath, file=sys.stderr)
+                raise
+        return usage_log
+
+
+def get_usage_details_async(log_dir, jobs=1, prefilter=True, read_stats=None,
+                            log_cache=None, event_log=None,
+                            io_workers=DEFAULT_IO_WORKERS,
+                            queue_size=DEFAULT_QUEUE_SIZE, dedup=None,
+                            usage_log=None, registry=EVENT_REGISTRY):
+    """
+    Same as get_usage_details, but the log files are read and parsed
+    through the asyncio pipeline while earlier ones are being analysed
+    @param log_dir: The directory containing all the log files to read
+    @param jobs: Number of worker processes to parse the log files in
+    @param prefilter: If True log lines without a tracked event key are
+                      dropped before json decoding
+    @param read_stats: Optional dict in which the read counts are added up
+    @param log_cache: Optional LogCache so only new or changed log files
+                      are parsed
+    @param event_log: Optional EventLog to collect every tracked event in
+    @param io_workers: Number of log files read at the same time
+    @param queue_size: Number of log files waiting between two stages
+    @param dedup: Optional DuplicateFilter dropping the log lines already
+                  read from another log file
+    @param usage_log: Optional mapping to put the DailyData of each day in
+    @param registry: The EventRegistry of the handlers of each event key
+    @return: dict of DailyData by date string
+    """
+    pipeline = UsagePipeline(jobs, prefilter, read_stats, log_cache,
+                             event_log, io_workers, queue_size, dedup,
+                             usage_log, registry)
+    return pipeline.run(log_dir)
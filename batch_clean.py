@@ -0,0 +1,211 @@
+"""
+This program runs clean_log over every participant folder found under a
+root folder and writes one consolidated report, with each participant
+identified by the $unit and $phone of its thisRun.dasGlobals. A
+participant folder can also be kept as an archive, such as P005.tar.gz.
+
+Participant folders are processed in a pool of worker processes. Only a
+bounded number of finished reports are held waiting to be written, and a
+folder that fails is reported without stopping the rest of the batch.
+With --dedup the duplicate log lines are looked for within each 
+participant folder, and the lines dropped are listed on stderr after the
+folder is done.
+"""
+
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+import io
+import json
+import os
+import sys
+import traceback
+
+from archive import is_log_archive, read_archive_member
+from clean_log import (add_parse_arguments, cache_settings,
+                       get_usage_details, get_usage_details_by_timestamp,
+                       print_usage_log)
+from dedup import DuplicateFilter
+from log_cache import LogCache
+
+LOG_FILE_EXTENSIONS = ('.das', '.das_inprogress')
+RUN_GLOBALS_FILES = ('thisRun.dasGlobals', 'lastRun.dasGlobals')
+
+
+def find_participant_folders(root_dir):
+    """
+    Finds every folder under the root holding cozmo log files, and every
+    archive of one
+    @param root_dir: The folder to search
+    @return: Sorted list of the participant folder and archive paths
+    """
+    participant_folders = []
+    for dir_path, dir_names, file_names in os.walk(root_dir):
+        if any(file_name.endswith(LOG_FILE_EXTENSIONS) 
+                                            for file_name in file_names):
+            participant_folders.append(dir_path)
+        participant_folders.extend(os.path.join(dir_path, file_name)
+                                    for file_name in file_names
+                                        if is_log_archive(os.path.join(
+                                                    dir_path, file_name)))
+    return sorted(participant_folders)
+
+def read_run_globals(log_dir):
+    """
+    Reads the values that are the same for every log line of a run, 
+    such as $unit and $phone
+    @param log_dir: The participant folder or archive
+    @return: dict of the run globals, empty if none could be read
+    """
+    if is_log_archive(log_dir):
+        try:
+            run_globals = read_archive_member(log_dir, RUN_GLOBALS_FILES)
+            if run_globals is not None:
+                return json.loads(run_globals.decode('utf-8'))
+        except (OSError, ValueError):
+            pass
+        return {}
+    for file_name in RUN_GLOBALS_FILES:
+        try:
+            with open(os.path.join(log_dir, file_name), 'r') as file_pointer:
+                return json.load(file_pointer)
+        except (OSError, ValueError):
+            continue
+    return {}
+
+def process_participant(log_dir, prefilter=True, log_cache_settings=None,
+                        by_timestamp=False, lazy=False, dedup=False):
+    """
+    Works out the usage details of one participant folder. This runs in
+    the worker processes and only sends back the printed report.
+    @param log_dir: The participant folder
+    @param prefilter: If True skip decoding log lines without tracked keys
+    @param log_cache_settings: Tuple of LogCache arguments or None
+    @param by_timestamp: If True sessions are grouped by log line times
+    @param lazy: If True log lines are read as LogLineView objects
+    @param dedup: If True the log lines already read from another log file
+                  of the folder are dropped
+    @return: Tuple of the run globals, the report text, the text listing 
+             the duplicate log lines dropped and the error text which is
+             None if the folder was processed
+    """
+    run_globals = read_run_globals(log_dir)
+    report = io.StringIO()
+    dedup_report = io.StringIO()
+    log_cache = LogCache(*log_cache_settings) if log_cache_settings else None
+    duplicate_filter = DuplicateFilter() if dedup else None
+    usage_details = get_usage_details
+    if by_timestamp:
+        usage_details = get_usage_details_by_timestamp
+    try:
+        with redirect_stdout(report):
+            usage_log = usage_details(log_dir, prefilter=prefilter,
+                                      log_cache=log_cache, lazy=lazy,
+                                      dedup=duplicate_filter)
+            print_usage_log(usage_log)
+    except Exception:
+        return run_globals, None, '', traceback.format_exc()
+    finally:
+        if log_cache:
+            log_cache.close()
+    if duplicate_filter is not None:
+        duplicate_filter.write_report(dedup_report)
+    return run_globals, report.getvalue(), dedup_report.getvalue(), None
+
+def write_participant(output, log_dir, run_globals, report, error):
+    """
+    Writes the report of one participant with its identifying header
+    @param output: File object to write to
+    @param log_dir: The participant folder
+    @param run_globals: dict of the run globals of the folder
+    @param report: The printed usage report or None
+    @param error: The error text if the folder could not be processed
+    """
+    output.write("================================================================\n")
+    output.write("Participant                  : %s\n" % log_dir)
+    output.write("Unit                         : %s\n" % run_globals.get('$unit'))
+    output.write("Phone                        : %s\n" % run_globals.get('$phone'))
+    if error:
+        output.write("Error                        : %s\n" % 
+                                            error.strip().splitlines()[-1])
+    else:
+        output.write(report)
+
+def run_batch(root_dir, output, jobs=1, prefilter=True, 
+              log_cache_settings=None, by_timestamp=False, lazy=False,
+              dedup=False):
+    """
+    Processes every participant folder under the root and writes the
+    reports in folder order
+    @param root_dir: The folder to search for participant folders
+    @param output: File object to write the consolidated report to
+    @param jobs: Number of participant folders processed at a time
+    @param prefilter: If True skip decoding log lines without tracked keys
+    @param log_cache_settings: Tuple of LogCache arguments or None
+    @param by_timestamp: If True sessions are grouped by log line times
+    @param lazy: If True log lines are read as LogLineView objects
+    @param dedup: If True the log lines already read from another log file
+                  of the same folder are dropped
+    @return: List of the participant folders that failed
+    """
+    participant_folders = find_participant_folders(root_dir)
+    failed = []
+    # Only a couple of reports per worker are kept in flight so memory
+    # stays bounded however many folders there are
+    max_pending = 2 * jobs
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        next_folders = iter(participant_folders)
+        for count in range(1, len(participant_folders) + 1):
+            for log_dir in next_folders:
+                pending.append((log_dir, executor.submit(process_participant,
+                                                         log_dir, prefilter,
+                                                         log_cache_settings,
+                                                         by_timestamp, lazy,
+                                                         dedup)))
+                if len(pending) >= max_pending:
+                    break
+            log_dir, future = pending.popleft()
+            run_globals, report, dedup_report, error = future.result()
+            write_participant(output, log_dir, run_globals, report, error)
+            sys.stderr.write(dedup_report)
+            if error:
+                failed.append(log_dir)
+                print("Issue in %s\n%s" % (log_dir, error), file=sys.stderr)
+            print("[%d/%d] %s" % (count, len(participant_folders), log_dir),
+                  file=sys.stderr)
+    return failed
+    
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Groups the cozmo logs of "
+                                                 "every participant folder "
+                                                 "under a root into usage "
+                                                 "sessions")
+    parser.add_argument('root_dir', 
+                        help="Folder containing the participant log folders")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help="Number of participant folders processed at a "
+                             "time (default %(default)s)")
+    parser.add_argument('--output', 
+                        help="File to write the consolidated report to "
+                             "instead of stdout")
+    add_parse_arguments(parser)
+    args = parser.parse_args()
+    
+    if args.output:
+        output = open(args.output, 'w')
+    else:
+        output = sys.stdout
+    try:
+        failed = run_batch(args.root_dir, output, args.jobs, args.prefilter,
+                           cache_settings(args), args.by_timestamp,
+                           args.lazy_records, args.dedup)
+    finally:
+        if args.output:
+            output.close()
+    if failed:
+        print("%d participant folders could not be processed" % len(failed),
+              file=sys.stderr)
+        sys.exit(1)
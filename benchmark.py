@@ -0,0 +1,334 @@
+"""
+This file times the stages of cleaning a cozmo log folder: reading the log
+files, analysing the log lines, working out animation sentiment, printing
+the report and the whole of get_usage_details.
+
+Each stage is run in a fresh worker process so its peak memory can be
+reported on its own. The results are written as json so the numbers from
+two versions of the code can be compared with --compare.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, so no peak memory is reported there
+    resource = None
+
+from anim_sentiment import AnimationClassifier
+from clean_log import (analyse_log_data, get_usage_details, print_usage_log,
+                       read_input_log, sort_logs_by_time)
+from das_generator import write_log_folder
+from record import SessionData
+
+STAGES = ('read',
+          'read_prefilter',
+          'analyse',
+          'anim_analysis',
+          'anim_analysis_uncached',
+          'formatted_print',
+          'usage_details')
+
+RESULTS_VERSION = 1
+
+
+def find_log_files(log_dir):
+    """
+    @param log_dir: The log folder
+    @return: List of the paths of the log files in time order
+    """
+    return [fpath for fdate, fpath in sort_logs_by_time(log_dir)
+                                                    if os.path.isfile(fpath)]
+
+
+def peak_rss_mb():
+    """
+    @return: Peak resident memory of this process in MB or None if it
+             cannot be found out
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Given in bytes rather than KB
+        peak /= 1024.0
+    return peak / 1024.0
+
+
+def load_log_data(log_file_paths):
+    """
+    @param log_file_paths: List of the paths of the log files
+    @return: List of the list of log lines of each file
+    """
+    return [list(read_input_log(log_file_path))
+                                        for log_file_path in log_file_paths]
+
+
+def load_animation_names(log_file_paths):
+    """
+    @param log_file_paths: List of the paths of the log files
+    @return: List of every animation played in the log files
+    """
+    return [log_line['robot.play_animation']
+                for log_data in load_log_data(log_file_paths)
+                    for log_line in log_data
+                        if 'robot.play_animation' in log_line]
+
+
+def read_log_files(log_file_paths, prefilter):
+    """
+    Reads every log line of the log files without analysing them
+    @param log_file_paths: List of the paths of the log files
+    @param prefilter: If True skip decoding log lines without tracked keys
+    @return: Number of records read or skipped
+    """
+    read_stats = {}
+    for log_file_path in log_file_paths:
+        for log_line in read_input_log(log_file_path, prefilter, read_stats):
+            pass
+    return read_stats['records'] + read_stats['skipped_records']
+
+
+def analyse_log_files(all_log_data):
+    """
+    Analyses the log lines of every file into one session
+    @param all_log_data: List of the list of log lines of each file
+    @return: Number of log lines analysed
+    """
+    session_record = SessionData(datetime(2017, 1, 1), 1)
+    for log_data in all_log_data:
+        analyse_log_data(log_data, session_record)
+    return sum(len(log_data) for log_data in all_log_data)
+
+
+def analyse_animations(anim_names):
+    """
+    Works out the sentiment of each animation through anim_analysis
+    @param anim_names: List of animation names
+    @return: Number of animations classified
+    """
+    session_record = SessionData(datetime(2017, 1, 1), 1)
+    anim_analysis = session_record.anim_analysis
+    for anim_name in anim_names:
+        anim_analysis(anim_name)
+    return len(anim_names)
+
+
+def analyse_animations_uncached(anim_names):
+    """
+    Applies the sentiment rules to each animation, going round the
+    remembered sentiments to time the rules themselves
+    @param anim_names: List of animation names
+    @return: Number of animations classified
+    """
+    work_out = AnimationClassifier()._work_out
+    for anim_name in anim_names:
+        work_out(anim_name)
+    return len(anim_names)
+
+
+def print_usage(usage_log):
+    """
+    Prints the report of a usage log to a string rather than stdout
+    @param usage_log: dict of DailyData by date string
+    @return: Number of sessions printed
+    """
+    with redirect_stdout(io.StringIO()):
+        print_usage_log(usage_log)
+    return sum(len(daily_record.sessions_record)
+                                    for daily_record in usage_log.values())
+
+
+def read_usage_details(log_dir):
+    """
+    @param log_dir: The log folder
+    @return: Number of days in the usage log of the folder
+    """
+    return len(get_usage_details(log_dir, prefilter=True))
+
+
+def prepare_stage(stage, log_dir):
+    """
+    Loads what a stage works on, outside of the timing
+    @param stage: Name of the stage
+    @param log_dir: The log folder
+    @return: Tuple of the function to time, its argument, the unit of the
+             count it returns and whether the file bytes are its input
+    """
+    log_file_paths = find_log_files(log_dir)
+    if stage == 'read':
+        return (lambda paths: read_log_files(paths, False), log_file_paths,
+                'records', True)
+    if stage == 'read_prefilter':
+        return (lambda paths: read_log_files(paths, True), log_file_paths,
+                'records', True)
+    if stage == 'analyse':
+        return (analyse_log_files, load_log_data(log_file_paths), 'records',
+                True)
+    if stage == 'anim_analysis':
+        return (analyse_animations, load_animation_names(log_file_paths),
+                'animations', False)
+    if stage == 'anim_analysis_uncached':
+        return (analyse_animations_uncached,
+                load_animation_names(log_file_paths), 'animations', False)
+    if stage == 'formatted_print':
+        return (print_usage, get_usage_details(log_dir), 'sessions', False)
+    if stage == 'usage_details':
+        return read_usage_details, log_dir, 'days', True
+    raise ValueError("Unknown stage %s" % stage)
+
+
+def run_stage(stage, log_dir, repeat=1):
+    """
+    Times a stage, keeping the fastest of the repeats. This is run in a
+    worker process of its own so the peak memory is only this stage's.
+    @param stage: Name of the stage
+    @param log_dir: The log folder
+    @param repeat: Number of times to run the stage
+    @return: dict of the stage results
+    """
+    stage_function, stage_input, unit, reads_files = prepare_stage(stage,
+                                                                   log_dir)
+    seconds = None
+    for run in range(max(1, repeat)):
+        start = time.perf_counter()
+        count = stage_function(stage_input)
+        elapsed = time.perf_counter() - start
+        if seconds is None or elapsed < seconds:
+            seconds = elapsed
+    result = {'seconds': seconds,
+              'count': count,
+              'unit': unit,
+              'per_sec': count / seconds if seconds else None,
+              'mb_per_sec': None,
+              'peak_rss_mb': peak_rss_mb()}
+    if reads_files and seconds:
+        total_bytes = sum(os.path.getsize(log_file_path)
+                            for log_file_path in find_log_files(log_dir))
+        result['mb_per_sec'] = total_bytes / (1024.0 * 1024.0) / seconds
+    return result
+
+
+def code_version():
+    """
+    @return: The git commit of the code being timed or None
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(
+                                                os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL)\
+                                                    .decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(log_dir, stages=STAGES, repeat=1):
+    """
+    @param log_dir: The log folder
+    @param stages: Names of the stages to time
+    @param repeat: Number of times to run each stage
+    @return: dict of the results, as written to the json file
+    """
+    log_file_paths = find_log_files(log_dir)
+    results = {'version': RESULTS_VERSION,
+               'created': datetime.now().isoformat(),
+               'code_version': code_version(),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'log_dir': os.path.abspath(log_dir),
+               'files': len(log_file_paths),
+               'bytes': sum(os.path.getsize(log_file_path)
+                                        for log_file_path in log_file_paths),
+               'repeat': repeat,
+               'stages': {}}
+    for stage in stages:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results['stages'][stage] = executor.submit(run_stage, stage,
+                                                       log_dir, repeat)\
+                                                                .result()
+    return results
+
+
+def print_results(results, baseline=None, output=sys.stderr):
+    """
+    Prints a table of the results, with how many times the throughput of
+    the baseline each stage has if one is given
+    @param results: dict of results from run_benchmarks
+    @param baseline: Optional dict of earlier results to compare with
+    @param output: The file to print to
+    """
+    print("%d files, %.1f MB, code %s" % (results['files'],
+                                          results['bytes'] / 1048576.0,
+                                          results['code_version']),
+          file=output)
+    for stage, result in sorted(results['stages'].items(),
+                                key=lambda item: STAGES.index(item[0])):
+        line = "%-24s %9.3f s %12.0f %s/s" % (stage, result['seconds'],
+                                              result['per_sec'] or 0,
+                                              result['unit'])
+        if result['mb_per_sec'] is not None:
+            line += " %8.1f MB/s" % result['mb_per_sec']
+        if result['peak_rss_mb'] is not None:
+            line += " %8.1f MB peak" % result['peak_rss_mb']
+        old_result = baseline['stages'].get(stage) if baseline else None
+        if old_result and old_result['per_sec'] and result['per_sec']:
+            line += "  x%.2f" % (result['per_sec'] / old_result['per_sec'])
+        print(line, file=output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the stages of "
+                                                 "cleaning a cozmo log folder")
+    parser.add_argument('log_dir', nargs='?',
+                        help="The log folder to time. Without one a "
+                             "synthetic folder of --size MB is written")
+    parser.add_argument('--size', type=float, default=50,
+                        help="MB of synthetic logs (default %(default)s)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Seed for the synthetic logs "
+                             "(default %(default)s)")
+    parser.add_argument('--stage', action='append', choices=STAGES,
+                        help="Only time this stage, can be repeated")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Times to run each stage, keeping the fastest "
+                             "(default %(default)s)")
+    parser.add_argument('--output',
+                        help="json file to write the results to")
+    parser.add_argument('--compare',
+                        help="json file of earlier results to compare with")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file_pointer:
+            baseline = json.load(file_pointer)
+
+    stages = args.stage or STAGES
+    if args.log_dir:
+        results = run_benchmarks(args.log_dir, stages, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory() as log_dir:
+            write_log_folder(log_dir, int(args.size * 1024 * 1024),
+                             seed=args.seed)
+            results = run_benchmarks(log_dir, stages, args.repeat)
+        results['log_dir'] = None
+        results['synthetic'] = {'size_mb': args.size, 'seed': args.seed}
+
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as file_pointer:
+            json.dump(results, file_pointer, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(results, indent=2, sort_keys=True))
@@ -6,163 +6,101 @@ This program reads the Daslog from cozmo and tries to isolate data of interest f
 This is then output as a file that can then be input into Matlab to perform relevant analysis
 """
 
-import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import groupby
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 import sys
 
 
-from record import DailyData
+from archive import (GZIP_EXTENSION, is_log_archive, iter_archive_logs,
+                     read_log_file)
+from das_reader import BytesDasLogReader, MappedDasLogReader, merge_read_stats
+from dedup import DuplicateFilter
+from event_handlers import EVENT_REGISTRY, GameState
+from follow import DEFAULT_POLL_INTERVAL, LogFollower
+from log_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_CACHE_SIZE, LogCache
+from profiling import Profiler, PROFILE_MODES
+from record import DailyData, SESSION_GAP
+from sessionize import assign_sessions, merge_log_data
+from snapshot import load_snapshot
+from spill import SpillingUsageLog
+from writers import open_writer, OUTPUT_FORMATS, write_usage_log
 
+# Number of corrupt parts of a log file listed by report_damage
+MAX_DAMAGE_REPORT = 10
 
-def read_input_log (log_file_path):
+
+def read_input_log (log_file_path, prefilter=False, read_stats=None, 
+                    lazy=False, event_keys=None):
     """
-    This reads the json log file entries and compiles each line into the
-    log_data list
+    This reads the json log file entries and yields them one at a time
+    from a memory map of the file, so the whole log file is never read
+    into memory. A gzipped log file (.das.gz) is decompressed into memory.
     @param log_file_path: The full path to the log file to be read
-    @ return: List of log lines 
-    """
-    log_data = []
-    file_pointer =  open(log_file_path, 'r')
-    file_data = file_pointer.read()
-    file_pointer.close()
-    raw_data = file_data.split('},{')
-    total_lines = len(raw_data)
-    count = 1
-    error_line = 0
-    for raw_line in raw_data:
-        #print("%s" % raw_line)
-        #print(">>>>>>>>>>>>>>>>>>")
-        if not raw_line.startswith('{'):
-            raw_line = '{' + raw_line
-            
-        if total_lines==count:
-            # remove trailing ',' from last line
-            raw_line = raw_line[:-1]
-        elif raw_line[-1] != '}':
-            raw_line= raw_line + '}'
-        
-        count += 1
-        try:
-            log_data.append(json.loads(raw_line))
-            #print("%s" % log_data[-1])
-            #print("-------------------------")
-        except:
-            # Sacrifice the problematic logline
-            # but record that this line we could not read
-            log_data.append(None)
-            error_line += 1
-    #print("There were %d error lines" % error_line)
-    return log_data
+    @param prefilter: If True log lines carrying none of the tracked event
+                      keys are dropped without being decoded
+    @param read_stats: Optional dict in which the record, error and skipped
+                       counts are added up once the file has been read
+    @param lazy: If True the log lines are LogLineView objects, with only 
+                 the keys analyse_log_data looks at decoded up front
+    @param event_keys: The EventKeys of the log lines to keep, those of
+                       EVENT_REGISTRY if not given
+    @ return: Generator of log lines 
+    """
+    if event_keys is None:
+        event_keys = EVENT_REGISTRY.event_keys()
+    key_filter = event_keys.key_filter(prefilter)
+    lazy_keys = event_keys.lazy_keys(lazy)
+    if log_file_path.endswith(GZIP_EXTENSION):
+        log_reader = BytesDasLogReader(read_log_file(log_file_path), 
+                                       key_filter, lazy_keys)
+        for log_line in log_reader:
+            yield log_line
+    else:
+        with open(log_file_path, 'rb') as file_pointer:
+            log_reader = MappedDasLogReader(file_pointer, key_filter, 
+                                            lazy_keys)
+            for log_line in log_reader:
+                yield log_line
+    #print("There were %d error lines" % log_reader.error_line)
+    if log_reader.damaged:
+        report_damage(log_file_path, log_reader.damaged)
+    if read_stats is not None:
+        merge_read_stats(read_stats, log_reader.stats())
     
-def analyse_log_data(log_data, session_record):
+def analyse_log_data(log_data, session_record, event_log=None, 
+                     registry=EVENT_REGISTRY):
     """
     Analyses the data in each log and puts it in the session data.
-    @param log_data: The lines in the log file as a list
+    @param log_data: The lines in the log file as an iterable
     @param session_record: The play session against which the entries are to be recorded 
+    @param event_log: Optional EventLog to collect every tracked event in
+    @param registry: The EventRegistry of the handlers of each event key
     @return : The updated session_record with updated information from this log file
     """
-    current_game = session_record.current_game_name
-    current_game_id = session_record.current_game_id
-    current_game_result = 0
+    game_state = GameState(session_record.current_game_name,
+                           session_record.current_game_id)
+    handled_keys = registry.handled_keys
+    dispatch = registry.dispatch
+    if event_log is not None:
+        event_log.start_log_data(session_record)
     
     for log_line in log_data:
-        if 'robot.game_unlock_status' in log_line:
-            #print("%s" % log_line['robot.game_unlock_status'].split(','))
-            session_record.update_record_list('games_unlocked',
-                            log_line['robot.game_unlock_status'].strip(',')\
-                                                                .split(','))
-            
-        if 'world.daily_goals' in log_line and '$data' in log_line:
-            # This line has a daily goal motivator
-            session_record.update_record_set('daily_challenge',
-                                                 log_line['$data'].strip(',')\
-                                                                  .strip('_0/1')\
-                                                                  .replace('<b>', '')\
-                                                                  .replace('</b>', ''))
-           
-        if 'robot.spark_unlock_status' in log_line:
-            #print("%s" % log_line['robot.spark_unlock_status'].split(','))
-            session_record.update_record_list('features_unlocked',
-                                log_line['robot.spark_unlock_status'].strip(',')\
-                                                                     .split(','))
-        if "robot.face_enrollment" in log_line:
-            session_record.details['face_enrolled'].append(
-                                                log_line['robot.face_enrollment'])
-            
-        ############################################################
-        # These three together indicate the start of a game
-        if 'game.launch' in log_line:
-            if current_game != None:
-                session_record.abort_game(current_game)
-            current_game = log_line['game.launch']
-            current_game_id = None
-            session_record.create_or_update_game(current_game)
-            
-        if current_game and 'game.start' in log_line:
-            if current_game_id and  current_game_id != log_line['game.start']:
-                # The last game must have been aborted or not accounted for
-                if current_game:
-                    session_record.abort_game(current_game)
-                    current_game = None
-            current_game_id = log_line['game.start']
-            session_record.current_game_id = current_game_id
-                    
-                    
-        if 'game.type' in log_line:
-            if current_game == log_line['game.type']:
-                # expected route. This is a all well sign
-                # so nothing to do
-                pass
-            else:
-                if current_game:
-                    # We don't know what happened to the last game:
-                    session_record['game_record'][current_game].game_abort_count += 1
-                current_game = log_line['game.type']
-                session_record.create_or_update_game(current_game)                           
-            current_game_id = None
-        # These three together indicate the start of a game
-        #################################################################
-                    
-        #################################################################
-        # These two together indicate the end of game
-        if 'game.end' in log_line:
-            session_record.end_game(current_game, current_game_result)
-            current_game = None
-            current_game_id = None
-            current_game_result = 0 
-            
-        if current_game and "game.end.player_rank" in log_line:
-            if log_line["game.end.player_rank"] == "0":
-                # I think this defines cozmo lost
-                current_game_result = -1
-            else:
-                current_game_result = 1
-        # These two together indicate the end of game
-        #################################################################
+        previous_game = game_state.current_game
+        previous_game_result = game_state.current_game_result
         
-        if 'robot.play_animation' in log_line:
-            anim_name = log_line['robot.play_animation']
-            session_record.record_animation(current_game, 
-                                          anim_name)
-            
-            if 'ask' in anim_name or 'request' in anim_name:
-                session_record.add_update_request(anim_name)
-                
-        if 'meta.goal.progressed' in log_line:
-            session_record.add_goal_progress(log_line['meta.goal.progressed'])
-             
-        if "robot.freeplay_goal_started" in log_line:
-            session_record.create_or_update_free_play(
-                                        log_line["robot.freeplay_goal_started"])       
-       
-        if 'robot.vision.face_recognition.re_recognized' in log_line:
-            session_record.update_record_list('face_recognized',
-                        [log_line['robot.vision.face_recognition.re_recognized']])
-            
-        if 'robot.vision.detected_pet' in log_line:
-            if '$data' in  log_line:
-                session_record.add_update_pet(log_line['$data'])
+        # A log line usually carries just the one event
+        event_keys = handled_keys.intersection(log_line)
+        if event_keys:
+            dispatch(event_keys, log_line, session_record, game_state)
+        
+        if event_log is not None:
+            event_log.add_log_line(session_record, log_line, 
+                                   game_state.current_game,
+                                   previous_game, previous_game_result)
                         
             
     return session_record
@@ -180,90 +118,774 @@ def sort_logs_by_time(log_dir):
     sorted_log_files = sorted(file_stats_details)
     return sorted_log_files
         
-def get_usage_details(log_dir):    
+def report_damage(log_file_path, damaged):
+    """
+    Reports the parts of a log file that were skipped as corrupt on stderr
+    @param log_file_path: The full path to the log file
+    @param damaged: List of the (start, end) byte offsets of each part
+    """
+    print("Skipped %d corrupt records (%d bytes) in %s at bytes %s" % 
+                (len(damaged), sum(end - start for start, end in damaged),
+                 log_file_path, 
+                 ", ".join("%d-%d" % (start, end) 
+                                for start, end in damaged[:MAX_DAMAGE_REPORT])
+                    + (", ..." if len(damaged) > MAX_DAMAGE_REPORT else "")),
+          file=sys.stderr)
+
+def extract_log_events(log_file_path, prefilter=False, lazy=False, 
+                       event_keys=None):
+    """
+    Reads a log file and keeps only the log lines carrying events that
+    analyse_log_data looks at. This runs in the worker processes so
+    the result is kept small to send back.
+    @param log_file_path: The full path to the log file to be read
+    @param prefilter: If True skip decoding log lines without tracked keys
+    @param lazy: If True only decode the keys kept in the compacted lines
+    @param event_keys: The EventKeys of the log lines to keep, those of
+                       EVENT_REGISTRY if not given
+    @return: Tuple of the list of compacted log lines and the read counts
+    """
+    if event_keys is None:
+        event_keys = EVENT_REGISTRY.event_keys()
+    read_stats = {}
+    log_events = event_keys.compact_log_data(read_input_log(log_file_path, 
+                                                            prefilter,
+                                                            read_stats, lazy,
+                                                            event_keys))
+    return log_events, read_stats
+
+def extract_log_bytes_events(log_bytes, prefilter=False, log_file_path=None,
+                             event_keys=None, lazy=False):
+    """
+    Keeps only the log lines carrying tracked events from a log file that
+    has already been read into memory
+    @param log_bytes: bytes of the whole log file
+    @param prefilter: If True skip decoding log lines without tracked keys
+    @param log_file_path: Optional path of the log file, to report any
+                          corrupt records against
+    @param event_keys: The EventKeys of the log lines to keep, those of
+                       EVENT_REGISTRY if not given
+    @param lazy: If True only decode the keys kept in the compacted lines
+    @return: Tuple of the list of compacted log lines and the read counts
+    """
+    if event_keys is None:
+        event_keys = EVENT_REGISTRY.event_keys()
+    log_reader = BytesDasLogReader(log_bytes, event_keys.key_filter(prefilter),
+                                   event_keys.lazy_keys(lazy))
+    log_events = event_keys.compact_log_data(log_reader)
+    if log_reader.damaged and log_file_path:
+        report_damage(log_file_path, log_reader.damaged)
+    return log_events, log_reader.stats()
+
+def iter_log_data(log_file_paths, jobs=1, prefilter=False, read_stats=None,
+                  log_cache=None, lazy=False, event_keys=None, 
+                  executor=None):
+    """
+    Yields the log lines of each log file in the given order. With more
+    than one job the files are parsed in worker processes ahead of the
+    caller. With a cache only the files that are new or have changed
+    since the last run are parsed.
+    @param log_file_paths: List of full paths to the log files
+    @param jobs: Number of worker processes to parse the log files in
+    @param prefilter: If True skip decoding log lines without tracked keys
+    @param read_stats: Optional dict in which the read counts are added up
+    @param log_cache: Optional LogCache holding the events of parsed files
+    @param lazy: If True log lines are read as LogLineView objects
+    @param event_keys: The EventKeys of the log lines to keep, those of
+                       EVENT_REGISTRY if not given
+    @param executor: Optional ProcessPoolExecutor kept by the caller to 
+                     parse the log files in with more than one job, 
+                     instead of one started for these files
+    """
+    if event_keys is None:
+        event_keys = EVENT_REGISTRY.event_keys()
+    if jobs <= 1 and log_cache is None:
+        for log_file_path in log_file_paths:
+            yield read_input_log(log_file_path, prefilter, read_stats, lazy,
+                                 event_keys)
+        return
+    
+    parse_log = partial(extract_log_events, prefilter=prefilter, lazy=lazy,
+                        event_keys=event_keys)
+    own_executor = executor is None and jobs > 1
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=jobs)
+    elif jobs <= 1:
+        executor = None
+    try:
+        # Work out up front which files need parsing so the workers can
+        # get going on all of them
+        to_parse = {}
+        for log_file_path in log_file_paths:
+            file_stat = os.stat(log_file_path)
+            if log_cache is None or not log_cache.is_fresh(log_file_path, 
+                                                           file_stat,
+                                                           event_keys.version):
+                to_parse[log_file_path] = (file_stat, executor.submit(parse_log,
+                                                            log_file_path)
+                                                        if executor else None)
+        
+        for log_file_path in log_file_paths:
+            log_events = None
+            if log_file_path not in to_parse:
+                log_events = log_cache.get(log_file_path, 
+                                           os.stat(log_file_path),
+                                           event_keys.version)
+            if log_events is None:
+                file_stat, future = to_parse.pop(log_file_path, 
+                                                 (os.stat(log_file_path), None))
+                if future:
+                    log_events, file_stats = future.result()
+                else:
+                    log_events, file_stats = parse_log(log_file_path)
+                if read_stats is not None:
+                    merge_read_stats(read_stats, file_stats)
+                if log_cache is not None:
+                    log_cache.put(log_file_path, file_stat, log_events,
+                                  event_keys.version)
+            yield log_events
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+def read_profiled_log(profiler, log_file_path, log_file_data, prefilter, 
+                      read_stats, lazy=False, event_keys=None):
+    """
+    Reads the next log file for get_usage_details while profiling. When
+    the files are read here rather than by iter_log_data the disk read
+    and the decoding are timed apart.
+    @param profiler: The Profiler to time the stages in
+    @param log_file_path: The full path to the log file
+    @param log_file_data: The iter_log_data generator or None
+    @param prefilter: If True skip decoding log lines without tracked keys
+    @param read_stats: dict in which the read counts are added up
+    @param lazy: If True log lines are read as LogLineView objects
+    @param event_keys: The EventKeys of the log lines to keep, those of
+                       EVENT_REGISTRY if not given
+    @return: Tuple of the list of log lines and the counts of the file
+    """
+    if event_keys is None:
+        event_keys = EVENT_REGISTRY.event_keys()
+    if log_file_data is None:
+        with profiler.stage('disk'):
+            log_bytes = read_log_file(log_file_path)
+        with profiler.stage('decode'):
+            log_reader = BytesDasLogReader(log_bytes, 
+                                           event_keys.key_filter(prefilter),
+                                           event_keys.lazy_keys(lazy))
+            log_data = list(log_reader)
+        if log_reader.damaged:
+            report_damage(log_file_path, log_reader.damaged)
+        file_stats = log_reader.stats()
+        merge_read_stats(read_stats, file_stats)
+    else:
+        # The counts of the file are what it added to the running total
+        stats_before = dict(read_stats)
+        with profiler.stage('read'):
+            log_data = list(next(log_file_data))
+        file_stats = {name: count - stats_before.get(name, 0) 
+                                    for name, count in read_stats.items()}
+    if os.path.isfile(log_file_path):
+        # A log file read from an archive has no size on disk
+        file_stats['bytes'] = os.path.getsize(log_file_path)
+    return log_data, file_stats
+
+def read_log_archive(archive_path, prefilter=False, event_keys=None):
+    """
+    Parses every log file of an archive in one pass over it, keeping only
+    the log lines carrying tracked events
+    @param archive_path: Path to the archive of a participant folder
+    @param prefilter: If True skip decoding log lines without tracked keys
+    @param event_keys: The EventKeys of the log lines to keep, those of
+                       EVENT_REGISTRY if not given
+    @return: List of (modified time, path, compacted log lines, read counts)
+             of each log file sorted by time
+    """
+    archive_logs = []
+    for fdate, fpath, log_bytes in iter_archive_logs(archive_path):
+        log_events, file_stats = extract_log_bytes_events(log_bytes, 
+                                                          prefilter, fpath,
+                                                          event_keys)
+        archive_logs.append((fdate, fpath, log_events, file_stats))
+    archive_logs.sort(key=lambda archive_log: archive_log[:2])
+    return archive_logs
+
+def iter_archive_log_data(archive_logs, read_stats=None):
+    """
+    Yields the log lines of each log file read from an archive, adding up
+    the read counts of each as it is reached
+    @param archive_logs: List returned by read_log_archive
+    @param read_stats: Optional dict in which the read counts are added up
+    """
+    for fdate, fpath, log_events, file_stats in archive_logs:
+        if read_stats is not None:
+            merge_read_stats(read_stats, file_stats)
+        yield log_events
+
+def check_prefilter(log_dir):
+    """
+    Reads every log file with and without the key prefilter to check that
+    the prefilter does not drop any tracked event
+    @param log_dir: The directory containing all the log files to read
+    @return: dict of read counts over all files with the tracked events
+             found by the full parse and by the prefiltered parse
+    """
+    report = {'tracked_events': 0, 'prefiltered_events': 0}
+    for fdate, fpath in sort_logs_by_time(log_dir):
+        if not os.path.isfile(fpath):
+            continue
+        full_events, full_stats = extract_log_events(fpath)
+        filtered_events, filtered_stats = extract_log_events(fpath, True)
+        merge_read_stats(report, filtered_stats)
+        report['tracked_events'] += len(full_events)
+        report['prefiltered_events'] += len(filtered_events)
+        if full_events != filtered_events:
+            print("Prefilter missed %d events in %s" % (len(full_events) -
+                                                        len(filtered_events),
+                                                        fpath), 
+                  file=sys.stderr)
+    return report
+        
+def get_file_session(usage_log, cur_log_time, last_log_time):
+    """
+    Works out which day and session a log file belongs to from its time,
+    adding a new day or session to the usage log when needed
+    @param usage_log: dict of DailyData by date string
+    @param cur_log_time: datetime of the log file
+    @param last_log_time: datetime of the log file before it, or None
+    @return: The SessionData to record the log file against
+    """
+    date_string = "%s" % cur_log_time.date()
+    
+    # Which date and session does this log file belong to?
+    # We deicde that from the creation date/time of the log file
+    if not date_string in usage_log: 
+        # We have a new date so make a new entry for it and
+        # get a new session setup
+        usage_log[date_string]=DailyData(cur_log_time) 
+        session_record = usage_log[date_string].get_current_session()
+    else:
+        daily_record = usage_log[date_string]
+        time_gap = cur_log_time - last_log_time
+        if time_gap >= SESSION_GAP:
+            # This is a new session because 15min passed without interaction  
+            # so there is no time gap between logs. 
+            session_record = daily_record.get_new_session(cur_log_time)
+        else:
+            
+            session_record = daily_record.get_current_session()
+            session_record.add_time(time_gap)
+    return session_record
+
+def get_usage_details(log_dir, jobs=1, prefilter=True, read_stats=None,
+                      log_cache=None, event_log=None, profiler=None, 
+                      lazy=False, snapshot=None, dedup=None, 
+                      registry=EVENT_REGISTRY, usage_log=None, 
+                      executor=None):    
     """
     This sorts the log and groups interesting occurance by days and interaction sessions 
     within the days.
     @param log_dir: The directory containing all the log files to read
+    @param jobs: Number of worker processes to parse the log files in.
+                 Sessions are still put together in order in this process
+    @param prefilter: If True log lines without a tracked event key are 
+                      dropped before json decoding
+    @param read_stats: Optional dict in which the record, error and skipped
+                       counts of all the log files are added up
+    @param log_cache: Optional LogCache so only new or changed log files
+                      are parsed
+    @param event_log: Optional EventLog to collect every tracked event in
+    @param profiler: Optional Profiler to time the reading and analysis of
+                     each log file in and to count what each file holds
+    @param lazy: If True log lines are read as LogLineView objects, which
+                 only decode the keys that are looked at
+    @param snapshot: Optional UsageSnapshot to carry on from, so only the
+                     log files added since it was saved are read. It is
+                     updated with the log files read
+    @param dedup: Optional DuplicateFilter dropping the log lines already
+                  read from another log file
+    @param registry: The EventRegistry of the handlers of each event key.
+                     The log lines carrying any key it has a handler for 
+                     are read
+    @param usage_log: Optional mapping to put the DailyData of each day
+                      in, such as a SpillingUsageLog, a dict if not given
+    @param executor: Optional ProcessPoolExecutor kept by the caller to
+                     parse the log files in with more than one job
+    The log directory can also be an archive of it, which is read in one
+    pass whatever the jobs, log cache and lazy options
      
     """
-    usage_log = {}
-    daily_record = None
+    if usage_log is None:
+        usage_log = {}
+    event_keys = registry.event_keys()
     last_log_time = None
-    session_record = None
-    #sort log files by time of creation
-    sorted_log_file_path = sort_logs_by_time(log_dir)
+    if profiler is not None and read_stats is None:
+        read_stats = {}
+    if is_log_archive(log_dir):
+        read_archive = read_log_archive
+        if profiler is not None:
+            read_archive = profiler.timed('read', read_log_archive)
+        archive_logs = read_archive(log_dir, prefilter, event_keys)
+        sorted_log_file_path = [(fdate, fpath) for fdate, fpath, log_events, 
+                                                file_stats in archive_logs]
+        log_file_data = iter_archive_log_data(archive_logs, read_stats)
+    else:
+        #sort log files by time of creation
+        # Don't want to get into directories
+        sort_logs = sort_logs_by_time
+        if profiler is not None:
+            sort_logs = profiler.timed('scan', sort_logs_by_time)
+        sorted_log_file_path = [(fdate, fpath) for fdate, fpath in 
+                                                sort_logs(log_dir)
+                                                    if os.path.isfile(fpath)]
+        log_file_data = None
+    if snapshot is not None:
+        sorted_log_file_path = snapshot.new_log_files(sorted_log_file_path)
+        usage_log = snapshot.usage_log
+        last_log_time = snapshot.last_log_time
+    if log_file_data is None and (profiler is None or jobs > 1 or 
+                                  log_cache is not None):
+        log_file_data = iter_log_data([fpath for fdate, fpath in 
+                                                sorted_log_file_path], 
+                                      jobs, prefilter, read_stats, log_cache,
+                                      lazy, event_keys, executor)
     
     #For each log file in directory
     for fdate, fpath in sorted_log_file_path:
-        if not os.path.isfile(fpath):
-            # Don't want to get into directories
-            continue
         #print("%s" % fpath)
         cur_log_time = datetime.utcfromtimestamp(fdate)
-        date_string = "%s" % cur_log_time.date()
-        
-        # Which date and session does this log file belong to?
-        # We deicde that from the creation date/time of the log file
-        if not date_string in usage_log: 
-            # We have a new date so make a new entry for it and
-            # get a new session setup
-            usage_log[date_string]=DailyData(cur_log_time) 
-            del daily_record
-            del session_record
-            daily_record = usage_log[date_string]
-            session_record = daily_record.get_current_session()
-        else:
-            daily_record = usage_log[date_string]
-            time_gap = cur_log_time - last_log_time
-            if time_gap.seconds >= 15*60:
-                # This is a new session because 15min passed without interaction  
-                # so there is no time gap between logs. 
-                session_record = daily_record.get_new_session(cur_log_time)
-            else:
-                
-                session_record = daily_record.get_current_session()
-                session_record.add_time(time_gap)
-                
-        last_log_time = cur_log_time
+        if snapshot is not None:
+            snapshot.add_log_file(fpath, last_log_time)
         try:
             # Read the log file
-            log_data = read_input_log(fpath)
+            if profiler is not None:
+                log_data, file_stats = read_profiled_log(profiler, fpath, 
+                                                         log_file_data, 
+                                                         prefilter, read_stats,
+                                                         lazy, event_keys)
+            else:
+                log_data = next(log_file_data)
+            if dedup is not None:
+                duplicate_count = dedup.duplicate_count
+                log_data = list(dedup.filter(log_data, fpath))
+                if not log_data and dedup.duplicate_count > duplicate_count:
+                    # A copy of log files already read is no session
+                    continue
+            
+            session_record = get_file_session(usage_log, cur_log_time, 
+                                              last_log_time)
+            last_log_time = cur_log_time
+            if profiler is not None:
+                with profiler.stage('analyse'):
+                    analyse_log_data(log_data, session_record, event_log,
+                                     registry)
+                profiler.add_file(fpath, file_stats, 
+                                  event_keys.count_tracked_keys(log_data))
+                continue
             
             # Analyse the data found in the log file and put it in the session records
-            analyse_log_data(log_data, session_record)
+            analyse_log_data(log_data, session_record, event_log, registry)
         except:
             # If a file is creating problem then tell us what it is
-            print("Issue in %s" % fpath)
+            print("Issue in %s" % fpath, file=sys.stderr)
             raise
+    if snapshot is not None:
+        snapshot.last_log_time = last_log_time
     return usage_log
     
 
+def get_usage_details_by_timestamp(log_dir, jobs=1, prefilter=True, 
+                                   read_stats=None, log_cache=None,
+                                   event_log=None, lazy=False, dedup=None,
+                                   registry=EVENT_REGISTRY, usage_log=None,
+                                   executor=None):
+    """
+    This groups the interesting occurances in the logs by days and 
+    interaction sessions using the time each log line was written, so
+    copied log folders give the same result and play time is the time
+    between the first and last event of each session. Only the log lines
+    carrying tracked events are timed, so the result is the same whether 
+    or not they were prefiltered or cached.
+    The parameters are the same as for get_usage_details
+    @param log_dir: The directory containing all the log files to read, 
+                    or an archive of it
+    @return: dict of DailyData by date string
+    """
+    event_keys = registry.event_keys()
+    if is_log_archive(log_dir):
+        archive_logs = read_log_archive(log_dir, prefilter, event_keys)
+        log_file_paths = [fpath for fdate, fpath, log_events, file_stats
+                                                        in archive_logs]
+        log_file_data = iter_archive_log_data(archive_logs, read_stats)
+    else:
+        log_file_paths = [fpath for fdate, fpath in 
+                                            sort_logs_by_time(log_dir)
+                                                if os.path.isfile(fpath)]
+        log_file_data = iter_log_data(log_file_paths, jobs, prefilter, 
+                                      read_stats, log_cache, lazy, event_keys,
+                                      executor)
+    log_data_streams = [event_keys.iter_compact_log_data(log_data) 
+                                        for log_data in log_file_data]
+    if dedup is not None:
+        # Each log file is filtered in whole, in file time order, before
+        # the merge reads the files side by side
+        log_data_streams = [list(dedup.filter(log_data, fpath)) 
+                                for fpath, log_data in zip(log_file_paths, 
+                                                           log_data_streams)]
+    return analyse_by_timestamp(log_data_streams, event_log, registry, 
+                                usage_log)
+
+def analyse_by_timestamp(log_data_streams, event_log=None, 
+                         registry=EVENT_REGISTRY, usage_log=None):
+    """
+    Merges the log lines of several log files by the time they were
+    written and analyses them into the sessions of each day
+    @param log_data_streams: iterables of the compacted log lines of each
+                             log file, each in the order it was written
+    @param event_log: Optional EventLog to collect every tracked event in
+    @param registry: The EventRegistry of the handlers of each event key
+    @param usage_log: Optional mapping to put the DailyData of each day
+                      in, a dict if not given
+    @return: dict of DailyData by date string
+    """
+    if usage_log is None:
+        usage_log = {}
+    session_log_lines = assign_sessions(merge_log_data(log_data_streams),
+                                        usage_log)
+    for session_record, log_lines in groupby(session_log_lines, 
+                                             key=lambda pair: pair[0]):
+        analyse_log_data((log_line for session, log_line in log_lines),
+                         session_record, event_log, registry)
+    return usage_log
+
+def print_session_update(daily_record):
+    """
+    Prints a one line summary of the current session of a day
+    @param daily_record: DailyData of the day
+    """
+    session_record = daily_record.get_current_session()
+    print("%s %s Session %d : played %s, games %d, animations %d "
+          "(positive %d, negative %d), current game %s" % 
+                (daily_record.record_date,
+                 session_record.session_time,
+                 daily_record.current_session_id + 1,
+                 session_record.play_time,
+                 sum(game_details.start_count for game_details in 
+                                        session_record.game_record.values()),
+                 sum(session_record.animations_played.values()) +
+                    sum(sum(game_details.game_animations.values()) 
+                            for game_details in 
+                                    session_record.game_record.values()),
+                 session_record.positive_animations,
+                 session_record.negative_animations,
+                 session_record.current_game_name))
+    sys.stdout.flush()
+
+def follow_usage_details(log_dir, usage_log, 
+                         poll_interval=DEFAULT_POLL_INTERVAL, prefilter=True):
+    """
+    Follows a log folder while the app is writing to it. The events are 
+    grouped into days and sessions by their time as they arrive, and a 
+    line on the current session is printed whenever it changes. The game
+    being played carries over when the in progress log file is closed 
+    and the next one started. This runs until interrupted.
+    @param log_dir: The log folder to follow
+    @param usage_log: dict of DailyData by date string, updated in place
+    @param poll_interval: Seconds to wait when there is no new data
+    @param prefilter: If True skip decoding log lines without tracked keys
+                      in the closed log files
+    """
+    def on_idle(updated):
+        if updated and usage_log:
+            print_session_update(usage_log[max(usage_log)])
+    
+    event_keys = EVENT_REGISTRY.event_keys()
+    log_follower = LogFollower(log_dir, poll_interval, 
+                               event_keys.key_filter(prefilter), on_idle)
+    session_log_lines = assign_sessions(event_keys.iter_compact_log_data(
+                                            log_follower.iter_log_lines()),
+                                        usage_log)
+    for session_record, log_lines in groupby(session_log_lines, 
+                                             key=lambda pair: pair[0]):
+        analyse_log_data((log_line for session, log_line in log_lines),
+                         session_record)
+
+def write_usage_report(usage_log, output_format='text', output_path=None):
+    """
+    Writes the usage of each day in date order
+    @param usage_log: dict of DailyData by date string
+    @param output_format: One of writers.OUTPUT_FORMATS
+    @param output_path: File or, for csv, folder to write to. The text
+                        and jsonl formats go to stdout if not given
+    """
+    writer = open_writer(output_format, output_path)
+    try:
+        write_usage_log(usage_log, writer)
+    finally:
+        writer.close()
+
+def print_usage_log(usage_log):
+    """
+    Prints the usage of each day in date order
+    @param usage_log: dict of DailyData by date string
+    """
+    write_usage_report(usage_log)
+
+def add_parse_arguments(parser):
+    """
+    Adds the command line options on how log files are parsed, cached 
+    and grouped into sessions
+    @param parser: argparse.ArgumentParser to add the options to
+    """
+    parser.add_argument('--by-timestamp', action='store_true',
+                        help="Group sessions by the time each log line was "
+                             "written instead of the log file times")
+    parser.add_argument('--no-prefilter', dest='prefilter', 
+                        action='store_false',
+                        help="Decode every log line instead of skipping the "
+                             "ones without a tracked event key")
+    parser.add_argument('--lazy-records', action='store_true',
+                        help="Only decode the keys of each log line that "
+                             "are looked at, sharing the envelope values. "
+                             "Uses about half the memory for log lines but "
+                             "is slower")
+    parser.add_argument('--dedup', action='store_true',
+                        help="Drop the log lines of an app run ($apprun, "
+                             "$seq) already read from another log file, "
+                             "reporting the overlaps on stderr")
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help="Parse every log file instead of reusing the "
+                             "events cached by earlier runs")
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help="Parse every log file and replace its cached "
+                             "events")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help="Directory to keep the parsed log cache in "
+                             "(default %(default)s)")
+    parser.add_argument('--cache-size', type=int, 
+                        default=DEFAULT_MAX_CACHE_SIZE // (1024 * 1024),
+                        help="Size cap of the parsed log cache in MB, least "
+                             "recently used entries are evicted "
+                             "(default %(default)s)")
+
+def cache_settings(args):
+    """
+    @param args: Parsed command line options added by add_parse_arguments
+    @return: Tuple of the LogCache arguments or None if caching is off
+    """
+    if not args.cache:
+        return None
+    return (args.cache_dir, args.cache_size * 1024 * 1024, args.rebuild_cache)
+    
+
 if __name__ == "__main__":
+    # Imported here so the modules using this one as a library do not
+    # load numpy
+    from export import EventLog, EXPORT_AVAILABLE, export_events
+    from rollup import build_rollup, ROLLUP_AVAILABLE, save_rollup
+    
     usage_log=None
     
-    if len(sys.argv) < 2:
+    parser = argparse.ArgumentParser(description="Groups cozmo logs into "
+                                                 "usage sessions")
+    parser.add_argument('log_dir', nargs='?', 
+                        help="Path to the cozmo log folder, or to a .tar.gz, "
+                             ".tar.xz, .tar.zst or .zip archive of it")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="Number of worker processes to parse the log "
+                             "files in (default 1)")
+    parser.add_argument('--check-prefilter', action='store_true',
+                        help="Compare the prefilter against a full parse of "
+                             "the log files and report the counts on stderr")
+    parser.add_argument('--follow', action='store_true',
+                        help="Keep following the log folder as it is "
+                             "written, printing a line on the current "
+                             "session after each update. Sessions are "
+                             "grouped by log line times")
+    parser.add_argument('--poll-interval', type=float, 
+                        default=DEFAULT_POLL_INTERVAL,
+                        help="Seconds between looking for new log data "
+                             "with --follow (default %(default)s)")
+    parser.add_argument('--export', 
+                        help="Also write the events, sessions and games as "
+                             "numpy columns to this .npz file or folder")
+    parser.add_argument('--rollup',
+                        help="Also write the animations by sentiment, game "
+                             "starts and results and face recognitions per "
+                             "minute, 15 minutes, hour and day to this .npz "
+                             "file, for rollup.py to query")
+    parser.add_argument('--async-io', action='store_true',
+                        help="Read and parse the log files through an "
+                             "asyncio pipeline while earlier ones are "
+                             "analysed, for logs on slow network storage")
+    parser.add_argument('--io-workers', type=int, default=4,
+                        help="Number of log files read at the same time "
+                             "with --async-io (default %(default)s)")
+    parser.add_argument('--profile', action='store_true',
+                        help="Time the stages of the run and count what "
+                             "each log file holds, printing a json summary "
+                             "on stderr")
+    parser.add_argument('--profile-output',
+                        help="Also dump a profile of the run to this file "
+                             "(implies --profile)")
+    parser.add_argument('--profile-mode', choices=PROFILE_MODES, 
+                        default='cprofile',
+                        help="cprofile writes pstats, sample writes "
+                             "collapsed stacks for flame graphs "
+                             "(default %(default)s)")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='text',
+                        help="text is the printed report, jsonl a json "
+                             "object per session and csv tables of the "
+                             "sessions, games, freeplay and animations "
+                             "(default %(default)s)")
+    parser.add_argument('--snapshot',
+                        help="Carry on from the usage log saved in this "
+                             "file by an earlier run, only reading the log "
+                             "files added since, and save it again")
+    parser.add_argument('--max-memory', type=int, metavar='MB',
+                        help="Spill the finished days to a temporary file "
+                             "while the process is over this many MB, and "
+                             "report the peak memory on stderr")
+    parser.add_argument('--output',
+                        help="File to write the report to instead of "
+                             "stdout, or the folder for the csv tables")
+    add_parse_arguments(parser)
+    args = parser.parse_args()
+    if args.export and not EXPORT_AVAILABLE:
+        parser.error("numpy is needed for --export")
+    if args.rollup and not ROLLUP_AVAILABLE:
+        parser.error("numpy is needed for --rollup")
+    if args.format == 'csv' and not args.output:
+        parser.error("--format csv needs an --output folder")
+    if args.snapshot and not args.log_dir:
+        parser.error("--snapshot needs the log folder")
+    if args.snapshot and (args.by_timestamp or args.async_io or args.export 
+                          or args.rollup or args.follow):
+        parser.error("--snapshot only works with log file times, without "
+                     "--by-timestamp, --async-io, --export, --rollup or "
+                     "--follow")
+    if args.max_memory and (args.snapshot or args.export or args.rollup or 
+                            args.follow):
+        parser.error("--max-memory cannot be used with --snapshot, --export, "
+                     "--rollup or --follow, which keep every day or event "
+                     "in memory")
+    if args.log_dir and is_log_archive(args.log_dir) and (args.snapshot or 
+                        args.async_io or args.follow or args.check_prefilter):
+        parser.error("An archive cannot be read with --snapshot, --async-io, "
+                     "--follow or --check-prefilter")
+    if args.by_timestamp and args.async_io:
+        parser.error("--by-timestamp cannot be used with --async-io, which "
+                     "groups sessions by the log file times")
+    if args.lazy_records and args.async_io:
+        parser.error("--lazy-records cannot be used with --async-io, which "
+                     "parses the log files in other processes")
+    
+    if args.check_prefilter and args.log_dir:
+        for name, count in sorted(check_prefilter(args.log_dir).items()):
+            print("%-20s : %d" % (name, count), file=sys.stderr)
+        sys.exit(0)
+    
+    if args.follow and args.log_dir:
+        usage_log = {}
+        try:
+            follow_usage_details(args.log_dir, usage_log, args.poll_interval,
+                                 args.prefilter)
+        except KeyboardInterrupt:
+            pass
+        print_usage_log(usage_log)
+        sys.exit(0)
+    
+    log_cache = None
+    if args.cache:
+        log_cache = LogCache(*cache_settings(args))
+    usage_details = get_usage_details
+    if args.by_timestamp:
+        usage_details = get_usage_details_by_timestamp
+    elif args.async_io:
+        # Imported here as the pipeline is built on this module
+        from async_pipeline import get_usage_details_async
+        usage_details = partial(get_usage_details_async, 
+                                io_workers=args.io_workers)
+    if args.lazy_records:
+        usage_details = partial(usage_details, lazy=True)
+    event_log = EventLog() if args.export or args.rollup else None
+    snapshot = None
+    if args.snapshot:
+        snapshot = load_snapshot(args.snapshot, args.log_dir, args.dedup)
+        usage_details = partial(usage_details, snapshot=snapshot)
+    dedup = None
+    if args.dedup:
+        dedup = DuplicateFilter()
+        if snapshot is not None:
+            dedup = snapshot.duplicate_filter
+        usage_details = partial(usage_details, dedup=dedup)
+    spilling_usage_log = None
+    if args.max_memory:
+        spilling_usage_log = SpillingUsageLog(args.max_memory * 1048576)
+        usage_details = partial(usage_details, usage_log=spilling_usage_log)
+    
+    print_report = partial(write_usage_report, output_format=args.format,
+                           output_path=args.output)
+    profiler = None
+    if args.profile or args.profile_output:
+        try:
+            profiler = Profiler(args.profile_output, args.profile_mode)
+        except ValueError as error:
+            parser.error(str(error))
+        if not (args.by_timestamp or args.async_io):
+            usage_details = partial(usage_details, profiler=profiler)
+        usage_details = profiler.timed('usage_details', usage_details)
+        print_report = profiler.timed('print', print_report)
+        profiler.start()
+    
+    if not args.log_dir:
         try:
            
             #CHANGE THIS DIRECTORY
-            usage_log = get_usage_details("C:/Users/Laptop/Documents/CozmoLogs")
+            usage_log = usage_details("C:/Users/Laptop/Documents/CozmoLogs",
+                                      args.jobs, args.prefilter,
+                                      log_cache=log_cache, event_log=event_log)
             
         except:
             print("Check that you have provided the log directory correctly in code")
     else:
         # Or provide log directory at commandline
-        log_dir = sys.argv[1]
+        log_dir = args.log_dir
         try:
             # Clean the data from the log directory collating usage into sessions
             #CHANGE THIS DIRECTORY
-            usage_log = get_usage_details(log_dir)
+            usage_log = usage_details(log_dir, args.jobs, args.prefilter,
+                                      log_cache=log_cache, event_log=event_log)
         except:
             print("Incorrect log directory : %s " % log_dir)
     
+    if log_cache:
+        log_cache.close()
+    
+    if dedup is not None:
+        dedup.write_report()
+    
+    if usage_log and snapshot is not None:
+        if snapshot.rebuilt:
+            print("The snapshot %s did not match the log folder so the "
+                  "usage log was built again" % args.snapshot, 
+                  file=sys.stderr)
+        snapshot.save(args.snapshot)
+    
     if usage_log:
-        for day, usage in sorted(usage_log.items()):
-            print("################################################################")
-            usage_log[day].formatted_print()
+        print_report(usage_log)
+        if args.export:
+            export_events(args.export, usage_log, event_log)
+        if args.rollup:
+            save_rollup(args.rollup, build_rollup(event_log))
+    
+    if spilling_usage_log is not None:
+        spilling_usage_log.close()
+        spilling_usage_log.write_report()
+    
+    if profiler is not None:
+        profiler.stop()
+        profiler.write_summary()
         
 
 				
\ No newline at end of file
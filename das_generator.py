@@ -0,0 +1,324 @@
+"""
+This file writes synthetic cozmo das log folders for benchmarking.
+
+The records have the shape of the ones in real logs: the same envelope keys
+($app, $apprun, $seq, $ts, ...), telemetry the analysis does not use, and
+app runs made of unlock statuses, daily goals, freeplay with animation
+storms, and games that are launched, started, played and ended. The log
+files are given the modification time of their last record, so the usage
+sessions come out as they would from a real folder.
+"""
+import argparse
+from datetime import datetime
+import json
+import os
+import random
+import uuid
+
+# Size of each log file written, like the app does
+DEFAULT_FILE_SIZE = 100 * 1024
+
+DEFAULT_START_TIME = datetime(2017, 6, 26, 9, 0)
+
+APP_VERSION = "1.5.0.353.170501.1700.p.5062a7c"
+PHONE = "Android OS-Lenovo TB3-710F-5.0.1-Lenovo_TB3-710F_S000026"
+
+# game name : (animation names played during the game, daily goal)
+GAMES = {'speedtap': (('anim_speedtap_idle_01', 'anim_speedtap_idle_02',
+                       'anim_speedtap_lookatplayer', 'anim_speedtap_tap_01',
+                       'anim_speedtap_tap_02', 'anim_speedtap_fakeout_01',
+                       'anim_speedtap_winhand_01', 'anim_speedtap_losehand_01',
+                       'anim_speedtap_winround_intensity01_01',
+                       'anim_speedtap_playerno_01'),
+                      'dailyGoal.title.PlaySpeedTap.Level1'),
+         'cubepounce': (('anim_keepaway_getready_03', 'anim_keepaway_pounce_04',
+                         'anim_keepaway_wingame_01', 'anim_keepaway_losegame_02',
+                         'anim_keepaway_frustrated_01'),
+                        'dailyGoal.title.PlayKeepaway'),
+         'memorymatch': (('anim_memorymatch_pointcenter_01',
+                          'anim_memorymatch_solo_successgame_01',
+                          'anim_memorymatch_failhand_player_02',
+                          'anim_memorymatch_reacttopattern_01'),
+                         'dailyGoal.title.PlayMemoryMatch'),
+         'faceenrollmenttest': (('anim_meetcozmo_lookface_02',
+                                 'anim_meetcozmo_celebration',
+                                 'anim_reacttoface_reenrollment_01'),
+                                'dailyGoal.title.MeetCozmo')}
+
+FREEPLAY_GOALS = ('FP_Socialize', 'FP_PlayAlone', 'FP_Hiking',
+                  'FP_PlayWithHumans', 'FP_NothingToDo')
+
+FREEPLAY_ANIMATIONS = ('anim_hiking_driving_start_02', 'anim_hiking_getin_01',
+                       'anim_hiking_driving_loop_01', 'anim_pause_idle_02',
+                       'anim_reacttoface_unidentified_03_head_angle_40',
+                       'anim_reacttoface_identified_01', 'anim_bored_01',
+                       'anim_reacttocube_happy_01', 'anim_gotosleep_getin_01',
+                       'anim_dizzy_reaction_hard_01', 'anim_hiccup_01',
+                       'anim_hiccup_cure_01', 'anim_petdetection_misc_01',
+                       'anim_rtpmemorymatch_request_01', 'anim_sparking_idea_01')
+
+GAMES_UNLOCKED = ('MeetCozmoGame', 'QuickTapGame', 'KeepawayGame',
+                  'MemoryMatchGame', 'DroneModeGame', 'CozmoSaysGame')
+
+FEATURES_UNLOCKED = ('PickupCube', 'RollCube', 'StackTwoCubes',
+                     'KnockOverThreeCubeStack', 'PounceOnMotionAction',
+                     'PopAWheelieAction', 'Workout', 'FistBump', 'PeekABoo',
+                     'BuildPyramid')
+
+DAILY_GOALS = ('Play with Cozmo for 30 minutes_0/30',
+               'Use the <b>Cozmo Says</b> App_0/1',
+               'Spark the <b>Stack Cubes</b> Upgrade_0/1',
+               'Win a game of <b>Quick Tap</b> with better than 50% Accuracy_0/1')
+
+# Telemetry key : possible values. None of these are analysed.
+TELEMETRY = {'robot.behavior_transition': ('LookAround,Hiking',
+                                           'Hiking,InteractWithFaces',
+                                           'NoneBehavior,LookAround'),
+             'AnimationStreamer.SetStreamingAnimation.Aborting':
+                 ('(tc1191) : Animation NULL is interrupting animation '
+                  'anim_meetcozmo_lookface_02',),
+             'ui.button': ('play_button', 'back_button', 'settings_button'),
+             'ui.slide.enter': ('SparksSlide', 'GamesSlide'),
+             'robot.mood_values': ('Happy:0.4,Confident:0.2,Social:0.7',),
+             'RobotFirmware.PathFollower.PathComplete': ('0', '1'),
+             'robot.vision.dropped_frame_overall_count': ('3', '12', '40'),
+             'robot.accessory_connection': ('1,0xc0ae5b,connected',),
+             'robot.freeplay_goal_ended': ('FP_Socialize', 'FP_Hiking'),
+             'meta.inventory.balance': ('sparks,12', 'sparks,31')}
+
+TELEMETRY_KEYS = tuple(sorted(TELEMETRY))
+
+
+class DasLogGenerator:
+    """
+    Makes the records of a run of cozmo app use, one app run after
+    another, as the text written to the log files
+    """
+    def __init__(self, seed=0, start_time=DEFAULT_START_TIME):
+        """
+        @param seed: Seed for the random choices, so the same logs are made
+        @param start_time: datetime of the first record
+        """
+        self.random = random.Random(seed)
+        self.ts = int((start_time - datetime(1970, 1, 1)).total_seconds()
+                                                                    * 1000)
+        self.seq = 0
+        self.unit = self._uuid()
+        self.app_run = None
+        self.game = None
+        self._games_unlocked = 2
+        self._features_unlocked = 1
+
+    def _uuid(self):
+        return str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+
+    def _record(self, key, value, data=None):
+        """
+        @param key: The event key of the record
+        @param value: The string value of the event key
+        @param data: Optional string for the $data key
+        @return: The json text of the record, with sorted keys as the app
+                 writes them
+        """
+        self.seq += 1
+        self.ts += self.random.randint(5, 400)
+        record = {'$app': APP_VERSION,
+                  '$apprun': self.app_run,
+                  '$group': '0xbeef000004c0ae5b',
+                  '$level': 'event',
+                  '$messv': '2',
+                  '$phone': PHONE,
+                  '$phys': '0xbeef000000040880ae92',
+                  '$platform': 'android',
+                  '$product': 'cozmo',
+                  '$seq': str(self.seq),
+                  '$ts': str(self.ts),
+                  '$unit': self.unit,
+                  key: value}
+        if data is not None:
+            record['$data'] = data
+        if self.game is not None:
+            record['$game'] = self.game
+        return json.dumps(record, sort_keys=True, separators=(',', ':'))
+
+    def _telemetry(self, count):
+        choice = self.random.choice
+        for index in range(count):
+            key = choice(TELEMETRY_KEYS)
+            yield self._record(key, choice(TELEMETRY[key]))
+
+    def _animations(self, anim_names, count):
+        """
+        A storm of animations, each usually after a little telemetry
+        """
+        choice = self.random.choice
+        for index in range(count):
+            anim_name = choice(anim_names)
+            yield self._record('robot.play_animation', anim_name,
+                               'Event:ag_%s' % anim_name[5:])
+            for record in self._telemetry(self.random.randint(0, 3)):
+                yield record
+
+    def _app_start(self):
+        self.app_run = self._uuid()
+        self.seq = 0
+        self.game = None
+        day = datetime.utcfromtimestamp(self.ts / 1000.0).date()
+        for record in self._telemetry(self.random.randint(5, 20)):
+            yield record
+        for goal in self.random.sample(DAILY_GOALS, 3):
+            yield self._record('world.daily_goals', str(day), goal)
+        self._games_unlocked = min(len(GAMES_UNLOCKED),
+                                   self._games_unlocked +
+                                        self.random.randint(0, 1))
+        self._features_unlocked = min(len(FEATURES_UNLOCKED),
+                                      self._features_unlocked +
+                                        self.random.randint(0, 2))
+        yield self._record('robot.game_unlock_status',
+                           ','.join(GAMES_UNLOCKED[:self._games_unlocked]) + ',')
+        yield self._record('robot.spark_unlock_status',
+                           ','.join(FEATURES_UNLOCKED[:self._features_unlocked])
+                                                                        + ',')
+
+    def _freeplay(self):
+        yield self._record('robot.freeplay_goal_started',
+                           self.random.choice(FREEPLAY_GOALS))
+        for record in self._animations(FREEPLAY_ANIMATIONS,
+                                       self.random.randint(5, 60)):
+            yield record
+        if self.random.random() < 0.1:
+            yield self._record('robot.vision.face_recognition.re_recognized',
+                               '2', '1')
+        if self.random.random() < 0.05:
+            yield self._record('robot.vision.detected_pet', '1',
+                               self.random.choice(('Cat', 'Dog')))
+
+    def _game(self):
+        game_name = self.random.choice(sorted(GAMES))
+        anim_names, goal = GAMES[game_name]
+        yield self._record('game.launch', game_name)
+        self.game = self._uuid()
+        yield self._record('game.start', self.game)
+        yield self._record('game.type', game_name)
+        if game_name == 'faceenrollmenttest':
+            yield self._record('robot.face_enrollment', '2', 'Success')
+        for record in self._animations(anim_names,
+                                       self.random.randint(20, 300)):
+            yield record
+        if self.random.random() < 0.1:
+            # Games are sometimes left without an end
+            self.game = None
+            return
+        yield self._record('game.end.player_rank',
+                           self.random.choice(('0', '1')))
+        yield self._record('game.end', '%.4f' % self.random.uniform(30, 300))
+        yield self._record('meta.goal.progressed', goal, '1')
+        self.game = None
+
+    def _app_run(self):
+        for record in self._app_start():
+            yield record
+        for activity in range(self.random.randint(3, 15)):
+            if self.random.random() < 0.4:
+                activity_records = self._game()
+            else:
+                activity_records = self._freeplay()
+            for record in activity_records:
+                yield record
+
+    def iter_records(self):
+        """
+        Yields the json text of records for ever. App runs are separated
+        by short breaks, by breaks long enough to start a new session
+        and now and then by a night
+        """
+        while True:
+            for record in self._app_run():
+                yield record
+            gap = self.random.random()
+            if gap < 0.6:
+                self.ts += self.random.randint(10, 300) * 1000
+            elif gap < 0.9:
+                self.ts += self.random.randint(20, 180) * 60 * 1000
+            else:
+                self.ts += self.random.randint(12, 20) * 60 * 60 * 1000
+
+
+def write_globals(log_dir, generator):
+    """
+    Writes the thisRun and lastRun globals files of the log folder, with
+    the time of the last record as their modified time so they do not add
+    a day of their own to the usage log
+    @param log_dir: The log folder
+    @param generator: The DasLogGenerator the logs were made by
+    """
+    run_globals = {'$app': APP_VERSION,
+                   '$apprun': generator.app_run,
+                   '$group': '0xbeef000004c0ae5b',
+                   '$messv': '2',
+                   '$phone': PHONE,
+                   '$phys': '0xbeef000000040880ae92',
+                   '$platform': 'android',
+                   '$product': 'cozmo',
+                   '$unit': generator.unit}
+    log_time = generator.ts / 1000.0
+    for file_name in ('thisRun.dasGlobals', 'lastRun.dasGlobals'):
+        globals_path = os.path.join(log_dir, file_name)
+        with open(globals_path, 'w') as file_pointer:
+            json.dump(run_globals, file_pointer, indent=3, sort_keys=True,
+                      separators=(',', ' : '))
+        os.utime(globals_path, (log_time, log_time))
+
+
+def write_log_folder(log_dir, total_size, file_size=DEFAULT_FILE_SIZE,
+                     seed=0, start_time=DEFAULT_START_TIME):
+    """
+    Writes a synthetic log folder of numbered .das files
+    @param log_dir: The folder to write, made if it does not exist
+    @param total_size: Number of bytes of log files to write
+    @param file_size: Number of bytes in each log file
+    @param seed: Seed for the random choices
+    @param start_time: datetime of the first record
+    @return: dict of the number of files, bytes and records written
+    """
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+    generator = DasLogGenerator(seed, start_time)
+    records = generator.iter_records()
+    written = {'files': 0, 'bytes': 0, 'records': 0}
+    while written['bytes'] < total_size:
+        written['files'] += 1
+        log_file_path = os.path.join(log_dir, '%02d.das' % written['files'])
+        file_bytes = 0
+        with open(log_file_path, 'w', encoding='utf-8') as file_pointer:
+            while file_bytes < file_size and \
+                            written['bytes'] + file_bytes < total_size:
+                record = next(records) + ','
+                file_pointer.write(record)
+                file_bytes += len(record)
+                written['records'] += 1
+        written['bytes'] += file_bytes
+        # The file was last written when its last record was logged
+        log_time = generator.ts / 1000.0
+        os.utime(log_file_path, (log_time, log_time))
+    write_globals(log_dir, generator)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes a synthetic cozmo "
+                                                 "log folder for benchmarks")
+    parser.add_argument('log_dir', help="The log folder to write")
+    parser.add_argument('--size', type=float, default=10,
+                        help="MB of log files to write (default %(default)s)")
+    parser.add_argument('--file-size', type=int,
+                        default=DEFAULT_FILE_SIZE // 1024,
+                        help="KB in each log file (default %(default)s)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Seed for the random choices "
+                             "(default %(default)s)")
+    args = parser.parse_args()
+    written = write_log_folder(args.log_dir, int(args.size * 1024 * 1024),
+                               args.file_size * 1024, args.seed)
+    print("Wrote %(records)d records in %(files)d files (%(bytes)d bytes)"
+                                                                    % written)
@@ -0,0 +1,396 @@
+"""
+This file reads the records out of the cozmo das log files.
+
+A das log file is a run of json objects separated by ',' with no enclosing
+list, e.g. {"$app": ...},{"$app": ...},
+Log files on disk are memory mapped, and only the records that are
+needed are copied out of the mapping to be decoded, so memory use does not
+grow with the size of the log file. A log file still being written is 
+decoded from the chunks appended to it by DasLogFeed.
+
+Records can also be read as LogLineView objects, which only decode the
+keys that are asked for rather than the whole record.
+
+A record that cannot be decoded is skipped up to the next record start,
+'{"$app"', which can only appear in the text of a log file where a record
+begins. A record cut short by the app stopping mid write is then lost on
+its own, without the record written after it.
+"""
+import codecs
+import json
+import mmap
+import os
+import re
+
+# A record that still does not decode after this much text has been
+# buffered for it is treated as corrupt rather than incomplete
+MAX_RECORD_SIZE = 1024 * 1024
+
+# The text that separates two records in a log file
+RECORD_SEPARATOR = '},{'
+
+_SKIP_SEPARATORS = re.compile(r'[\s,]*')
+
+RECORD_SEPARATOR_BYTES = RECORD_SEPARATOR.encode('ascii')
+
+_SKIP_SEPARATOR_BYTES = re.compile(br'[\s,]*')
+
+# The text every record starts with, as the keys are written sorted
+RECORD_START = '{"$app"'
+
+RECORD_START_BYTES = RECORD_START.encode('ascii')
+
+# A separator followed by a record start, which unlike a bare separator
+# cannot be inside the $data of a record
+RECORD_BOUNDARY_BYTES = b'},' + RECORD_START_BYTES
+_FIND_BOUNDARY_BYTES = re.compile(re.escape(RECORD_BOUNDARY_BYTES))
+
+_VALUE_DECODER = json.JSONDecoder()
+
+# Patterns finding a key of a record by key
+_KEY_PATTERNS = {}
+
+
+def _key_pattern(key):
+    """
+    @param key: A record key
+    @return: Regex matching the key up to the start of its value
+    """
+    pattern = _KEY_PATTERNS.get(key)
+    if pattern is None:
+        pattern = _KEY_PATTERNS[key] = re.compile(r'"%s"\s*:\s*' %
+                                                  re.escape(key))
+    return pattern
+
+
+def _read_value(text, pos):
+    """
+    Decodes the value starting at pos in the text of a record that has
+    no escaped characters
+    @param text: The text of the record
+    @param pos: Offset of the start of the value
+    @return: The decoded value
+    """
+    if text.startswith('"', pos):
+        return text[pos + 1:text.index('"', pos + 1)]
+    return _VALUE_DECODER.raw_decode(text, pos)[0]
+
+
+class LazyKeys:
+    """
+    The keys a LogLineView decodes up front, and the values of the other
+    keys shared by the views of one reader
+    """
+    __slots__ = ('pattern', 'keys', 'shared_values')
+
+    def __init__(self, pattern, keys):
+        """
+        @param pattern: Regex with the key in group 1, matching up to the
+                        start of the value, of the keys to decode up front
+        @param keys: The keys matched by the pattern
+        """
+        self.pattern = pattern
+        self.keys = frozenset(keys)
+        self.shared_values = {}
+
+
+class LogLineView(dict):
+    """
+    A record of which only some keys, such as the tracked event keys,
+    $data and $ts, are decoded up front. Any other key is decoded from the
+    text of the record when it is first looked up, and the values of the
+    envelope keys ($app, $unit, ...) are shared by every record read by 
+    the same reader. Iterating over the view only gives the keys decoded 
+    so far. Only records without escaped characters are read this way.
+    """
+    __slots__ = ('_text', '_lazy_keys')
+
+    def __init__(self, text, lazy_keys):
+        """
+        @param text: The text of the record
+        @param lazy_keys: The LazyKeys of the reader
+        """
+        dict.__init__(self)
+        self._text = text
+        self._lazy_keys = lazy_keys
+        for match in lazy_keys.pattern.finditer(text):
+            end = match.end()
+            if text.startswith('"', end):
+                self[match.group(1)] = text[end + 1:text.index('"', end + 1)]
+            else:
+                self[match.group(1)] = _read_value(text, end)
+
+    def __missing__(self, key):
+        if key in self._lazy_keys.keys:
+            # Decoded up front, so not in the record
+            raise KeyError(key)
+        match = _key_pattern(key).search(self._text)
+        if match is None:
+            raise KeyError(key)
+        value = _read_value(self._text, match.end())
+        if isinstance(value, str):
+            value = self._lazy_keys.shared_values.setdefault(value, value)
+        self[key] = value
+        return value
+
+    def __contains__(self, key):
+        if dict.__contains__(self, key):
+            return True
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class MappedDasLogReader:
+    """
+    Iterates over the records of a das log file opened in binary mode by
+    memory mapping it. Record boundaries are found in the mapped bytes, 
+    so the file is never read into a buffer and the pages are shared 
+    through the OS page cache with any other process reading the file.
+    Records that cannot be decoded are sacrificed and counted in 
+    error_line, and their byte offsets are kept in damaged.
+    If a key_filter bytes regex is given, records whose raw text does not
+    match it are skipped without being decoded and counted in 
+    skipped_count. If lazy_keys is given the records are read as 
+    LogLineView objects decoding only those keys up front.
+    """
+    def __init__(self, file_pointer, key_filter=None, lazy_keys=None):
+        """
+        @param file_pointer: The log file opened in binary mode
+        @param key_filter: Optional bytes regex of the records to decode
+        @param lazy_keys: Optional tuple of a regex matching the keys to
+                          decode up front, as for LazyKeys, and the keys
+        """
+        self.file_pointer = file_pointer
+        self.key_filter = key_filter
+        self.record_count = 0
+        self.error_line = 0
+        self.skipped_count = 0
+        self._decoder = json.JSONDecoder()
+        self.lazy_keys = LazyKeys(*lazy_keys) if lazy_keys else None
+        # (start, end) byte offsets of each record skipped as corrupt
+        self.damaged = []
+
+    def stats(self):
+        """
+        @return: dict of the counts of records read so far
+        """
+        return {'records': self.record_count,
+                'error_lines': self.error_line,
+                'skipped_records': self.skipped_count}
+
+    def __iter__(self):
+        file_number = self.file_pointer.fileno()
+        if not os.fstat(file_number).st_size:
+            return
+        with mmap.mmap(file_number, 0, access=mmap.ACCESS_READ) as log_map:
+            for log_line in self._scan(log_map):
+                yield log_line
+
+    def _decode_record(self, log_map, pos):
+        """
+        Decodes the record starting at pos. A separator that turns out to 
+        be inside a string value just makes the record longer
+        @param log_map: The mapped log file or its bytes
+        @param pos: Offset of the '{' starting the record
+        @return: Tuple of the decoded record, or None if it could not be 
+                 decoded, and the offset after the record
+        """
+        decode = self._decoder.decode
+        first_end = end = log_map.find(RECORD_SEPARATOR_BYTES, pos)
+        while True:
+            if end >= 0:
+                record_end = end + 1
+            else:
+                record_end = log_map.rfind(b'}', pos) + 1
+            try:
+                if record_end <= pos:
+                    # The last record was cut short before any '}'
+                    raise ValueError("Record cut short")
+                text = log_map[pos:record_end].decode('utf-8')
+                # A record cut short at a separator inside a string has an
+                # odd number of quotes and is decoded in full to find out,
+                # as is any text holding more than one record start or 
+                # that is not a whole record, such as the last record of 
+                # a file cut short after a '}' in its $data
+                if self.lazy_keys is not None and '\\' not in text and \
+                                        not text.count('"') % 2 and \
+                                        text.find(RECORD_START, 1) < 0 and \
+                                        text.endswith('}') and \
+                                        text.count('{') == text.count('}'):
+                    return LogLineView(text, self.lazy_keys), record_end
+                return decode(text), record_end
+            except ValueError:
+                # A record start inside the text means the record was cut
+                # short and the next one written straight after it
+                next_pos = log_map.find(RECORD_START_BYTES, pos + 1, 
+                                        record_end)
+                if next_pos >= 0:
+                    break
+                if end < 0 or record_end - pos >= MAX_RECORD_SIZE:
+                    next_pos = first_end + 2 if first_end >= 0 \
+                                            else len(log_map)
+                    break
+                end = log_map.find(RECORD_SEPARATOR_BYTES, end + 1)
+        return self._salvage_record(log_map, pos, next_pos), next_pos
+
+    def _salvage_record(self, log_map, pos, next_pos):
+        """
+        Decodes a whole record at the start of text that could not be 
+        decoded, such as a record followed by a broken separator and the
+        end of a record that was cut short
+        @param log_map: The mapped log file or its bytes
+        @param pos: Offset of the '{' starting the record
+        @param next_pos: Offset of the next record
+        @return: The decoded record, or None if the text does not start
+                 with a whole record
+        """
+        try:
+            text = log_map[pos:next_pos].decode('utf-8')
+            log_line, text_end = self._decoder.raw_decode(text)
+        except ValueError:
+            return None
+        if not isinstance(log_line, dict):
+            return None
+        # The rest of the text is counted as a corrupt record
+        self.error_line += 1
+        self.damaged.append((pos + len(text[:text_end].encode('utf-8')), 
+                             next_pos))
+        return log_line
+
+    def _scan(self, log_map):
+        """
+        Yields the records of the mapped log file
+        @param log_map: The mapped log file or its bytes
+        """
+        file_size = len(log_map)
+        skip_separators = _SKIP_SEPARATOR_BYTES.match
+        find_boundaries = _FIND_BOUNDARY_BYTES.finditer
+        key_search = self.key_filter.search if self.key_filter else None
+        key_match = None
+        pos = 0
+        while True:
+            pos = skip_separators(log_map, pos).end()
+            if pos >= file_size:
+                return
+            if key_search:
+                # Every whole record before the next tracked key is 
+                # skipped in one go, up to the last record start before it
+                # so a separator inside the $data of the tracked record is
+                # not taken for its start
+                if key_match is None or key_match.start() < pos:
+                    key_match = key_search(log_map, pos)
+                skip_end = log_map.rfind(RECORD_BOUNDARY_BYTES, pos,
+                                         key_match.start() if key_match
+                                                           else file_size)
+                if skip_end >= 0:
+                    self.skipped_count += sum(1 for boundary in
+                                              find_boundaries(log_map, pos,
+                                                    skip_end + 
+                                                    len(RECORD_BOUNDARY_BYTES)))
+                    pos = skip_end + 2
+                    continue
+            record_pos = pos
+            log_line, pos = self._decode_record(log_map, pos)
+            if not isinstance(log_line, dict):
+                self.error_line += 1
+                self.damaged.append((record_pos, pos))
+                continue
+            self.record_count += 1
+            yield log_line
+
+
+
+class BytesDasLogReader(MappedDasLogReader):
+    """
+    Iterates over the records of a das log file that has already been
+    read into a bytes object
+    """
+    def __init__(self, log_bytes, key_filter=None, lazy_keys=None):
+        MappedDasLogReader.__init__(self, None, key_filter, lazy_keys)
+        self.log_bytes = log_bytes
+
+    def __iter__(self):
+        return self._scan(self.log_bytes)
+
+
+class DasLogFeed:
+    """
+    Decodes the records of a log file that is still being written from
+    the chunks of bytes appended to it. A record that is cut off at the 
+    end of a chunk is held until the rest of it arrives
+    """
+    def __init__(self):
+        self.record_count = 0
+        self.error_line = 0
+        self.skipped_count = 0
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self._buffer = ''
+
+    def stats(self):
+        """
+        @return: dict of the counts of records read so far
+        """
+        return {'records': self.record_count,
+                'error_lines': self.error_line,
+                'skipped_records': self.skipped_count}
+
+    def feed(self, data, final=False):
+        """
+        @param data: bytes appended to the log file since the last call
+        @param final: True once the log file has been closed, so a record
+                      still cut off is sacrificed
+        @return: List of the records completed by this chunk
+        """
+        raw_decode = self._decoder.raw_decode
+        skip_separators = _SKIP_SEPARATORS.match
+        buffer = self._buffer + self._text_decoder.decode(data, final)
+        pos = 0
+        log_data = []
+        while True:
+            pos = skip_separators(buffer, pos).end()
+            if pos >= len(buffer):
+                break
+            try:
+                log_line, pos = raw_decode(buffer, pos)
+            except ValueError:
+                record_start = buffer.find(RECORD_START, pos + 1)
+                if not final and len(buffer) - pos < MAX_RECORD_SIZE and \
+                                                            record_start < 0:
+                    # Wait for the rest of the record
+                    break
+                # Sacrifice the problematic log line
+                # but record that this line we could not read
+                self.error_line += 1
+                next_start = buffer.find(RECORD_SEPARATOR, pos + 1)
+                pos = next_start + 2 if next_start >= 0 else len(buffer)
+                if 0 <= record_start < pos:
+                    # Cut short by the next record
+                    pos = record_start
+                continue
+            if not isinstance(log_line, dict):
+                self.error_line += 1
+                continue
+            self.record_count += 1
+            log_data.append(log_line)
+        self._buffer = buffer[pos:]
+        return log_data
+
+
+def merge_read_stats(read_stats, new_stats):
+    """
+    Adds the counts from one reader to a running total
+    @param read_stats: dict of the running total, updated in place
+    @param new_stats: dict of counts as returned by MappedDasLogReader.stats
+    """
+    for name, count in new_stats.items():
+        read_stats[name] = read_stats.get(name, 0) + count
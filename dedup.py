@@ -0,0 +1,153 @@
+"""
+This file drops the log lines already seen in another log file, for
+participant folders where a tablet synced the same log data more than
+once, so the copies are not counted twice.
+
+A log line is known by the app run it was written in ($apprun) and its
+number in that run ($seq). A log file holds every log line of an app run
+between the first and last $seq it has of it, even when the prefilter
+only passes some of them on. So once a log file has been read, the whole
+$seq range it covers is marked as seen. The ranges of an app run are kept
+merged and sorted, so the index grows with the number of log files at
+most rather than with the number of log lines. Looking up a log line is
+a bisect over the ranges of its app run.
+"""
+from bisect import bisect_left, bisect_right
+import sys
+
+from events import RUN_KEY
+
+SEQ_KEY = '$seq'
+
+
+class SeqRanges:
+    """
+    Sorted, merged and disjoint ranges of the $seq numbers of one app run
+    """
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def __contains__(self, seq):
+        index = bisect_right(self.starts, seq) - 1
+        return index >= 0 and seq <= self.ends[index]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, first, last):
+        """
+        Adds a range, merging it with the ranges it overlaps or touches
+        @param first: The first $seq of the range
+        @param last: The last $seq of the range
+        """
+        low = bisect_left(self.ends, first - 1)
+        high = bisect_right(self.starts, last + 1)
+        if low < high:
+            first = min(first, self.starts[low])
+            last = max(last, self.ends[high - 1])
+        self.starts[low:high] = [first]
+        self.ends[low:high] = [last]
+
+
+class DuplicateFilter:
+    """
+    Passes on the log lines of each log file that were not in a log file
+    read before it, and keeps the ranges of the log lines it dropped.
+    One filter can be shared by the log folders of the same unit.
+    """
+    def __init__(self):
+        # $apprun : SeqRanges of the log files read
+        self.seen = {}
+        # (log file path, $apprun, first $seq, last $seq, log lines dropped)
+        self.overlaps = []
+        self.duplicate_count = 0
+
+    def filter(self, log_data, log_file_path=None):
+        """
+        Drops the log lines of a log file already seen. The ranges the
+        log file covers are only marked as seen once it has been read to
+        the end. Log lines without $apprun or $seq are always passed on.
+        @param log_data: iterable of the log lines of one log file
+        @param log_file_path: The path of the log file, for the overlaps
+        @return: Generator of the log lines not seen before
+        """
+        seen = self.seen
+        # $apprun : [first $seq, last $seq] of this log file
+        spans = {}
+        # $apprun : [first $seq, last $seq, count] dropped from this file
+        dropped = {}
+        for log_line in log_data:
+            app_run = log_line.get(RUN_KEY)
+            seq = log_line.get(SEQ_KEY)
+            if app_run is None or seq is None:
+                yield log_line
+                continue
+            seq = int(seq)
+            span = spans.get(app_run)
+            if span is None:
+                spans[app_run] = [seq, seq]
+            elif seq < span[0]:
+                span[0] = seq
+            elif seq > span[1]:
+                span[1] = seq
+            seq_ranges = seen.get(app_run)
+            if seq_ranges is not None and seq in seq_ranges:
+                overlap = dropped.get(app_run)
+                if overlap is None:
+                    dropped[app_run] = [seq, seq, 1]
+                else:
+                    overlap[0] = min(overlap[0], seq)
+                    overlap[1] = max(overlap[1], seq)
+                    overlap[2] += 1
+                continue
+            yield log_line
+        for app_run, (first, last) in spans.items():
+            seq_ranges = seen.get(app_run)
+            if seq_ranges is None:
+                seq_ranges = seen[app_run] = SeqRanges()
+            seq_ranges.add(first, last)
+        for app_run, (first, last, count) in sorted(dropped.items()):
+            self.overlaps.append((log_file_path, app_run, first, last, count))
+            self.duplicate_count += count
+
+    def clear(self):
+        """
+        Forgets every log line seen, as when the usage log is built again
+        """
+        self.seen = {}
+        self.clear_overlaps()
+
+    def clear_overlaps(self):
+        """
+        Forgets the overlaps found, keeping the log lines seen
+        """
+        self.overlaps = []
+        self.duplicate_count = 0
+
+    def stats(self):
+        """
+        @return: dict of the counts of the index and of the log lines
+                 dropped
+        """
+        return {'app_runs': len(self.seen),
+                'seq_ranges': sum(len(seq_ranges)
+                                    for seq_ranges in self.seen.values()),
+                'duplicate_events': self.duplicate_count}
+
+    def write_report(self, output=sys.stderr):
+        """
+        Writes a line for each overlap found and one on the totals
+        @param output: The file to write to, stderr so the report on
+                       stdout is left as it is
+        """
+        for log_file_path, app_run, first, last, count in self.overlaps:
+            output.write("Dropped %d duplicate events of run %s, $seq %d-%d,"
+                         " in %s\n" % (count, app_run, first, last,
+                                       log_file_path))
+        if self.overlaps:
+            output.write("Dropped %(duplicate_events)d duplicate events, "
+                         "%(app_runs)d app runs seen in %(seq_ranges)d $seq "
+                         "ranges\n" % self.stats())
@@ -0,0 +1,239 @@
+"""
+This file maps each event key of a log line to the handler that records
+it in the session data. analyse_log_data looks up the keys of each log line
+here rather than testing for every key in turn.
+
+A new event type is added by registering a handler for its key, e.g.
+
+    @EVENT_REGISTRY.handles('robot.vision.new_event')
+    def record_new_event(session_record, game_state, log_line):
+        ...
+
+The prefilter, the compacted log lines and the log cache keep the log
+lines carrying any key with a handler, as they take their keys from the
+registry's event_keys rather than from events.TRACKED_KEYS alone. The
+exports only hold the events of events.TRACKED_KEYS.
+"""
+from events import EventKeys, TRACKED_KEYS
+
+
+class GameState:
+    """
+    The game being played, carried from one log line to the next while
+    a log file is analysed
+    """
+    __slots__ = ('current_game', 'current_game_id', 'current_game_result')
+
+    def __init__(self, current_game=None, current_game_id=None):
+        self.current_game = current_game
+        self.current_game_id = current_game_id
+        self.current_game_result = 0
+
+
+class EventRegistry:
+    """
+    Handlers by event key. A log line carrying more than one registered
+    key has its handlers called in the order they were registered, so the
+    game start and end events are handled in the order they always have.
+    """
+    def __init__(self):
+        # event key : (order, handler)
+        self._handlers = {}
+        self.handled_keys = frozenset()
+        self._event_keys = None
+
+    def register(self, key, handler):
+        """
+        Registers the handler of an event key, replacing any handler
+        already registered for it but keeping its place in the order
+        @param key: The event key of the log line
+        @param handler: function taking the SessionData, the GameState and
+                        the log line
+        @return: The handler
+        """
+        order = self._handlers.get(key, (len(self._handlers), None))[0]
+        self._handlers[key] = (order, handler)
+        self.handled_keys = frozenset(self._handlers)
+        self._event_keys = None
+        return handler
+
+    def handles(self, key):
+        """
+        @param key: The event key of the log line
+        @return: Decorator registering a handler for the key
+        """
+        return lambda handler: self.register(key, handler)
+
+    def copy(self):
+        """
+        @return: A new EventRegistry with the same handlers, that more can
+                 be registered on without changing this one
+        """
+        registry = EventRegistry()
+        registry._handlers = dict(self._handlers)
+        registry.handled_keys = self.handled_keys
+        registry._event_keys = self._event_keys
+        return registry
+
+    def event_keys(self):
+        """
+        @return: The EventKeys of events.TRACKED_KEYS and of every key with
+                 a handler, worked out again once a key is registered
+        """
+        if self._event_keys is None:
+            self._event_keys = EventKeys(TRACKED_KEYS + tuple(
+                                            key for key in sorted(
+                                                self._handlers, 
+                                                key=self._handlers.get)
+                                                if key not in TRACKED_KEYS))
+        return self._event_keys
+
+    def dispatch(self, event_keys, log_line, session_record, game_state):
+        """
+        Calls the handlers of the registered keys found in a log line
+        @param event_keys: set of the registered keys in the log line
+        @param log_line: dict of the decoded log line
+        @param session_record: The SessionData to record the events in
+        @param game_state: The GameState of the log file being analysed
+        """
+        handlers = self._handlers
+        if len(event_keys) == 1:
+            for key in event_keys:
+                handlers[key][1](session_record, game_state, log_line)
+            return
+        for order, handler in sorted(handlers[key] for key in event_keys):
+            handler(session_record, game_state, log_line)
+
+
+EVENT_REGISTRY = EventRegistry()
+
+
+@EVENT_REGISTRY.handles('robot.game_unlock_status')
+def record_games_unlocked(session_record, game_state, log_line):
+    #print("%s" % log_line['robot.game_unlock_status'].split(','))
+    session_record.update_record_list('games_unlocked',
+                        log_line['robot.game_unlock_status'].strip(',')\
+                                                            .split(','))
+
+
+@EVENT_REGISTRY.handles('world.daily_goals')
+def record_daily_challenge(session_record, game_state, log_line):
+    if '$data' in log_line:
+        # This line has a daily goal motivator
+        session_record.update_record_set('daily_challenge',
+                                             log_line['$data'].strip(',')\
+                                                              .strip('_0/1')\
+                                                              .replace('<b>', '')\
+                                                              .replace('</b>', ''))
+
+
+@EVENT_REGISTRY.handles('robot.spark_unlock_status')
+def record_features_unlocked(session_record, game_state, log_line):
+    #print("%s" % log_line['robot.spark_unlock_status'].split(','))
+    session_record.update_record_list('features_unlocked',
+                            log_line['robot.spark_unlock_status'].strip(',')\
+                                                                 .split(','))
+
+
+@EVENT_REGISTRY.handles('robot.face_enrollment')
+def record_face_enrolled(session_record, game_state, log_line):
+    session_record.face_enrolled.append(log_line['robot.face_enrollment'])
+
+
+############################################################
+# These three together indicate the start of a game
+@EVENT_REGISTRY.handles('game.launch')
+def record_game_launch(session_record, game_state, log_line):
+    if game_state.current_game != None:
+        session_record.abort_game(game_state.current_game)
+    game_state.current_game = log_line['game.launch']
+    game_state.current_game_id = None
+    session_record.create_or_update_game(game_state.current_game)
+
+
+@EVENT_REGISTRY.handles('game.start')
+def record_game_start(session_record, game_state, log_line):
+    if not game_state.current_game:
+        return
+    if game_state.current_game_id and \
+                    game_state.current_game_id != log_line['game.start']:
+        # The last game must have been aborted or not accounted for
+        if game_state.current_game:
+            session_record.abort_game(game_state.current_game)
+            game_state.current_game = None
+    game_state.current_game_id = log_line['game.start']
+    session_record.current_game_id = game_state.current_game_id
+
+
+@EVENT_REGISTRY.handles('game.type')
+def record_game_type(session_record, game_state, log_line):
+    if game_state.current_game == log_line['game.type']:
+        # expected route. This is a all well sign
+        # so nothing to do
+        pass
+    else:
+        if game_state.current_game:
+            # We don't know what happened to the last game:
+            session_record.game_record[game_state.current_game]\
+                                                    .game_abort_count += 1
+        game_state.current_game = log_line['game.type']
+        session_record.create_or_update_game(game_state.current_game)
+    game_state.current_game_id = None
+# These three together indicate the start of a game
+#################################################################
+
+
+#################################################################
+# These two together indicate the end of game
+@EVENT_REGISTRY.handles('game.end')
+def record_game_end(session_record, game_state, log_line):
+    session_record.end_game(game_state.current_game,
+                            game_state.current_game_result)
+    game_state.current_game = None
+    game_state.current_game_id = None
+    game_state.current_game_result = 0
+
+
+@EVENT_REGISTRY.handles('game.end.player_rank')
+def record_player_rank(session_record, game_state, log_line):
+    if not game_state.current_game:
+        return
+    if log_line["game.end.player_rank"] == "0":
+        # I think this defines cozmo lost
+        game_state.current_game_result = -1
+    else:
+        game_state.current_game_result = 1
+# These two together indicate the end of game
+#################################################################
+
+
+@EVENT_REGISTRY.handles('robot.play_animation')
+def record_animation(session_record, game_state, log_line):
+    anim_name = log_line['robot.play_animation']
+    session_record.record_animation(game_state.current_game, anim_name)
+
+    if 'ask' in anim_name or 'request' in anim_name:
+        session_record.add_update_request(anim_name)
+
+
+@EVENT_REGISTRY.handles('meta.goal.progressed')
+def record_goal_progress(session_record, game_state, log_line):
+    session_record.add_goal_progress(log_line['meta.goal.progressed'])
+
+
+@EVENT_REGISTRY.handles('robot.freeplay_goal_started')
+def record_free_play(session_record, game_state, log_line):
+    session_record.create_or_update_free_play(
+                                    log_line["robot.freeplay_goal_started"])
+
+
+@EVENT_REGISTRY.handles('robot.vision.face_recognition.re_recognized')
+def record_face_recognized(session_record, game_state, log_line):
+    session_record.update_record_list('face_recognized',
+                    [log_line['robot.vision.face_recognition.re_recognized']])
+
+
+@EVENT_REGISTRY.handles('robot.vision.detected_pet')
+def record_pet(session_record, game_state, log_line):
+    if '$data' in log_line:
+        session_record.add_update_pet(log_line['$data'])
@@ -0,0 +1,499 @@
+"""
+This file keeps the events and usage sessions of many participants in an
+indexed SQLite store, so questions across participants and dates are
+answered by a query rather than by cleaning every log folder again.
+
+Each participant folder is cleaned once when it is ingested. The store
+then holds
+    participants : folder, $unit and $phone of each participant
+    sessions     : the usage sessions of each day with their totals
+    games        : the game totals of each session
+    events       : one row per tracked event, with its session, date,
+                   the game being played and the animation sentiment
+The events of a session are kept in the order they were analysed, so
+the DailyData and SessionData of a participant can be rebuilt from the
+store with usage_log.
+
+Usage:
+    python event_store.py store.sqlite ingest Participants/P005 ...
+    python event_store.py store.sqlite count --event robot.play_animation
+        --game memorymatch --value-like %playerno% --group-by participant
+    python event_store.py store.sqlite report P005
+    python event_store.py store.sqlite sql "SELECT ..."
+"""
+import argparse
+from datetime import datetime, timedelta
+from itertools import groupby
+import os
+import sqlite3
+import sys
+import time
+
+from anim_sentiment import classify_animation
+from batch_clean import find_participant_folders, read_run_globals
+from clean_log import (analyse_log_data, get_usage_details,
+                       get_usage_details_by_timestamp, print_usage_log)
+from events import TRACKED_KEYS
+from export import ANIMATION_KEY, GAME_END_KEY
+
+DEFAULT_STORE_PATH = 'cozmo_events.sqlite'
+
+SESSION_COLUMNS = ('play_sessions', 'positive_animations',
+                   'negative_animations', 'mixed_neutral_animations',
+                   'unknown_face_count')
+
+GAME_COLUMNS = ('start_count', 'cozmo_win_count', 'cozmo_lose_count',
+                'neutral_outcome', 'game_abort_count',
+                'positive_animations', 'negative_animations',
+                'mixed_neutral_animations')
+
+# Columns the event counts can be grouped by
+GROUP_COLUMNS = {'participant': 'participants.name',
+                 'date': 'events.date',
+                 'session': 'events.session_id',
+                 'event': 'events.event_type',
+                 'game': 'events.game',
+                 'value': 'events.value',
+                 'sentiment': 'events.sentiment'}
+
+_SCHEMA = ("CREATE TABLE IF NOT EXISTS participants ("
+           "id INTEGER PRIMARY KEY, "
+           "name TEXT UNIQUE, "
+           "folder TEXT, "
+           "unit TEXT, "
+           "phone TEXT, "
+           "lead_time REAL, "
+           "ingested REAL)",
+           "CREATE TABLE IF NOT EXISTS sessions ("
+           "id INTEGER PRIMARY KEY, "
+           "participant_id INTEGER, "
+           "date TEXT, "
+           "session INTEGER, "
+           "time TEXT, "
+           "play_time REAL, " +
+           ", ".join("%s INTEGER" % column for column in SESSION_COLUMNS) +
+           ")",
+           "CREATE TABLE IF NOT EXISTS games ("
+           "session_id INTEGER, "
+           "name TEXT, " +
+           ", ".join("%s INTEGER" % column for column in GAME_COLUMNS) +
+           ")",
+           "CREATE TABLE IF NOT EXISTS events ("
+           "participant_id INTEGER, "
+           "session_id INTEGER, "
+           "date TEXT, "
+           "batch INTEGER, "
+           "line INTEGER, "
+           "ts INTEGER, "
+           "event_type TEXT, "
+           "game TEXT, "
+           "value TEXT, "
+           "data TEXT, "
+           "sentiment INTEGER, "
+           "result INTEGER)",
+           "CREATE INDEX IF NOT EXISTS sessions_participant "
+           "ON sessions (participant_id, date, session)",
+           "CREATE INDEX IF NOT EXISTS games_session "
+           "ON games (session_id, name)",
+           "CREATE INDEX IF NOT EXISTS events_participant "
+           "ON events (participant_id, date, session_id, event_type, game)",
+           "CREATE INDEX IF NOT EXISTS events_type "
+           "ON events (event_type, game, date)",
+           "CREATE INDEX IF NOT EXISTS events_game "
+           "ON events (game, date)")
+
+
+class StoreEventLog:
+    """
+    Collects the tracked events seen by analyse_log_data as rows for the
+    events table, one per tracked key of a log line. Rows remember which
+    analyse_log_data call they came from so the calls can be replayed.
+    """
+    def __init__(self):
+        # (session index, batch, line, ts, event type, game, value, data,
+        #  sentiment, result)
+        self.rows = []
+        self.sessions = []
+        self._session_index = {}
+        self._batch = -1
+        self._line = 0
+
+    def start_log_data(self, session_record):
+        """
+        @param session_record: The SessionData the log lines are recorded in
+        """
+        self._batch += 1
+
+    def add_log_line(self, session_record, log_line, current_game,
+                     previous_game, previous_result):
+        """
+        Adds a row for each tracked key in a log line
+        @param session_record: The SessionData the log line was recorded in
+        @param log_line: dict of the decoded log line
+        @param current_game: Name of the game running after the log line
+        @param previous_game: Name of the game running before the log line,
+                              which is the one a game.end ends
+        @param previous_result: Game result known before the log line
+        """
+        session_index = self._session_index.get(id(session_record))
+        if session_index is None:
+            session_index = self._session_index[id(session_record)] = \
+                                                            len(self.sessions)
+            self.sessions.append(session_record)
+        timestamp = int(log_line.get('$ts', -1))
+        data = log_line.get('$data')
+        if data is not None:
+            # An object or array $data is kept as text like the values
+            data = "%s" % data
+        for key in TRACKED_KEYS:
+            if key not in log_line:
+                continue
+            value = "%s" % log_line[key]
+            game_name = current_game
+            result = 0
+            sentiment = None
+            if key == GAME_END_KEY:
+                game_name = previous_game
+                result = previous_result
+            elif key == ANIMATION_KEY:
+                sentiment = classify_animation(value)
+            self.rows.append((session_index, self._batch, self._line,
+                              timestamp, key, game_name, value, data,
+                              sentiment, result))
+        self._line += 1
+
+
+class EventStore:
+    """
+    SQLite store of the events and sessions of the participants. Each
+    participant is written in one transaction, so a store being read
+    never shows a participant half ingested
+    """
+    def __init__(self, store_path=DEFAULT_STORE_PATH):
+        """
+        @param store_path: The SQLite file of the store, made if needed
+        """
+        self.connection = sqlite3.connect(store_path, timeout=60,
+                                          isolation_level=None)
+        for statement in _SCHEMA:
+            self.connection.execute(statement)
+
+    def close(self):
+        self.connection.close()
+
+    def query(self, sql, parameters=()):
+        """
+        @param sql: Any SQL statement on the store tables
+        @param parameters: Values of the ? placeholders in the statement
+        @return: Tuple of the column names and the list of result rows
+        """
+        cursor = self.connection.execute(sql, parameters)
+        columns = [column[0] for column in cursor.description or ()]
+        return columns, cursor.fetchall()
+
+    def participants(self):
+        """
+        @return: List of the names of the participants in the store
+        """
+        return [name for name, in self.connection.execute(
+                            "SELECT name FROM participants ORDER BY name")]
+
+    def ingest(self, log_dir, name=None, jobs=1, prefilter=True,
+               log_cache=None, by_timestamp=False):
+        """
+        Cleans a participant folder and writes its sessions and events to
+        the store, replacing whatever was stored for the participant
+        @param log_dir: The participant folder
+        @param name: Name of the participant, the folder name by default
+        @param jobs: Number of worker processes to parse the log files in
+        @param prefilter: If True skip decoding log lines without tracked keys
+        @param log_cache: Optional LogCache of the events of parsed files
+        @param by_timestamp: If True sessions are grouped by log line times
+        @return: Number of events stored
+        """
+        name = name or os.path.basename(os.path.normpath(log_dir))
+        usage_details = get_usage_details
+        if by_timestamp:
+            usage_details = get_usage_details_by_timestamp
+        event_log = StoreEventLog()
+        usage_log = usage_details(log_dir, jobs, prefilter,
+                                  log_cache=log_cache, event_log=event_log)
+        run_globals = read_run_globals(log_dir)
+        lead_time = 0.0
+        if usage_log:
+            lead_time = min(usage_log.items())[1].lead_time.total_seconds()
+
+        execute = self.connection.execute
+        execute("BEGIN IMMEDIATE")
+        try:
+            self._delete_participant(name)
+            participant_id = execute("INSERT INTO participants (name, "
+                                     "folder, unit, phone, lead_time, "
+                                     "ingested) VALUES (?, ?, ?, ?, ?, ?)",
+                                     (name, os.path.abspath(log_dir),
+                                      run_globals.get('$unit'),
+                                      run_globals.get('$phone'),
+                                      lead_time, time.time())).lastrowid
+            session_ids = {}
+            for day, daily_record in sorted(usage_log.items()):
+                for index, session_record in \
+                                    enumerate(daily_record.sessions_record):
+                    session_ids[id(session_record)] = (self._insert_session(
+                                                        participant_id, day,
+                                                        index, session_record),
+                                                       day)
+            session_rows = [session_ids[id(session_record)]
+                                for session_record in event_log.sessions]
+            self.connection.executemany(
+                        "INSERT INTO events VALUES "
+                        "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        ((participant_id,) + session_rows[row[0]] + row[1:]
+                                                for row in event_log.rows))
+            execute("COMMIT")
+        except:
+            execute("ROLLBACK")
+            raise
+        return len(event_log.rows)
+
+    def _insert_session(self, participant_id, day, index, session_record):
+        """
+        @return: id of the session row
+        """
+        session_id = self.connection.execute(
+                        "INSERT INTO sessions (participant_id, date, "
+                        "session, time, play_time, %s) VALUES "
+                        "(?, ?, ?, ?, ?, %s)" % (", ".join(SESSION_COLUMNS),
+                                                 ", ".join("?" for column in
+                                                           SESSION_COLUMNS)),
+                        (participant_id, day, index,
+                         "%s" % session_record.session_time,
+                         session_record.play_time.total_seconds()) +
+                        tuple(getattr(session_record, column)
+                                        for column in SESSION_COLUMNS)
+                        ).lastrowid
+        self.connection.executemany(
+                        "INSERT INTO games VALUES (?, ?, %s)" %
+                                    ", ".join("?" for column in GAME_COLUMNS),
+                        ((session_id, game_details.name) +
+                            tuple(getattr(game_details, column)
+                                            for column in GAME_COLUMNS)
+                            for game_details in
+                                        session_record.game_record.values()))
+        return session_id
+
+    def _delete_participant(self, name):
+        row = self.connection.execute("SELECT id FROM participants "
+                                      "WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return
+        participant_id = row[0]
+        self.connection.execute("DELETE FROM games WHERE session_id IN "
+                                "(SELECT id FROM sessions "
+                                "WHERE participant_id = ?)", (participant_id,))
+        for table in ('events', 'sessions'):
+            self.connection.execute("DELETE FROM %s WHERE participant_id = ?"
+                                    % table, (participant_id,))
+        self.connection.execute("DELETE FROM participants WHERE id = ?",
+                                (participant_id,))
+
+    def count_events(self, event_type=None, game=None, value_like=None,
+                     participant=None, date_from=None, date_to=None,
+                     group_by=()):
+        """
+        Counts the stored events matching all the given filters
+        @param event_type: The event key, e.g. robot.play_animation
+        @param game: Name of the game being played, e.g. memorymatch
+        @param value_like: SQL LIKE pattern of the event value
+        @param participant: Name of the participant
+        @param date_from: First date to count, as YYYY-MM-DD
+        @param date_to: Last date to count, as YYYY-MM-DD
+        @param group_by: Names from GROUP_COLUMNS to count by
+        @return: List of rows of the group values followed by the count
+        """
+        conditions = []
+        parameters = []
+        for condition, value in (("events.event_type = ?", event_type),
+                                 ("events.game = ?", game),
+                                 ("events.value LIKE ?", value_like),
+                                 ("participants.name = ?", participant),
+                                 ("events.date >= ?", date_from),
+                                 ("events.date <= ?", date_to)):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        group_columns = [GROUP_COLUMNS[name] for name in group_by]
+        sql = ("SELECT %s COUNT(*) FROM events JOIN participants "
+               "ON participants.id = events.participant_id" %
+               "".join(column + ", " for column in group_columns))
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if group_columns:
+            sql += " GROUP BY %s ORDER BY %s" % (", ".join(group_columns),
+                                                 ", ".join(group_columns))
+        return self.connection.execute(sql, parameters).fetchall()
+
+    def usage_log(self, participant):
+        """
+        Rebuilds the DailyData and SessionData of a participant by
+        analysing the stored events again, as they were when ingested
+        @param participant: Name of the participant
+        @return: dict of DailyData by date string
+        """
+        # Imported here as only the rebuild needs the record classes
+        from record import DailyData
+
+        row = self.connection.execute("SELECT id, lead_time FROM participants "
+                                      "WHERE name = ?",
+                                      (participant,)).fetchone()
+        if row is None:
+            raise KeyError(participant)
+        participant_id, lead_time = row
+        lead_time = timedelta(seconds=lead_time)
+
+        usage_log = {}
+        sessions = {}
+        for session_id, day, session_time, play_time, play_sessions in \
+                self.connection.execute("SELECT id, date, time, play_time, "
+                                        "play_sessions FROM sessions "
+                                        "WHERE participant_id = ? "
+                                        "ORDER BY date, session",
+                                        (participant_id,)):
+            day_start = datetime.strptime(day, '%Y-%m-%d') + lead_time
+            daily_record = usage_log.get(day)
+            if daily_record is None:
+                daily_record = usage_log[day] = DailyData(day_start,
+                                                          lead_time)
+                session_record = daily_record.get_current_session()
+            else:
+                session_record = daily_record.get_new_session(day_start)
+            session_record.session_time = session_time
+            session_record.play_time = timedelta(seconds=play_time)
+            session_record.play_sessions = play_sessions
+            sessions[session_id] = session_record
+
+        events = self.connection.execute("SELECT session_id, batch, line, "
+                                         "ts, event_type, value, data "
+                                         "FROM events "
+                                         "WHERE participant_id = ? "
+                                         "ORDER BY batch, line, rowid",
+                                         (participant_id,))
+        for (session_id, batch), batch_rows in groupby(events,
+                                                 key=lambda row: row[:2]):
+            analyse_log_data(_stored_log_lines(batch_rows),
+                             sessions[session_id])
+        return usage_log
+
+
+def _stored_log_lines(rows):
+    """
+    Puts the stored rows of each log line back together as a log line
+    @param rows: Stored event rows in line order
+    @return: Generator of log line dicts
+    """
+    for line, line_rows in groupby(rows, key=lambda row: row[2]):
+        log_line = {}
+        for session_id, batch, line, ts, event_type, value, data in line_rows:
+            log_line[event_type] = value
+            log_line['$ts'] = ts
+            if data is not None:
+                log_line['$data'] = data
+        yield log_line
+
+
+def print_rows(columns, rows, output=sys.stdout):
+    """
+    Prints query results as tab separated lines under a header
+    """
+    print("\t".join(columns), file=output)
+    for row in rows:
+        print("\t".join("%s" % value for value in row), file=output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keeps the cozmo events of "
+                                                 "many participants in an "
+                                                 "indexed store to query")
+    parser.add_argument('store', help="The SQLite file of the store")
+    commands = parser.add_subparsers(dest='command')
+
+    ingest_parser = commands.add_parser('ingest', help="Clean participant "
+                                                       "folders into the store")
+    ingest_parser.add_argument('folders', nargs='+',
+                               help="Participant folders, or folders to "
+                                    "search for them with --root")
+    ingest_parser.add_argument('--root', action='store_true',
+                               help="Ingest every participant folder found "
+                                    "under the folders given")
+    ingest_parser.add_argument('--jobs', type=int, default=1,
+                               help="Number of worker processes to parse "
+                                    "the log files in (default 1)")
+    ingest_parser.add_argument('--by-timestamp', action='store_true',
+                               help="Group sessions by the time each log "
+                                    "line was written")
+    ingest_parser.add_argument('--no-prefilter', dest='prefilter',
+                               action='store_false',
+                               help="Decode every log line")
+
+    count_parser = commands.add_parser('count', help="Count stored events")
+    count_parser.add_argument('--event', help="Event key to count")
+    count_parser.add_argument('--game', help="Game being played")
+    count_parser.add_argument('--value-like',
+                              help="SQL LIKE pattern of the event value, "
+                                   "e.g. %%playerno%%")
+    count_parser.add_argument('--participant', help="Participant name")
+    count_parser.add_argument('--from', dest='date_from',
+                              help="First date, YYYY-MM-DD")
+    count_parser.add_argument('--to', dest='date_to',
+                              help="Last date, YYYY-MM-DD")
+    count_parser.add_argument('--group-by', nargs='+', default=[],
+                              choices=sorted(GROUP_COLUMNS),
+                              help="Count separately by these")
+
+    report_parser = commands.add_parser('report', help="Print the usage "
+                                                       "report of a "
+                                                       "participant from the "
+                                                       "store")
+    report_parser.add_argument('participant', help="Participant name")
+
+    sql_parser = commands.add_parser('sql', help="Run a SQL query on the "
+                                                 "store")
+    sql_parser.add_argument('sql', help="The SQL statement")
+
+    commands.add_parser('participants', help="List the participants")
+    args = parser.parse_args()
+    if not args.command:
+        parser.error("a command is needed")
+
+    event_store = EventStore(args.store)
+    try:
+        if args.command == 'ingest':
+            folders = args.folders
+            if args.root:
+                folders = [log_dir for root_dir in args.folders
+                            for log_dir in find_participant_folders(root_dir)]
+            for log_dir in folders:
+                count = event_store.ingest(log_dir, jobs=args.jobs,
+                                           prefilter=args.prefilter,
+                                           by_timestamp=args.by_timestamp)
+                print("%s : %d events" % (log_dir, count), file=sys.stderr)
+        elif args.command == 'count':
+            group_by = args.group_by
+            print_rows(group_by + ['count'],
+                       event_store.count_events(args.event, args.game,
+                                                args.value_like,
+                                                args.participant,
+                                                args.date_from, args.date_to,
+                                                group_by))
+        elif args.command == 'report':
+            try:
+                print_usage_log(event_store.usage_log(args.participant))
+            except KeyError:
+                parser.error("no participant %s in the store"
+                                                        % args.participant)
+        elif args.command == 'sql':
+            print_rows(*event_store.query(args.sql))
+        else:
+            for name in event_store.participants():
+                print(name)
+    finally:
+        event_store.close()
@@ -0,0 +1,172 @@
+"""
+This file lists the log keys carrying the events that are analysed
+for SoBa Lab. Everything else in a log line is telemetry we do not use.
+"""
+from collections import Counter
+import hashlib
+import re
+from sys import intern
+
+# Keys of a log line that the handlers of event_handlers.py look at. A
+# handler registered for another key adds it to the EventKeys of its
+# EventRegistry, not to this list.
+TRACKED_KEYS = ('robot.game_unlock_status',
+                'world.daily_goals',
+                'robot.spark_unlock_status',
+                'robot.face_enrollment',
+                'game.launch',
+                'game.start',
+                'game.type',
+                'game.end',
+                'game.end.player_rank',
+                'robot.play_animation',
+                'meta.goal.progressed',
+                'robot.freeplay_goal_started',
+                'robot.vision.face_recognition.re_recognized',
+                'robot.vision.detected_pet')
+
+# Keys that are only of interest alongside one of the tracked keys
+PAYLOAD_KEYS = ('$data',)
+
+# Keys giving when and in what order a log line was written
+ORDER_KEYS = ('$ts', '$seq')
+
+# Key of the app run that $seq numbers the log lines of. The same few 
+# values are shared by every log line, so they are interned.
+RUN_KEY = '$apprun'
+
+# Change this whenever the keys above or the compacted log line change, so
+# events cached by an older version are parsed again
+EVENT_FORMAT_VERSION = 3
+
+
+def trie_regex(words):
+    """
+    Builds a regex alternation of the words factored on their common
+    prefixes, which the re module matches much faster than a flat
+    alternation of the words
+    @param words: iterable of literal strings
+    @return: string giving the regex
+    """
+    branches = {}
+    for word in words:
+        branches.setdefault(word[:1], []).append(word[1:])
+    optional = branches.pop('', None) is not None
+    alternatives = [re.escape(first) + trie_regex(rest)
+                                    for first, rest in sorted(branches.items())]
+    if not alternatives:
+        return ''
+    if len(alternatives) == 1 and not optional:
+        return alternatives[0]
+    return '(?:%s)%s' % ('|'.join(alternatives), '?' if optional else '')
+
+class EventKeys:
+    """
+    A set of tracked keys with the patterns finding them in the raw text
+    of a log line and the keys kept when a log line is compacted. The
+    EventRegistry of the handlers gives the EventKeys its handlers need.
+    """
+    def __init__(self, tracked_keys=TRACKED_KEYS):
+        """
+        @param tracked_keys: The keys of the events analysed
+        """
+        self.tracked_keys = tuple(tracked_keys)
+        # Matches a tracked key in the raw text of a log line. A log line
+        # without a match can be dropped before it is json decoded.
+        self.pattern = re.compile(r'"%s"\s*:' % trie_regex(self.tracked_keys))
+        # The same for the raw bytes of a log file
+        self.bytes_pattern = re.compile(self.pattern.pattern.encode('utf-8'))
+        # Keys kept in a compacted log line
+        self.kept_keys = self.tracked_keys + PAYLOAD_KEYS + ORDER_KEYS + \
+                                                                (RUN_KEY,)
+        # Matches the kept keys up to the start of their value, for
+        # reading just those keys out of a record
+        self.kept_pattern = re.compile(r'"(%s)"\s*:\s*' % 
+                                                trie_regex(self.kept_keys))
+        self._tracked_key_set = frozenset(self.tracked_keys)
+        self._kept_key_set = frozenset(self.kept_keys)
+        # Log lines compacted for other keys are cached apart
+        self.version = EVENT_FORMAT_VERSION
+        if self._tracked_key_set != frozenset(TRACKED_KEYS):
+            self.version = "%d:%s" % (EVENT_FORMAT_VERSION, hashlib.sha1(
+                                    "\n".join(sorted(self._tracked_key_set))
+                                        .encode('utf-8')).hexdigest()[:16])
+
+    def key_filter(self, prefilter=True):
+        """
+        @param prefilter: If False no log lines are to be dropped
+        @return: The bytes regex of the log lines to decode or None
+        """
+        return self.bytes_pattern if prefilter else None
+
+    def lazy_keys(self, lazy=True):
+        """
+        @param lazy: If False log lines are to be decoded in whole
+        @return: Tuple of the regex and the keys a LogLineView decodes up
+                 front, or None
+        """
+        return (self.kept_pattern, self.kept_keys) if lazy else None
+
+    def compact_log_line(self, log_line):
+        """
+        Strips a log line down to the keys that the analysis looks at
+        @param log_line: dict of a decoded log line
+        @return: dict with only the tracked keys and their payload or None
+                 if the log line carries no tracked event
+        """
+        if self._tracked_key_set.isdisjoint(log_line):
+            return None
+        kept_key_set = self._kept_key_set
+        event = {key: value for key, value in log_line.items()
+                                            if key in kept_key_set}
+        if RUN_KEY in event:
+            event[RUN_KEY] = intern(event[RUN_KEY])
+        return event
+
+    def iter_compact_log_data(self, log_data):
+        """
+        Strips the log lines of a log file down to the ones carrying 
+        tracked events as they are read
+        @param log_data: iterable of decoded log lines
+        @return: Generator of compacted log lines
+        """
+        compact_log_line = self.compact_log_line
+        for log_line in log_data:
+            event = compact_log_line(log_line)
+            if event is not None:
+                yield event
+
+    def count_tracked_keys(self, log_data):
+        """
+        Counts the log lines carrying each tracked key
+        @param log_data: iterable of decoded log lines
+        @return: Counter of the number of log lines with each tracked key
+        """
+        key_counts = Counter()
+        for log_line in log_data:
+            key_counts.update(self._tracked_key_set.intersection(log_line))
+        return key_counts
+
+    def compact_log_data(self, log_data):
+        """
+        Strips the log lines of a log file down to the ones carrying 
+        tracked events
+        @param log_data: iterable of decoded log lines
+        @return: list of compacted log lines
+        """
+        return list(self.iter_compact_log_data(log_data))
+
+
+# The keys of events.TRACKED_KEYS, which the handlers in event_handlers.py
+# are registered for
+TRACKED_EVENT_KEYS = EventKeys(TRACKED_KEYS)
+
+TRACKED_KEY_PATTERN = TRACKED_EVENT_KEYS.pattern
+TRACKED_KEY_BYTES_PATTERN = TRACKED_EVENT_KEYS.bytes_pattern
+KEPT_KEYS = TRACKED_EVENT_KEYS.kept_keys
+KEPT_KEY_PATTERN = TRACKED_EVENT_KEYS.kept_pattern
+
+compact_log_line = TRACKED_EVENT_KEYS.compact_log_line
+iter_compact_log_data = TRACKED_EVENT_KEYS.iter_compact_log_data
+count_tracked_keys = TRACKED_EVENT_KEYS.count_tracked_keys
+compact_log_data = TRACKED_EVENT_KEYS.compact_log_data
@@ -0,0 +1,250 @@
+"""
+This file exports the events found by analyse_log_data, and the session
+and game tables built from them, as dictionary encoded numpy columns.
+Analysis tools can then load the columns directly instead of reading 
+back the printed report.
+
+The columns are written either to one .npz file or to a folder of .npy
+files, one per column, which load_export memory maps.
+
+numpy is only needed to write and load the export, not to collect the
+events.
+"""
+from array import array
+import os
+
+from anim_sentiment import classify_animation
+from events import TRACKED_KEYS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EXPORT_AVAILABLE = numpy is not None
+
+ANIMATION_KEY = 'robot.play_animation'
+GAME_END_KEY = 'game.end'
+
+
+class StringDictionary:
+    """
+    Gives each distinct string a small integer code. None is coded -1
+    """
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, value):
+        """
+        @param value: The string to encode or None
+        @return: Integer code of the string
+        """
+        if value is None:
+            return -1
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class EventLog:
+    """
+    Collects the tracked events seen by analyse_log_data in columns,
+    one row per tracked key of a log line
+    """
+    def __init__(self):
+        self.timestamp = array('q')
+        self.session = array('l')
+        self.game = array('l')
+        self.event_type = array('l')
+        self.value = array('l')
+        self.animation = array('l')
+        self.sentiment = array('b')
+        self.result = array('b')
+        self.game_names = StringDictionary()
+        self.event_types = StringDictionary()
+        self.values = StringDictionary()
+        # Sessions in the order their first event was seen
+        self.sessions = []
+        self._session_index = {}
+
+    def start_log_data(self, session_record):
+        """
+        Called as analyse_log_data starts on the log lines of a session.
+        The columns do not need to know where each call started.
+        @param session_record: The SessionData the log lines are recorded in
+        """
+        pass
+
+    def add_log_line(self, session_record, log_line, current_game,
+                     previous_game, previous_result):
+        """
+        Adds a row for each tracked key in a log line
+        @param session_record: The SessionData the log line was recorded in
+        @param log_line: dict of the decoded log line
+        @param current_game: Name of the game running after the log line
+        @param previous_game: Name of the game running before the log line,
+                              which is the one a game.end ends
+        @param previous_result: Game result known before the log line
+        """
+        session_index = self._session_index.get(id(session_record))
+        if session_index is None:
+            session_index = self._session_index[id(session_record)] = \
+                                                            len(self.sessions)
+            self.sessions.append(session_record)
+        timestamp = int(log_line.get('$ts', -1))
+        for key in TRACKED_KEYS:
+            if key not in log_line:
+                continue
+            value = log_line[key]
+            game_name = current_game
+            result = 0
+            if key == GAME_END_KEY:
+                game_name = previous_game
+                result = previous_result
+            if key == ANIMATION_KEY:
+                self.animation.append(self.values.encode(value))
+                self.sentiment.append(classify_animation(value))
+            else:
+                self.animation.append(-1)
+                self.sentiment.append(0)
+            self.timestamp.append(timestamp)
+            self.session.append(session_index)
+            self.game.append(self.game_names.encode(game_name))
+            self.event_type.append(self.event_types.encode(key))
+            self.value.append(self.values.encode("%s" % value))
+            self.result.append(result)
+
+
+def _session_order(usage_log):
+    """
+    @param usage_log: dict of DailyData by date string
+    @return: List of (date string, SessionData) in date and session order
+    """
+    return [(day, session_record) 
+                for day, daily_record in sorted(usage_log.items())
+                    for session_record in daily_record.sessions_record]
+
+def export_arrays(usage_log, event_log):
+    """
+    Builds the columns of the events, sessions and games tables
+    @param usage_log: dict of DailyData by date string
+    @param event_log: EventLog collected while the usage log was built
+    @return: dict of numpy arrays named <table>.<column>
+    """
+    if numpy is None:
+        raise RuntimeError("numpy is needed to export the events")
+    sessions = _session_order(usage_log)
+    session_ids = {id(session_record): index 
+                        for index, (day, session_record) in enumerate(sessions)}
+    event_sessions = numpy.array([session_ids.get(id(session_record), -1)
+                                    for session_record in event_log.sessions] 
+                                 or [-1], dtype=numpy.int32)
+    game_names = event_log.game_names
+    
+    arrays = {
+        'events.timestamp': numpy.frombuffer(event_log.timestamp, 
+                                             dtype=numpy.int64),
+        'events.session': event_sessions[numpy.asarray(event_log.session,
+                                                       dtype=numpy.intp)],
+        'events.game': numpy.asarray(event_log.game, dtype=numpy.int32),
+        'events.event_type': numpy.asarray(event_log.event_type, 
+                                           dtype=numpy.int16),
+        'events.value': numpy.asarray(event_log.value, dtype=numpy.int32),
+        'events.animation': numpy.asarray(event_log.animation, 
+                                          dtype=numpy.int32),
+        'events.sentiment': numpy.frombuffer(event_log.sentiment, 
+                                             dtype=numpy.int8),
+        'events.result': numpy.frombuffer(event_log.result, dtype=numpy.int8),
+        'dictionary.event_type': numpy.array(event_log.event_types.values,
+                                             dtype=numpy.str_),
+        'dictionary.value': numpy.array(event_log.values.values, 
+                                        dtype=numpy.str_),
+        'sessions.date': numpy.array([day for day, session_record in sessions],
+                                     dtype=numpy.str_),
+        'sessions.time': numpy.array(["%s" % session_record.session_time
+                                        for day, session_record in sessions],
+                                     dtype=numpy.str_),
+    }
+    session_columns = ('play_sessions', 'positive_animations', 
+                       'negative_animations', 'mixed_neutral_animations',
+                       'unknown_face_count')
+    for column in session_columns:
+        arrays['sessions.' + column] = numpy.array(
+                                    [getattr(session_record, column)
+                                        for day, session_record in sessions],
+                                    dtype=numpy.int32)
+    arrays['sessions.play_time'] = numpy.array(
+                        [session_record.play_time.total_seconds()
+                            for day, session_record in sessions],
+                        dtype=numpy.float64)
+    
+    game_columns = ('start_count', 'cozmo_win_count', 'cozmo_lose_count',
+                    'neutral_outcome', 'game_abort_count', 
+                    'positive_animations', 'negative_animations',
+                    'mixed_neutral_animations')
+    game_rows = [(index, game_details)
+                    for index, (day, session_record) in enumerate(sessions)
+                        for game_details in 
+                                session_record.game_record.values()]
+    arrays['games.session'] = numpy.array([index for index, game_details 
+                                                            in game_rows],
+                                          dtype=numpy.int32)
+    arrays['games.name'] = numpy.array([game_names.encode(game_details.name)
+                                        for index, game_details in game_rows],
+                                       dtype=numpy.int32)
+    for column in game_columns:
+        arrays['games.' + column] = numpy.array([getattr(game_details, column)
+                                                    for index, game_details 
+                                                                in game_rows],
+                                                dtype=numpy.int32)
+    # Games are encoded last as the games table may add names
+    arrays['dictionary.game'] = numpy.array(game_names.values, 
+                                            dtype=numpy.str_)
+    return arrays
+
+def export_events(export_path, usage_log, event_log):
+    """
+    Writes the events, sessions and games tables. A path ending in .npz
+    is written as one uncompressed .npz file, anything else as a folder
+    of .npy files
+    @param export_path: Path of the .npz file or folder to write
+    @param usage_log: dict of DailyData by date string
+    @param event_log: EventLog collected while the usage log was built
+    """
+    arrays = export_arrays(usage_log, event_log)
+    if export_path.endswith('.npz'):
+        numpy.savez(export_path, **arrays)
+        return
+    os.makedirs(export_path, exist_ok=True)
+    for name, column in arrays.items():
+        numpy.save(os.path.join(export_path, name + '.npy'), column)
+
+def load_export(export_path):
+    """
+    Loads an export back as tables of columns. The columns of a folder
+    export are memory mapped rather than read
+    @param export_path: Path of the .npz file or folder written by 
+                        export_events
+    @return: dict of tables, each a dict of numpy arrays by column name
+    """
+    if numpy is None:
+        raise RuntimeError("numpy is needed to load the events")
+    columns = {}
+    if os.path.isdir(export_path):
+        for file_name in os.listdir(export_path):
+            if file_name.endswith('.npy'):
+                columns[file_name[:-len('.npy')]] = numpy.load(
+                                        os.path.join(export_path, file_name),
+                                        mmap_mode='r')
+    else:
+        with numpy.load(export_path) as export_file:
+            for name in export_file.files:
+                columns[name] = export_file[name]
+    tables = {}
+    for name, column in columns.items():
+        table, column_name = name.split('.', 1)
+        tables.setdefault(table, {})[column_name] = column
+    return tables
@@ -0,0 +1,152 @@
+"""
+This file follows a cozmo log folder while the app is writing to it.
+
+The app writes the active log as NN.das_inprogress and renames it to
+NN.das when it is closed. The closed log files are read once, then only
+the bytes appended to the in progress file are read on each poll. When
+the in progress file is renamed, the rest of it is read from the closed
+file before moving on to the next in progress file, so the log lines 
+come out as one unbroken stream.
+"""
+import os
+import time
+
+from das_reader import DasLogFeed, MappedDasLogReader, merge_read_stats
+
+CLOSED_LOG_SUFFIX = '.das'
+IN_PROGRESS_SUFFIX = '.das_inprogress'
+
+# Seconds between looking for new log data
+DEFAULT_POLL_INTERVAL = 0.25
+
+
+def closed_log_path(in_progress_path):
+    """
+    @param in_progress_path: Path of an in progress log file
+    @return: The path it has once the app closes it
+    """
+    return in_progress_path[:-len(IN_PROGRESS_SUFFIX)] + CLOSED_LOG_SUFFIX
+
+
+class LogFollower:
+    """
+    Yields the log lines of a log folder as they are written
+    """
+    def __init__(self, log_dir, poll_interval=DEFAULT_POLL_INTERVAL,
+                 key_filter=None, on_idle=None):
+        """
+        @param log_dir: The log folder to follow
+        @param poll_interval: Seconds to wait when there is no new data
+        @param key_filter: Optional bytes regex to prefilter the closed 
+                           log files with
+        @param on_idle: Optional function called, with True if any log
+                        lines were read, each time all the data written 
+                        so far has been passed on
+        """
+        self.log_dir = log_dir
+        self.poll_interval = poll_interval
+        self.key_filter = key_filter
+        self.on_idle = on_idle
+        self.read_stats = {}
+        self._read_files = set()
+        self._in_progress_path = None
+        self._in_progress_offset = 0
+        self._in_progress_feed = None
+
+    def _read_closed_log(self, log_file_path):
+        """
+        Reads a closed log file in whole
+        @param log_file_path: The full path to the log file
+        @return: List of its log lines
+        """
+        with open(log_file_path, 'rb') as file_pointer:
+            log_reader = MappedDasLogReader(file_pointer, self.key_filter)
+            log_data = list(log_reader)
+        merge_read_stats(self.read_stats, log_reader.stats())
+        self._read_files.add(log_file_path)
+        return log_data
+
+    def _read_appended(self, log_file_path, final=False):
+        """
+        Reads what has been appended to the followed file since last time
+        @param log_file_path: Current path of the followed file
+        @param final: True if the file has been closed
+        @return: List of the log lines completed by the new data
+        """
+        with open(log_file_path, 'rb') as file_pointer:
+            if os.fstat(file_pointer.fileno()).st_size < self._in_progress_offset:
+                # The file was replaced, so start on it again
+                self._in_progress_offset = 0
+                self._in_progress_feed = DasLogFeed()
+            file_pointer.seek(self._in_progress_offset)
+            data = file_pointer.read()
+        self._in_progress_offset += len(data)
+        return self._in_progress_feed.feed(data, final)
+
+    def _finish_in_progress(self):
+        """
+        Stops following the in progress file
+        """
+        merge_read_stats(self.read_stats, self._in_progress_feed.stats())
+        self._in_progress_path = None
+        self._in_progress_feed = None
+
+    def poll(self):
+        """
+        Reads whatever has been written since the last poll
+        @return: List of the new log lines in the order they were written
+        """
+        log_data = []
+        if self._in_progress_path:
+            try:
+                log_data.extend(self._read_appended(self._in_progress_path))
+            except FileNotFoundError:
+                closed_path = closed_log_path(self._in_progress_path)
+                if os.path.isfile(closed_path):
+                    log_data.extend(self._read_appended(closed_path, True))
+                    self._read_files.add(closed_path)
+                else:
+                    log_data.extend(self._in_progress_feed.feed(b'', True))
+                self._finish_in_progress()
+        
+        # The followed file may be renamed once its data has been read
+        # above. It is only finished from its stored offset on the next
+        # poll, not read again in whole here.
+        followed_path = None
+        if self._in_progress_path:
+            followed_path = closed_log_path(self._in_progress_path)
+        file_paths = [os.path.join(self.log_dir, file_name) 
+                                for file_name in os.listdir(self.log_dir)]
+        closed_paths = sorted((os.stat(file_path).st_mtime, file_path) 
+                                for file_path in file_paths
+                                    if file_path.endswith(CLOSED_LOG_SUFFIX)
+                                    and file_path not in self._read_files
+                                    and file_path != followed_path)
+        for fdate, file_path in closed_paths:
+            log_data.extend(self._read_closed_log(file_path))
+        
+        if not self._in_progress_path:
+            in_progress_paths = sorted((os.stat(file_path).st_mtime, file_path)
+                                    for file_path in file_paths
+                                    if file_path.endswith(IN_PROGRESS_SUFFIX)
+                                    and os.path.isfile(file_path))
+            if in_progress_paths:
+                self._in_progress_path = in_progress_paths[-1][1]
+                self._in_progress_offset = 0
+                self._in_progress_feed = DasLogFeed()
+                log_data.extend(self._read_appended(self._in_progress_path))
+        return log_data
+
+    def iter_log_lines(self):
+        """
+        Yields the log lines of the folder as they are written. This
+        never stops on its own.
+        """
+        while True:
+            log_data = self.poll()
+            for log_line in log_data:
+                yield log_line
+            if self.on_idle:
+                self.on_idle(bool(log_data))
+            if not log_data:
+                time.sleep(self.poll_interval)
@@ -0,0 +1,153 @@
+"""
+This file keeps the events extracted from each log file in an on disk
+cache so closed log files are not parsed again on every run.
+
+Entries are keyed by the path of the log file together with its size,
+modification time and the version of the EventKeys the log lines were
+compacted with, so a log file that is
+still being written (NN.das_inprogress) is parsed again once it changes.
+"""
+import json
+import os
+import sqlite3
+import time
+import zlib
+
+from events import EVENT_FORMAT_VERSION
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'cozmo_log_clean')
+
+# Size of the stored events above which the least recently used entries
+# are evicted
+DEFAULT_MAX_CACHE_SIZE = 512 * 1024 * 1024
+
+CACHE_FILE_NAME = 'parsed_logs.sqlite'
+
+
+class LogCache:
+    """
+    SQLite backed cache of the compacted log lines of each log file.
+    Each statement commits on its own so several processes can share
+    the cache
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR,
+                 max_size=DEFAULT_MAX_CACHE_SIZE, rebuild=False):
+        """
+        @param cache_dir: The directory to keep the cache database in
+        @param max_size: Size in bytes of the stored events to evict down to
+        @param rebuild: If True existing entries are ignored and replaced
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_size = max_size
+        self.rebuild = rebuild
+        self.connection = sqlite3.connect(os.path.join(cache_dir,
+                                                       CACHE_FILE_NAME),
+                                          timeout=60,
+                                          isolation_level=None)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS log_events ("
+                                "path TEXT PRIMARY KEY, "
+                                "size INTEGER, "
+                                "mtime REAL, "
+                                "version INTEGER, "
+                                "events BLOB, "
+                                "blob_size INTEGER, "
+                                "last_used REAL)")
+
+    def _find(self, log_file_path, file_stat, columns, version):
+        """
+        Looks up the entry for a log file if it is still valid
+        @param log_file_path: The full path to the log file
+        @param file_stat: os.stat_result of the log file
+        @param columns: The columns to select
+        @param version: The version of the EventKeys of the events
+        @return: The selected row or None
+        """
+        if self.rebuild:
+            return None
+        return self.connection.execute("SELECT %s FROM log_events "
+                                       "WHERE path = ? AND size = ? AND "
+                                       "mtime = ? AND version = ?" % columns,
+                                       (os.path.abspath(log_file_path),
+                                        file_stat.st_size,
+                                        file_stat.st_mtime,
+                                        version)).fetchone()
+
+    def is_fresh(self, log_file_path, file_stat, 
+                 version=EVENT_FORMAT_VERSION):
+        """
+        @param log_file_path: The full path to the log file
+        @param file_stat: os.stat_result of the log file
+        @param version: The version of the EventKeys of the events
+        @return: True if the cache holds the events for this version of
+                 the log file
+        """
+        return self._find(log_file_path, file_stat, 'path', 
+                          version) is not None
+
+    def get(self, log_file_path, file_stat, version=EVENT_FORMAT_VERSION):
+        """
+        @param log_file_path: The full path to the log file
+        @param file_stat: os.stat_result of the log file
+        @param version: The version of the EventKeys of the events
+        @return: List of compacted log lines or None if the log file is
+                 not cached or has changed since
+        """
+        row = self._find(log_file_path, file_stat, 'events', version)
+        if row is None:
+            return None
+        self.connection.execute("UPDATE log_events SET last_used = ? "
+                                "WHERE path = ?", 
+                                (time.time(), os.path.abspath(log_file_path)))
+        return json.loads(zlib.decompress(row[0]).decode('utf-8'))
+
+    def put(self, log_file_path, file_stat, log_events, 
+            version=EVENT_FORMAT_VERSION):
+        """
+        Stores the events of a log file
+        @param log_file_path: The full path to the log file
+        @param file_stat: os.stat_result of the log file taken before it
+                          was read
+        @param log_events: List of compacted log lines
+        @param version: The version of the EventKeys of the events
+        """
+        blob = zlib.compress(json.dumps(log_events, 
+                                        separators=(',', ':')).encode('utf-8'))
+        self.connection.execute("INSERT OR REPLACE INTO log_events "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                (os.path.abspath(log_file_path),
+                                 file_stat.st_size,
+                                 file_stat.st_mtime,
+                                 version,
+                                 blob,
+                                 len(blob),
+                                 time.time()))
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the stored events
+        fit in max_size
+        """
+        total_size = self.connection.execute("SELECT COALESCE(SUM(blob_size), 0) "
+                                             "FROM log_events").fetchone()[0]
+        if total_size <= self.max_size:
+            return
+        evicted = []
+        for path, blob_size in self.connection.execute("SELECT path, blob_size "
+                                                       "FROM log_events "
+                                                       "ORDER BY last_used"):
+            if total_size <= self.max_size:
+                break
+            evicted.append((path,))
+            total_size -= blob_size
+        self.connection.execute("BEGIN")
+        self.connection.executemany("DELETE FROM log_events WHERE path = ?",
+                                    evicted)
+        self.connection.execute("COMMIT")
+
+    def close(self):
+        """
+        Evicts down to the size cap and closes the cache
+        """
+        self.evict()
+        self.connection.close()
@@ -0,0 +1,195 @@
+"""
+This file times the stages of cleaning a log folder and counts what was
+found in each log file, for working out where the time goes on a slow
+participant folder. A cProfile or a sampling profile can be dumped to a
+file as well.
+
+Nothing here is used unless profiling is asked for.
+"""
+from collections import Counter
+import cProfile
+import json
+import os
+import sys
+import time
+
+try:
+    import signal
+    _CAN_SAMPLE = hasattr(signal, 'setitimer')
+except ImportError:
+    _CAN_SAMPLE = False
+
+# Seconds of CPU time between the samples of the sampling profile
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+PROFILE_MODES = ('cprofile', 'sample')
+
+
+class StageTimer:
+    """
+    Adds the time spent inside a with block to a stage
+    """
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        stage = self.profiler.stages.setdefault(self.name, [0.0, 0])
+        stage[0] += time.perf_counter() - self._start
+        stage[1] += 1
+        return False
+
+
+class StackSampler:
+    """
+    Counts the call stacks found at regular intervals of CPU time. The
+    stacks are written in the collapsed form that flame graph tools read:
+    one line of 'file:function;file:function count' per stack.
+    Only works where signal.setitimer is available.
+    """
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        """
+        @param interval: Seconds of CPU time between samples
+        """
+        self.interval = interval
+        self.stacks = Counter()
+        self._old_handler = None
+
+    def _sample(self, signal_number, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append("%s:%s" % (os.path.basename(code.co_filename),
+                                    code.co_name))
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(stack))] += 1
+
+    def enable(self):
+        self._old_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def disable(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._old_handler or signal.SIG_DFL)
+
+    def dump_stats(self, path):
+        """
+        @param path: The file to write the collapsed stacks to
+        """
+        with open(path, 'w') as file_pointer:
+            for stack, count in self.stacks.most_common():
+                file_pointer.write("%s %d\n" % (stack, count))
+
+
+class Profiler:
+    """
+    Keeps the time spent in each stage of cleaning a log folder and the
+    counts of each log file read
+    """
+    def __init__(self, dump_path=None, mode='cprofile',
+                 sample_interval=DEFAULT_SAMPLE_INTERVAL):
+        """
+        @param dump_path: Optional file to dump the profile to
+        @param mode: 'cprofile' for a cProfile stats file or 'sample' for
+                     collapsed stacks from a sampling profile
+        @param sample_interval: Seconds of CPU time between samples
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError("Unknown profile mode %s" % mode)
+        if dump_path and mode == 'sample' and not _CAN_SAMPLE:
+            raise ValueError("The sampling profile is not available here")
+        self.dump_path = dump_path
+        self.mode = mode
+        self.sample_interval = sample_interval
+        # name : [seconds, calls]
+        self.stages = {}
+        self.files = []
+        self._profile = None
+        self._start = None
+        self._elapsed = None
+
+    def start(self):
+        """
+        Starts the overall timer and the profile if one is to be dumped
+        """
+        if self.dump_path:
+            if self.mode == 'sample':
+                self._profile = StackSampler(self.sample_interval)
+            else:
+                self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._start = time.perf_counter()
+
+    def stop(self):
+        """
+        Stops the timer and dumps the profile if there is one
+        """
+        self._elapsed = time.perf_counter() - self._start
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self.dump_path)
+            self._profile = None
+
+    def stage(self, name):
+        """
+        @param name: Name of the stage
+        @return: Context manager adding the time spent in it to the stage
+        """
+        return StageTimer(self, name)
+
+    def timed(self, name, function):
+        """
+        @param name: Name of the stage
+        @param function: The function to time
+        @return: function wrapped to add the time of each call to the stage
+        """
+        def timed_function(*args, **kwargs):
+            with self.stage(name):
+                return function(*args, **kwargs)
+        return timed_function
+
+    def add_file(self, log_file_path, file_stats, key_counts):
+        """
+        Records the counts of a log file
+        @param log_file_path: The full path to the log file
+        @param file_stats: dict of the bytes and the read counts of the file
+        @param key_counts: Counter of the log lines with each tracked key
+        """
+        file_summary = dict(file_stats)
+        file_summary['path'] = log_file_path
+        file_summary['events'] = dict(key_counts)
+        self.files.append(file_summary)
+
+    def summary(self):
+        """
+        @return: dict of the stage times, the counts of each log file and
+                 their totals
+        """
+        totals = Counter()
+        events = Counter()
+        for file_summary in self.files:
+            totals.update({name: count for name, count in file_summary.items()
+                                            if isinstance(count, int)})
+            events.update(file_summary['events'])
+        totals['events'] = dict(events)
+        return {'elapsed': self._elapsed,
+                'stages': {name: {'seconds': seconds, 'calls': calls}
+                                for name, (seconds, calls)
+                                                in self.stages.items()},
+                'totals': dict(totals),
+                'files': self.files,
+                'profile': self.dump_path,
+                'profile_mode': self.mode if self.dump_path else None}
+
+    def write_summary(self, output=sys.stderr):
+        """
+        Writes the summary as a single line of json
+        @param output: The file to write to, stderr so the report on
+                       stdout is left as it is
+        """
+        output.write(json.dumps(self.summary(), sort_keys=True) + "\n")
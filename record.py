@@ -1,14 +1,26 @@
 """
 This file defines the classes that need to be recorded
 """
+from collections import Counter
 from datetime import timedelta
+from sys import intern
+
+from anim_sentiment import classify_animation
 
 STANDARD_SESSIONS_START = timedelta(minutes=2)
 
+# Time without interaction after which a new play session starts
+SESSION_GAP = timedelta(minutes=15)
+
 class GameDetails:
     """
     Records the details of each type of game played
     """
+    __slots__ = ('name', 'start_count', 'cozmo_win_count', 'cozmo_lose_count',
+                 'neutral_outcome', 'game_abort_count', 'game_animations',
+                 'positive_animations', 'negative_animations',
+                 'mixed_neutral_animations')
+    
     def __init__(self):
         self.name = None
         self.start_count = 1
@@ -16,7 +28,7 @@ class GameDetails:
         self.cozmo_lose_count = 0
         self.neutral_outcome = 0
         self.game_abort_count = 0
-        self.game_animations = {}
+        self.game_animations = Counter()
         self.positive_animations = 0
         self.negative_animations= 0
         self.mixed_neutral_animations = 0
@@ -25,37 +37,52 @@ class FreeplayDetails:
     """
     Records the details of 
     """
+    __slots__ = ('name', 'start_count')
+    
     def __init__(self):
         self.name = None
         self.start_count = 1       
         
 class SessionData:   
+    """
+    Records everything of interest that happened in one play session.
+    The unlocked games and features, recognized faces and daily challenges
+    are kept as dicts with no values, which work as sets that remember
+    the order things were first seen in
+    """
+    __slots__ = ('session_time', 'current_game_name', 'current_game_id',
+                 'play_time', 'play_sessions', 'games_unlocked',
+                 'features_unlocked', 'animations_played', 
+                 'positive_animations', 'negative_animations',
+                 'mixed_neutral_animations', 'face_enrolled', 
+                 'face_recognized', 'unknown_face_count', 'pets_recorded',
+                 'freeplay_record', 'goal_progress', 'daily_challenge',
+                 'robot_requests', 'game_record')
     
-    # This is for communicating between last log file analysed
-    # and this log file
-    
-    def __init__(self, record_time, session_id):
+    def __init__(self, record_time, session_id, 
+                 play_time=STANDARD_SESSIONS_START):
         self.session_time = record_time
+        # This is for communicating between last log file analysed
+        # and this log file
         self.current_game_name = None
         self.current_game_id = None
-        self.details = { 'play_time': STANDARD_SESSIONS_START,
-                            'play_sessions': session_id + 1,
-                            'games_unlocked': [],
-                            'features_unlocked': [],
-                            'animations_played':{},
-                            'positive_animations':0,
-                            'negative_animations':0,
-                            'mixed_neutral_animations':0,
-                            'face_enrolled': [],
-                            'face_recognized': [],
-                            'unknown_face_count': 0,
-                            'pets_recorded': {},
-                            'freeplay_record': {},
-                            'goal_progress': [],
-                            'daily_challenge': [],
-                            'robot_requests':{},
-                            'game_record':{}
-                          }
+        self.play_time = play_time
+        self.play_sessions = session_id + 1
+        self.games_unlocked = {}
+        self.features_unlocked = {}
+        self.animations_played = Counter()
+        self.positive_animations = 0
+        self.negative_animations = 0
+        self.mixed_neutral_animations = 0
+        self.face_enrolled = []
+        self.face_recognized = {}
+        self.unknown_face_count = 0
+        self.pets_recorded = Counter()
+        self.freeplay_record = {}
+        self.goal_progress = []
+        self.daily_challenge = {}
+        self.robot_requests = Counter()
+        self.game_record = {}
     
     def add_time(self, time_gap):
         """
@@ -64,10 +91,10 @@ class SessionData:
         @param time_gap: time_delta giving the time to add
         """
         if time_gap:
-            self.details['play_time'] += time_gap
+            self.play_time += time_gap
         else:
-            self.details['play_time'] += STANDARD_SESSIONS_START
-            self.details['play_sessions'] += 1
+            self.play_time += STANDARD_SESSIONS_START
+            self.play_sessions += 1
             
     def add_update_pet(self, pet_type):
         """
@@ -76,95 +103,22 @@ class SessionData:
         @param pet_type: string giving the type of pet that cozmo has
                          detected        
         """
-        if pet_type in self.details['pets_recorded']:
-            self.details['pets_recorded'][pet_type] += 1
-        else:
-            self.details['pets_recorded'][pet_type]  = 1
+        self.pets_recorded[pet_type] += 1
             
     def add_update_request(self, request_type):
         """
-        Records the number of times it cozmo detects a particular
-        type of pet
-        @param pet_type: string giving the type of pet that cozmo has
-                         detected        
+        Records the number of times cozmo makes a particular request
+        @param request_type: string giving the animation of the request
         """
-        if request_type in self.details['robot_requests']:
-            self.details['robot_requests'][request_type] += 1
-        else:
-            self.details['robot_requests'][request_type]  = 1
+        self.robot_requests[intern(request_type)] += 1
     
     def anim_analysis(self, anim_name):
-        anim_id = 0    
-        positive_anim_strings = ['admire',
-                                 'ask',
-                                'celebrat',
-                                'find',
-                                'found',
-                                'giggle',
-                                'happy',
-                                'hello',
-                                'highenergy',
-                                'ideatoplay',
-                                'like',
-                                'newarea',
-                                'petdetection',
-                                'playeryes',
-                                'request',
-                                'reacttocube',
-                                'reenrollment',
-                                'thankyou',
-                                'upgrade',
-                                'wheely',
-                                'wiggle',
-                                'turbo'
-                                ]
-        negative_anim_strings = ['badword',
-                                 'bored',
-                                 'dizzy',
-                                 'frustrated',
-                                 'lowenergy',
-                                 'match_no',
-                                 'playerno', 
-                                 'struggle',
-                                 'stuck',
-                                 'upset',
-                                 'turtleroll',
-                                 'hiccup']
-        if 'cure' in anim_name:
-            # To handle cure of hiccups
-            anim_id = 1
-        if 'win' in anim_name or 'success' in anim_name:
-            if 'player' in anim_name and not 'solo' in anim_name:
-                anim_id = -1
-            else:
-                anim_id = 1
-        elif 'lose' in anim_name or 'fail' in anim_name:
-            if 'player' in anim_name and not 'solo' in anim_name:
-                anim_id = 1
-            else:
-                anim_id = -1
-        elif 'reacttoface' in  anim_name and not 'unidentified' in anim_name:
-            # positive reactions seems to be for known people only
-            anim_id = 1
-        elif 'petdetection' in anim_name and 'misc' in anim_name: 
-            # the sneeze
-            anim_id = -1
-            
-            
-        if not anim_id:
-            # So if we have not already decided 
-            for anim_string in positive_anim_strings:
-                if anim_string in anim_name:
-                    anim_id = 1
-                    break
-                
-        if not anim_id:
-            # So if we have not already decided 
-            for anim_string in negative_anim_strings:
-                if anim_string in anim_name:
-                    anim_id = -1
-                    break
-        return anim_id
+        """
+        Works out if an animation is positive (1), negative (-1) or 
+        mixed/neutral (0)
+        @param anim_name: The name of the animation
+        """
+        return classify_animation(anim_name)
 
         
     def record_animation(self, game_name, animation_name):
@@ -176,13 +130,15 @@ class SessionData:
                           this animation is being played
         @param animation_name: The name of the animation to record 
         """
+        # The same few animation names are shared by every session
+        animation_name = intern(animation_name)
         anim_id = self.anim_analysis(animation_name)
         if game_name:
             # This animation is part of the game
-            if game_name not in self.details['game_record']:
-                self.details['game_record'][game_name] = GameDetails()
-                self.details['game_record'][game_name].name = game_name
-            game_record = self.details['game_record'][game_name]
+            game_record = self.game_record.get(game_name)
+            if game_record is None:
+                game_record = self.game_record[game_name] = GameDetails()
+                game_record.name = game_name
             if animation_name in game_record.game_animations:
                 game_record.game_animations[animation_name] += 1
                 if anim_id > 0:
@@ -195,16 +151,13 @@ class SessionData:
                 game_record.game_animations[animation_name] = 1
         else:
             if anim_id > 0:
-                self.details['positive_animations'] += 1
+                self.positive_animations += 1
             elif anim_id < 0:
-                self.details['negative_animations'] += 1
+                self.negative_animations += 1
             else:
-                self.details['mixed_neutral_animations'] += 1
+                self.mixed_neutral_animations += 1
                 
-            if animation_name in self.details['animations_played']:
-                self.details['animations_played'][animation_name] += 1
-            else:
-                self.details['animations_played'][animation_name] = 1
+            self.animations_played[animation_name] += 1
     
     def create_or_update_game(self, game_name):
         """
@@ -213,11 +166,12 @@ class SessionData:
         @param game_name: String giving the name of the game the player
                           started
         """
-        if game_name not in self.details['game_record']:
-            self.details['game_record'][game_name] = GameDetails()
-            self.details['game_record'][game_name].name = game_name
+        game_name = intern(game_name)
+        if game_name not in self.game_record:
+            self.game_record[game_name] = GameDetails()
+            self.game_record[game_name].name = game_name
         else:
-            self.details['game_record'][game_name].start_count += 1
+            self.game_record[game_name].start_count += 1
         self.current_game_name = game_name
         self.current_game_id = None
         return self
@@ -233,11 +187,11 @@ class SessionData:
         """
         if game_name:
             if game_result == 0:
-                self.details['game_record'][game_name].neutral_outcome += 1
+                self.game_record[game_name].neutral_outcome += 1
             elif game_result < 0:
-                self.details['game_record'][game_name].cozmo_lose_count += 1
+                self.game_record[game_name].cozmo_lose_count += 1
             else:
-                self.details['game_record'][game_name].cozmo_win_count += 1
+                self.game_record[game_name].cozmo_win_count += 1
             self.current_game_name = None
             self.current_game_id = None
             
@@ -247,135 +201,160 @@ class SessionData:
         this method is used to record aborting the previous game
         @param game_name: String naming the game that was aborted 
         """
-        if game_name in self.details['game_record']:
-            self.details['game_record'][game_name].game_abort_count += 1
+        if game_name in self.game_record:
+            self.game_record[game_name].game_abort_count += 1
         return self
         
     def update_record_list(self, record, new_list):
         """
-        Adds the incoming value to the existing list for the given
+        Adds the incoming values to the existing set for the given
         record
         @param record: string identifyinng the record to update
-        @param new_list: string identifying the new list to append to the record list
+        @param new_list: list of the values to add to the record
         """
-        self.details[record] = self.details[record] + new_list
+        getattr(self, record).update(dict.fromkeys(new_list))
         
     def update_record_set(self, record, record_string):
         """
         Adds the incoming value to the existing set for the given
         record if it doea not exist
         @param record: string identifyinng the record to update
-        @param record_string: string identifying the new list to append to the record list
+        @param record_string: string giving the value to add to the record
         """
-        if record_string not in self.details[record]:
-            self.details[record].append(record_string)
+        getattr(self, record).setdefault(record_string)
         
     def add_goal_progress(self, goal_title):
         """
         Records daily goals that were completed by the player
         @param goal_title: String giving the goal that was achieved  
         """
-        self.details['goal_progress'].append(goal_title.replace("dailyGoal.title.",
-                                                                ""))
+        self.goal_progress.append(goal_title.replace("dailyGoal.title.",
+                                                     ""))
     def create_or_update_free_play(self, free_play_name):
         """
         Records free play activites and how many time they were started
         @param free_play_name: The String giving the free play activity that was triggered
                                by cozmo
         """
-        if free_play_name not in self.details['freeplay_record']:
-            self.details['freeplay_record'][free_play_name] = FreeplayDetails()
-            self.details['freeplay_record'][free_play_name].name = free_play_name
+        if free_play_name not in self.freeplay_record:
+            self.freeplay_record[free_play_name] = FreeplayDetails()
+            self.freeplay_record[free_play_name].name = free_play_name
         else:
-            self.details['freeplay_record'][free_play_name].start_count += 1
+            self.freeplay_record[free_play_name].start_count += 1
 
-    def formatted_print(self):
+    def format_text(self):
         """
-        Prints information gathered in a predefined format on screen
+        Formats the information gathered in the predefined report format
+        @return: The text of the report of the session
         """
-        print("Play Sessions                : %s" % self.details['play_sessions'])
-        print("Time                         : %s" % self.session_time)
-        print("Played for (Hours:Min:Sec)   : %s" % self.details['play_time'])
-        print("Face Enrolled                : %s" % self.details['face_enrolled'])
-        print("Face Recognized              : %s" % list(set(self.details['face_recognized'])))
-        print("Unknown Face Count           : %s" % self.details['unknown_face_count'])
-        print("Pets Recorded                : %s" % self.details['pets_recorded'])
-        print("Games Unlocked               : %s" % list(set(self.details['games_unlocked'])))
-        print("Features Unlocked            : %s" % list(set(self.details['features_unlocked'])))
-        print("Daily Challenge              : %s" % list(set(self.details['daily_challenge'])))
-        print("Daily Goal Progress          : %s" % list(set(self.details['goal_progress'])))
+        lines = []
+        lines.append("Play Sessions                : %s" % self.play_sessions)
+        lines.append("Time                         : %s" % self.session_time)
+        lines.append("Played for (Hours:Min:Sec)   : %s" % self.play_time)
+        lines.append("Face Enrolled                : %s" % self.face_enrolled)
+        lines.append("Face Recognized              : %s" % list(set(iter(self.face_recognized))))
+        lines.append("Unknown Face Count           : %s" % self.unknown_face_count)
+        lines.append("Pets Recorded                : %s" % dict(self.pets_recorded))
+        lines.append("Games Unlocked               : %s" % list(set(iter(self.games_unlocked))))
+        lines.append("Features Unlocked            : %s" % list(set(iter(self.features_unlocked))))
+        lines.append("Daily Challenge              : %s" % list(set(iter(self.daily_challenge))))
+        lines.append("Daily Goal Progress          : %s" % list(set(self.goal_progress)))
         
-        print("Cozmo Requests               : ")
-        for request, count in self.details['robot_requests'].items():
-            print("                         %s      : %d"  % (request,
-                                                              count)) 
+        lines.append("Cozmo Requests               : ")
+        for request, count in self.robot_requests.items():
+            lines.append("                         %s      : %d"  % (request,
+                                                                     count)) 
         
         
         # Game Play Records
-        print("Game Records                 :")
-        for name, game_details in  self.details['game_record'].items():
-            print("                         Type              : %s"  % name)
-            print("                         Play Sessions     : %d"  % game_details.start_count)
-            print("                         Cozmo Wins        : %d"  % game_details.cozmo_win_count)
-            print("                         Cozmo Lose        : %d"  % game_details.cozmo_lose_count)
-            print("                         Neutral           : %d"  % game_details.neutral_outcome)
-            print("                         Game Aborts       : %d"  % game_details.game_abort_count)
-            print("                         Game Positive Anim : %d"  % game_details.positive_animations)
-            print("                         Game Negative Anim : %d"  % game_details.negative_animations)
-            print("                         Game MixedNeutral Anim : %d"  % game_details.mixed_neutral_animations)
-            print("                         Game Animations   :") 
+        lines.append("Game Records                 :")
+        for name, game_details in  self.game_record.items():
+            lines.append("                         Type              : %s"  % name)
+            lines.append("                         Play Sessions     : %d"  % game_details.start_count)
+            lines.append("                         Cozmo Wins        : %d"  % game_details.cozmo_win_count)
+            lines.append("                         Cozmo Lose        : %d"  % game_details.cozmo_lose_count)
+            lines.append("                         Neutral           : %d"  % game_details.neutral_outcome)
+            lines.append("                         Game Aborts       : %d"  % game_details.game_abort_count)
+            lines.append("                         Game Positive Anim : %d"  % game_details.positive_animations)
+            lines.append("                         Game Negative Anim : %d"  % game_details.negative_animations)
+            lines.append("                         Game MixedNeutral Anim : %d"  % game_details.mixed_neutral_animations)
+            lines.append("                         Game Animations   :") 
             for anim_name, count in game_details.game_animations.items():
-                print("                                     %s      : %d"  % (anim_name,
-                                                                              count))
+                lines.append("                                     %s      : %d"  % (anim_name,
+                                                                                     count))
         
         # General free play record
-        print("Free Play Records            :")
-        for name, free_play in self.details['freeplay_record'].items():
-            print("                         %s      : %d"  % (name,
-                                                              free_play.start_count)) 
+        lines.append("Free Play Records            :")
+        for name, free_play in self.freeplay_record.items():
+            lines.append("                         %s      : %d"  % (name,
+                                                                     free_play.start_count)) 
               
         
         
         # General Animation Record
-        print("Postive animations            : %d" % self.details['positive_animations'])
-        print("Negative animations           : %d" % self.details['negative_animations'])
-        print("Mixed Neutral animations      : %d" % self.details['mixed_neutral_animations'])
-        print("Animation Played             :")
-        for anim_name, count in self.details['animations_played'].items():
+        lines.append("Postive animations            : %d" % self.positive_animations)
+        lines.append("Negative animations           : %d" % self.negative_animations)
+        lines.append("Mixed Neutral animations      : %d" % self.mixed_neutral_animations)
+        lines.append("Animation Played             :")
+        for anim_name, count in self.animations_played.items():
             
-            print("                         %s      : %d"  % (anim_name,
-                                                              count))
+            lines.append("                         %s      : %d"  % (anim_name,
+                                                                     count))
+        return "\n".join(lines) + "\n"
+
+    def formatted_print(self):
+        """
+        Prints information gathered in a predefined format on screen
+        """
+        print(self.format_text(), end="")
               
         
 class DailyData:
-    def __init__(self, record_date_time):
+    def __init__(self, record_date_time, lead_time=STANDARD_SESSIONS_START):
+        """
+        @param record_date_time: datetime of the first log of the day
+        @param lead_time: timedelta of play assumed before the first log of
+                          each session. Zero when sessions are timed from 
+                          the log lines themselves
+        """
         self.record_date = "%s" % record_date_time.date()
         self.sessions_record = []
         self.current_session_id = 0
+        self.lead_time = lead_time
         
-        session_start_time = record_date_time - STANDARD_SESSIONS_START 
+        session_start_time = record_date_time - lead_time 
         self.sessions_record.append(SessionData("%s" % session_start_time.time(),
-                                                self.current_session_id))
+                                                self.current_session_id,
+                                                lead_time))
           
     def get_new_session(self, record_date_time):
         self.current_session_id += 1
-        session_start_time = record_date_time - STANDARD_SESSIONS_START 
+        session_start_time = record_date_time - self.lead_time 
         self.sessions_record.append(SessionData("%s" % session_start_time.time(),
-                                                self.current_session_id))
+                                                self.current_session_id,
+                                                self.lead_time))
         return self.sessions_record[self.current_session_id]
         
     def get_current_session(self):
         return self.sessions_record[self.current_session_id]
     
+    def format_text(self):
+        """
+        Formats the information gathered in the predefined report format
+        @return: The text of the report of the day
+        """
+        parts = ["Date                         : %s\n" % self.record_date,
+                 "Sessions Played              : %d\n" % (self.current_session_id+1)]
+        for i in range(0,self.current_session_id+1):
+            parts.append("-------------------------------------------------------------------------------------\n")
+            parts.append(self.sessions_record[i].format_text())
+            parts.append("-------------------------------------------------------------------------------------\n")
+        return "".join(parts)
+    
     def formatted_print(self):
         """
         Prints information gathered in a predefined format on screen
         """
-        print("Date                         : %s" % self.record_date)
-        print("Sessions Played              : %d" % (self.current_session_id+1))
-        for i in range(0,self.current_session_id+1):
-            print("-------------------------------------------------------------------------------------")
-            self.sessions_record[i].formatted_print()
-            print("-------------------------------------------------------------------------------------")
+        print(self.format_text(), end="")
         
                
\ No newline at end of file
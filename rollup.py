@@ -0,0 +1,278 @@
+"""
+This file rolls the events collected by an EventLog up into counts per
+fixed time bucket, for engagement curves of a participant: animations of
+each sentiment, game starts and results and face recognitions per minute,
+15 minutes, hour or day.
+
+Every animation played is counted, in a game or not, and a game start is
+a game.launch event. So the animation counts add up to more than the 
+session totals of the report, which leave out the animations of games.
+
+The 1 minute counts are made in one pass over the event columns, from the
+start of the first day with an event to the end of the last. Every coarser
+resolution is summed from the one below it rather than from the events,
+and all of them are kept, so a time range is read from any resolution by
+slicing out its buckets.
+
+numpy is needed to build, save and load the rollups.
+
+Usage:
+    python clean_log.py Participants/P005 --rollup P005_rollup.npz
+    python rollup.py P005_rollup.npz --resolution 15min
+        --from 2017-07-03T09:00 --to 2017-07-03T18:00
+"""
+import argparse
+from datetime import datetime
+import math
+import sys
+
+from anim_sentiment import MIXED_NEUTRAL, NEGATIVE, POSITIVE
+from export import ANIMATION_KEY, GAME_END_KEY
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ROLLUP_AVAILABLE = numpy is not None
+
+# Name and length in seconds of each resolution, each a whole number of
+# the one before it
+RESOLUTIONS = (('1min', 60),
+               ('15min', 15 * 60),
+               ('1h', 60 * 60),
+               ('1day', 24 * 60 * 60))
+
+RESOLUTION_SECONDS = dict(RESOLUTIONS)
+
+ROLLUP_METRICS = ('positive_animations', 'negative_animations',
+                  'mixed_neutral_animations', 'game_starts', 'cozmo_wins',
+                  'cozmo_losses', 'face_recognitions')
+
+GAME_LAUNCH_KEY = 'game.launch'
+FACE_RECOGNIZED_KEY = 'robot.vision.face_recognition.re_recognized'
+
+_EPOCH = datetime(1970, 1, 1)
+
+_DAY_MINUTES = RESOLUTION_SECONDS['1day'] // 60
+
+
+def event_metrics(event_log):
+    """
+    Works out which metric each event of an EventLog counts towards
+    @param event_log: The EventLog collected while the usage log was built
+    @return: numpy array of the index in ROLLUP_METRICS of each event,
+             -1 for the events no metric counts
+    """
+    event_types = numpy.asarray(event_log.event_type, dtype=numpy.int32)
+    sentiment = numpy.frombuffer(event_log.sentiment, dtype=numpy.int8)
+    result = numpy.frombuffer(event_log.result, dtype=numpy.int8)
+    codes = event_log.event_types.codes
+
+    def is_event(key):
+        return event_types == codes.get(key, -2)
+
+    metrics = numpy.full(len(event_types), -1, dtype=numpy.int8)
+    animation = is_event(ANIMATION_KEY)
+    game_end = is_event(GAME_END_KEY)
+    for metric, events in (('positive_animations',
+                                        animation & (sentiment == POSITIVE)),
+                           ('negative_animations',
+                                        animation & (sentiment == NEGATIVE)),
+                           ('mixed_neutral_animations',
+                                animation & (sentiment == MIXED_NEUTRAL)),
+                           ('game_starts', is_event(GAME_LAUNCH_KEY)),
+                           # The result is -1 when cozmo lost
+                           ('cozmo_wins', game_end & (result == 1)),
+                           ('cozmo_losses', game_end & (result == -1)),
+                           ('face_recognitions',
+                                        is_event(FACE_RECOGNIZED_KEY))):
+        metrics[events] = ROLLUP_METRICS.index(metric)
+    return metrics
+
+
+class EngagementRollup:
+    """
+    Counts of each metric per bucket at every resolution, all starting at
+    the same midnight
+    """
+    def __init__(self, start_time, counts):
+        """
+        @param start_time: Seconds since the epoch of the first bucket
+        @param counts: dict of numpy arrays by resolution name, one row
+                       per bucket and one column per metric
+        """
+        self.start_time = start_time
+        self.counts = counts
+
+    def query(self, start=None, end=None, resolution='15min', metrics=None):
+        """
+        @param start: UTC datetime the range starts at, or None for the
+                      first bucket
+        @param end: UTC datetime the range ends before, or None for the
+                    last bucket
+        @param resolution: One of the names in RESOLUTIONS
+        @param metrics: Names of the metrics wanted, all if not given
+        @return: Tuple of a numpy datetime64 array of the start of each
+                 bucket overlapping the range and the numpy array of their
+                 counts, one column per metric
+        """
+        if resolution not in RESOLUTION_SECONDS:
+            raise ValueError("Unknown resolution %s" % resolution)
+        seconds = RESOLUTION_SECONDS[resolution]
+        counts = self.counts[resolution]
+        first = 0
+        if start is not None:
+            first = max(0, (_epoch_seconds(start) - self.start_time)
+                                                                // seconds)
+        last = len(counts)
+        if end is not None:
+            last = min(last, math.ceil((_epoch_seconds(end) -
+                                        self.start_time) / seconds))
+        last = max(first, last)
+        columns = [ROLLUP_METRICS.index(metric)
+                            for metric in (metrics or ROLLUP_METRICS)]
+        bucket_times = (numpy.arange(first, last, dtype=numpy.int64) *
+                                        seconds + self.start_time)
+        return (bucket_times.astype('datetime64[s]'),
+                counts[first:last, columns])
+
+
+def _epoch_seconds(time):
+    """
+    @param time: A UTC datetime
+    @return: Whole seconds since the epoch
+    """
+    return int((time - _EPOCH).total_seconds())
+
+def build_rollup(event_log):
+    """
+    Counts the events of an EventLog per minute and rolls the counts up
+    to the coarser resolutions. Events without a $ts are left out.
+    @param event_log: The EventLog collected while the usage log was built
+    @return: The EngagementRollup of the events
+    """
+    if numpy is None:
+        raise RuntimeError("numpy is needed for the rollups")
+    metric_count = len(ROLLUP_METRICS)
+    timestamps = numpy.frombuffer(event_log.timestamp, dtype=numpy.int64)
+    metrics = event_metrics(event_log)
+    counted = (metrics >= 0) & (timestamps >= 0)
+    minutes = timestamps[counted] // 60000
+    if not len(minutes):
+        return rollup_minutes(0, numpy.zeros((0, metric_count),
+                                             dtype=numpy.int32))
+    start_minute = minutes.min() // _DAY_MINUTES * _DAY_MINUTES
+    day_count = (minutes.max() - start_minute) // _DAY_MINUTES + 1
+    buckets = (minutes - start_minute) * metric_count + metrics[counted]
+    minute_counts = numpy.bincount(buckets, minlength=day_count *
+                                            _DAY_MINUTES * metric_count)
+    return rollup_minutes(int(start_minute) * 60,
+                          minute_counts.astype(numpy.int32)
+                                       .reshape(-1, metric_count))
+
+def rollup_minutes(start_time, minute_counts):
+    """
+    @param start_time: Seconds since the epoch of the first minute, which
+                       is at midnight
+    @param minute_counts: numpy array of the counts of each minute, a
+                          whole number of days long
+    @return: The EngagementRollup with each resolution summed from the one
+             below it
+    """
+    counts = {}
+    finer_counts = minute_counts
+    finer_seconds = RESOLUTIONS[0][1]
+    for resolution, seconds in RESOLUTIONS:
+        if seconds != finer_seconds:
+            finer_counts = finer_counts.reshape(-1, seconds // finer_seconds,
+                                                len(ROLLUP_METRICS)).sum(
+                                                        axis=1,
+                                                        dtype=numpy.int32)
+            finer_seconds = seconds
+        counts[resolution] = finer_counts
+    return EngagementRollup(start_time, counts)
+
+def save_rollup(rollup_path, rollup):
+    """
+    Writes every resolution of a rollup to an uncompressed .npz file
+    @param rollup_path: Path of the .npz file
+    @param rollup: The EngagementRollup to write
+    """
+    arrays = {'counts.' + resolution: counts
+                        for resolution, counts in rollup.counts.items()}
+    numpy.savez(rollup_path, start_time=numpy.int64(rollup.start_time),
+                metrics=numpy.array(ROLLUP_METRICS, dtype=numpy.str_),
+                **arrays)
+
+def load_rollup(rollup_path):
+    """
+    @param rollup_path: Path of the .npz file written by save_rollup
+    @return: The EngagementRollup read back
+    """
+    if numpy is None:
+        raise RuntimeError("numpy is needed for the rollups")
+    with numpy.load(rollup_path) as rollup_file:
+        if tuple(rollup_file['metrics']) != ROLLUP_METRICS:
+            raise ValueError("%s has other metrics than %s" %
+                                (rollup_path, ", ".join(ROLLUP_METRICS)))
+        return EngagementRollup(int(rollup_file['start_time']),
+                                {resolution:
+                                    rollup_file['counts.' + resolution]
+                                        for resolution, seconds
+                                                        in RESOLUTIONS})
+
+def _parse_time(text):
+    """
+    @param text: YYYY-MM-DD or YYYY-MM-DDTHH:MM
+    @return: The datetime
+    """
+    for time_format in ('%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(text, time_format)
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError("%s is not YYYY-MM-DD or "
+                                     "YYYY-MM-DDTHH:MM" % text)
+
+def print_rollup(rollup, start=None, end=None, resolution='15min',
+                 metrics=None, output=sys.stdout):
+    """
+    Prints the buckets of a time range as tab separated rows
+    @param rollup: The EngagementRollup
+    @param start: UTC datetime the range starts at or None
+    @param end: UTC datetime the range ends before or None
+    @param resolution: One of the names in RESOLUTIONS
+    @param metrics: Names of the metrics to print, all if not given
+    @param output: The file to print to
+    """
+    metrics = metrics or ROLLUP_METRICS
+    bucket_times, counts = rollup.query(start, end, resolution, metrics)
+    print("\t".join(('time',) + tuple(metrics)), file=output)
+    for bucket_time, row in zip(bucket_times, counts):
+        print("%s\t%s" % (bucket_time, "\t".join("%d" % count
+                                                    for count in row)),
+              file=output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prints the engagement "
+                                                 "counts of a rollup written "
+                                                 "by clean_log.py --rollup")
+    parser.add_argument('rollup', help="The .npz file of the rollup")
+    parser.add_argument('--resolution', choices=[resolution for resolution,
+                                                 seconds in RESOLUTIONS],
+                        default='15min',
+                        help="Length of each bucket (default %(default)s)")
+    parser.add_argument('--from', dest='start', type=_parse_time,
+                        help="UTC time to start at, YYYY-MM-DD or "
+                             "YYYY-MM-DDTHH:MM")
+    parser.add_argument('--to', dest='end', type=_parse_time,
+                        help="UTC time to end before")
+    parser.add_argument('--metrics', nargs='+', choices=ROLLUP_METRICS,
+                        help="Metrics to print, all if not given")
+    args = parser.parse_args()
+    if not ROLLUP_AVAILABLE:
+        parser.error("numpy is needed for the rollups")
+    print_rollup(load_rollup(args.rollup), args.start, args.end,
+                 args.resolution, args.metrics)
@@ -0,0 +1,68 @@
+"""
+This file groups log lines into days and play sessions by the time each
+log line was written ($ts) rather than by the times of the log files.
+
+The log lines of all the files are merged in ($ts, $seq) order without
+reading the files in whole, and a new session starts wherever there is a
+gap of SESSION_GAP without any logged event.
+"""
+from datetime import datetime, timedelta
+import heapq
+
+from record import DailyData, SESSION_GAP
+
+
+def log_line_order(log_line):
+    """
+    @param log_line: dict of a decoded log line carrying $ts
+    @return: Tuple to sort log lines in the order they were written
+    """
+    return (int(log_line['$ts']), int(log_line.get('$seq', 0)))
+
+def log_line_time(log_line):
+    """
+    @param log_line: dict of a decoded log line carrying $ts
+    @return: UTC datetime the log line was written
+    """
+    return datetime.utcfromtimestamp(int(log_line['$ts']) / 1000.0)
+
+def merge_log_data(log_data_streams):
+    """
+    Merges the log lines of several log files in the order they were
+    written. Each file is only read as far as the merge has got to.
+    Log lines without a $ts are left out.
+    @param log_data_streams: iterable of iterables of log lines, each in
+                             written order
+    @return: Iterator over all the log lines in written order
+    """
+    timed_streams = [(log_line for log_line in log_data if '$ts' in log_line)
+                                            for log_data in log_data_streams]
+    return heapq.merge(*timed_streams, key=log_line_order)
+
+def assign_sessions(log_lines, usage_log, session_gap=SESSION_GAP):
+    """
+    Works out the day and session each log line belongs to, adding the
+    days and sessions to the usage log as they are reached. Play time is 
+    the time between the log lines of a session.
+    @param log_lines: iterable of log lines in written order
+    @param usage_log: dict of DailyData by date string, updated in place
+    @param session_gap: timedelta of inactivity that starts a new session
+    @return: Generator of (session_record, log_line) pairs
+    """
+    session_record = None
+    last_log_time = None
+    for log_line in log_lines:
+        cur_log_time = log_line_time(log_line)
+        date_string = "%s" % cur_log_time.date()
+        if not date_string in usage_log:
+            usage_log[date_string] = DailyData(cur_log_time, timedelta(0))
+            session_record = usage_log[date_string].get_current_session()
+        else:
+            time_gap = cur_log_time - last_log_time
+            if time_gap >= session_gap:
+                session_record = usage_log[date_string].get_new_session(
+                                                                cur_log_time)
+            elif time_gap > timedelta(0):
+                session_record.add_time(time_gap)
+        last_log_time = cur_log_time
+        yield session_record, log_line
@@ -0,0 +1,163 @@
+"""
+This file saves the usage log built by get_usage_details, so a later run
+on the same participant folder only reads the log files added since and
+carries on from where the last run stopped.
+
+The snapshot holds the DailyData of every day, with the current session
+and the game being played in it, the time of the last log file and the
+size and modification time of each log file read. It only covers the
+closed log files. Once a log file still being written (NN.das_inprogress)
+is reached the state is kept as it was before it, as the file will be
+read again once it is closed. If a log file in the snapshot has changed
+or gone, or a new log file is older than the ones already read, the
+usage log is built again from the start.
+
+With duplicate log lines dropped the $seq ranges already seen are saved
+as well, so log lines of new files copied from old ones are dropped.
+"""
+import os
+import pickle
+
+from dedup import DuplicateFilter
+from events import EVENT_FORMAT_VERSION
+from follow import IN_PROGRESS_SUFFIX
+
+# Changed whenever what is pickled in a snapshot changes
+SNAPSHOT_VERSION = 2
+
+
+class UsageSnapshot:
+    """
+    The usage log of a log folder and the log files it was built from
+    """
+    def __init__(self, log_dir, dedup=False):
+        """
+        @param log_dir: The log folder the usage log is built from
+        @param dedup: If True the usage log is built with a DuplicateFilter
+                      that is saved with it
+        """
+        self.log_dir = os.path.abspath(log_dir)
+        self.usage_log = {}
+        self.last_log_time = None
+        # abspath : (size, mtime)
+        self.log_files = {}
+        self.duplicate_filter = DuplicateFilter() if dedup else None
+        self.rebuilt = False
+        self._saved_state = None
+
+    def reset(self):
+        """
+        Drops the usage log so it is built again from the start
+        """
+        self.usage_log = {}
+        self.last_log_time = None
+        self.log_files = {}
+        if self.duplicate_filter is not None:
+            # Cleared in place as get_usage_details may already hold it
+            self.duplicate_filter.clear()
+        self.rebuilt = True
+        self._saved_state = None
+
+    def new_log_files(self, sorted_log_file_path):
+        """
+        Works out which log files still have to be read, resetting the
+        snapshot if it cannot be carried on from
+        @param sorted_log_file_path: List of (mtime, path) of the log files
+                                     of the folder in time order
+        @return: List of (mtime, path) of the log files to read
+        """
+        new_log_file_path = []
+        found = 0
+        for fdate, fpath in sorted_log_file_path:
+            file_key = self.log_files.get(os.path.abspath(fpath))
+            if file_key is None:
+                new_log_file_path.append((fdate, fpath))
+                continue
+            file_stat = os.stat(fpath)
+            if new_log_file_path or \
+                        file_key != (file_stat.st_size, file_stat.st_mtime):
+                # Changed, or a new log file goes before it
+                break
+            found += 1
+        else:
+            if found == len(self.log_files):
+                return new_log_file_path
+        self.reset()
+        return list(sorted_log_file_path)
+
+    def add_log_file(self, log_file_path, last_log_time):
+        """
+        Records a log file about to be read. The state is kept as it is
+        now at the first log file that is still being written.
+        @param log_file_path: The full path to the log file
+        @param last_log_time: datetime of the last log file put in a 
+                              session before this one
+        """
+        if self._saved_state is not None:
+            return
+        self.last_log_time = last_log_time
+        if log_file_path.endswith(IN_PROGRESS_SUFFIX):
+            self._saved_state = self.dumps()
+            return
+        file_stat = os.stat(log_file_path)
+        self.log_files[os.path.abspath(log_file_path)] = \
+                                    (file_stat.st_size, file_stat.st_mtime)
+
+    def dumps(self):
+        """
+        @return: The pickled usage log, last log time and log files
+        """
+        return pickle.dumps({'version': (SNAPSHOT_VERSION,
+                                         EVENT_FORMAT_VERSION),
+                             'log_dir': self.log_dir,
+                             'usage_log': self.usage_log,
+                             'last_log_time': self.last_log_time,
+                             'log_files': self.log_files,
+                             'duplicate_filter': self.duplicate_filter},
+                            pickle.HIGHEST_PROTOCOL)
+
+    def save(self, snapshot_path):
+        """
+        Writes the snapshot, replacing the file only once it is complete
+        @param snapshot_path: The file to write the snapshot to
+        """
+        state = self._saved_state
+        if state is None:
+            state = self.dumps()
+        temp_path = snapshot_path + '.tmp'
+        with open(temp_path, 'wb') as file_pointer:
+            file_pointer.write(state)
+        os.replace(temp_path, snapshot_path)
+
+
+def load_snapshot(snapshot_path, log_dir, dedup=False):
+    """
+    @param snapshot_path: The file a snapshot was saved to
+    @param log_dir: The log folder the usage log is built from
+    @param dedup: If True duplicate log lines are to be dropped
+    @return: The UsageSnapshot saved for the log folder, or an empty one
+             if there is none, it was saved by another version or with
+             duplicates dropped or not when the other was asked for
+    """
+    snapshot = UsageSnapshot(log_dir, dedup)
+    try:
+        with open(snapshot_path, 'rb') as file_pointer:
+            state = pickle.load(file_pointer)
+    except FileNotFoundError:
+        return snapshot
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        snapshot.rebuilt = True
+        return snapshot
+    if state.get('version') != (SNAPSHOT_VERSION, EVENT_FORMAT_VERSION) or \
+                            state.get('log_dir') != snapshot.log_dir or \
+                            (state['duplicate_filter'] is not None) != dedup:
+        snapshot.rebuilt = True
+        return snapshot
+    snapshot.usage_log = state['usage_log']
+    snapshot.last_log_time = state['last_log_time']
+    snapshot.log_files = state['log_files']
+    snapshot.duplicate_filter = state['duplicate_filter']
+    if snapshot.duplicate_filter is not None:
+        # Only the overlaps of this run are reported
+        snapshot.duplicate_filter.clear_overlaps()
+    return snapshot
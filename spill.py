@@ -0,0 +1,180 @@
+"""
+This file keeps the usage log of very long studies within a memory budget
+by spilling the DailyData of days to a temporary file once the process
+grows past the budget.
+
+Log files and log lines are analysed in time order, so once a new day is
+reached the days before it are finished. While the resident memory of the
+process is over the budget, every day before the one being added to is
+pickled to the spill file and dropped from memory, leaving only the active
+day and its sessions resident. A day is read back when it is looked up,
+as when the report is written one day at a time, and dropped again when
+a later one is read. As a finished day does not change, its copy on disk
+is kept when it is read back and it is only written again if it is set
+anew. The file is only ever read and appended to and is deleted when
+closed.
+
+The resident memory is read from /proc/self/statm where there is one and
+from the peak resident memory otherwise. Where neither can be read every
+finished day is spilled.
+"""
+from collections.abc import MutableMapping
+import os
+import pickle
+import sys
+import tempfile
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss():
+    """
+    @return: The peak resident memory of this process in bytes, or None
+             if it cannot be read
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives kilobytes and macOS bytes
+    if sys.platform == 'darwin':
+        return peak
+    return peak * 1024
+
+def current_rss():
+    """
+    @return: The resident memory of this process in bytes, or None if it
+             cannot be read
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as file_pointer:
+            resident_pages = int(file_pointer.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return peak_rss()
+
+
+class SpillingUsageLog(MutableMapping):
+    """
+    dict of DailyData by date string that spills the days not being added
+    to while the process is over its memory budget
+    """
+    def __init__(self, max_memory, spill_dir=None):
+        """
+        @param max_memory: The memory budget in bytes
+        @param spill_dir: Folder for the spill file, the system temporary
+                          folder if not given
+        """
+        self.max_memory = max_memory
+        self.spill_dir = spill_dir
+        self._resident = {}
+        # date string : (offset, length) in the spill file of the days
+        # whose copy on disk is up to date, resident or not
+        self._spilled = {}
+        self._spill_file = None
+        # Date strings of the days ever written to the spill file
+        self._spilled_days = set()
+        self.spill_bytes = 0
+
+    @property
+    def spill_count(self):
+        """
+        @return: Number of different days written to the spill file
+        """
+        return len(self._spilled_days)
+
+    def __contains__(self, day):
+        return day in self._resident or day in self._spilled
+
+    def __getitem__(self, day):
+        try:
+            return self._resident[day]
+        except KeyError:
+            pass
+        offset, length = self._spilled[day]
+        self._spill_file.seek(offset)
+        daily_record = pickle.loads(self._spill_file.read(length))
+        self._resident[day] = daily_record
+        self._check_memory(day)
+        return daily_record
+
+    def __setitem__(self, day, daily_record):
+        self._spilled.pop(day, None)
+        self._resident[day] = daily_record
+        self._check_memory(day)
+
+    def __delitem__(self, day):
+        if day not in self:
+            raise KeyError(day)
+        self._resident.pop(day, None)
+        self._spilled.pop(day, None)
+
+    def __iter__(self):
+        return iter(list(self._resident) + [day for day in self._spilled
+                                                if day not in self._resident])
+
+    def __len__(self):
+        return len(self._resident) + sum(1 for day in self._spilled
+                                            if day not in self._resident)
+
+    def _check_memory(self, active_day):
+        """
+        Spills the days before the active one if over the memory budget
+        @param active_day: The date string of the day being added to
+        """
+        if not any(day < active_day for day in self._resident):
+            return
+        rss = current_rss()
+        if rss is None or rss > self.max_memory:
+            self.spill(active_day)
+
+    def spill(self, before=None):
+        """
+        Drops the resident days before a day from memory, appending those
+        not already on disk to the spill file. Date strings sort in date
+        order.
+        @param before: The date string of the day being added to, every
+                       resident day is spilled if not given
+        """
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile(prefix='usage_log_',
+                                                      suffix='.spill',
+                                                      dir=self.spill_dir)
+        self._spill_file.seek(0, os.SEEK_END)
+        for day in [day for day in self._resident 
+                            if before is None or day < before]:
+            daily_record = self._resident.pop(day)
+            if day in self._spilled:
+                # Read back unchanged, its copy on disk is kept
+                continue
+            data = pickle.dumps(daily_record, pickle.HIGHEST_PROTOCOL)
+            self._spilled[day] = (self._spill_file.tell(), len(data))
+            self._spill_file.write(data)
+            self._spilled_days.add(day)
+            self.spill_bytes += len(data)
+
+    def close(self):
+        """
+        Deletes the spill file. The spilled days cannot be read after.
+        """
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+            self._spilled = {}
+
+    def write_report(self, output=sys.stderr):
+        """
+        Writes the peak memory of the process against the budget and how
+        much was spilled
+        @param output: The file to write to, stderr so the report on
+                       stdout is left as it is
+        """
+        peak = peak_rss()
+        output.write("Peak memory %s of a %.1f MB budget, %d days spilled "
+                     "to disk (%.1f MB)\n" %
+                        ("%.1f MB" % (peak / 1048576.0) if peak is not None
+                                                            else "unknown",
+                         self.max_memory / 1048576.0, self.spill_count,
+                         self.spill_bytes / 1048576.0))
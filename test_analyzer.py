@@ -0,0 +1,92 @@
+"""
+Tests of the library entry point in analyzer.py, run with
+python -m pytest or python -m unittest
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from analyzer import Analyzer
+from event_handlers import EVENT_REGISTRY
+from test_das_reader import make_record
+
+CUSTOM_KEY = 'robot.custom_event'
+
+LOG_TEXT = ','.join([make_record(0, 'a', ('robot.play_animation',
+                                          'anim_bored_01')),
+                     make_record(1, 'b', (CUSTOM_KEY, 'one')),
+                     make_record(2, 'c'),
+                     make_record(3, 'd', (CUSTOM_KEY, 'two'))])
+
+
+class CustomRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.seen = []
+        self.registry = EVENT_REGISTRY.copy()
+        self.registry.register(CUSTOM_KEY, self.record_custom_event)
+        self.log_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.log_dir, '01.das'), 'w') as log_file:
+            log_file.write(LOG_TEXT)
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir)
+
+    def record_custom_event(self, session_record, game_state, log_line):
+        self.seen.append(log_line[CUSTOM_KEY])
+
+    def test_custom_key_read(self):
+        sources = [LOG_TEXT.encode('utf-8'),
+                   os.path.join(self.log_dir, '01.das'), self.log_dir]
+        for source in sources:
+            for by_timestamp in (False, True):
+                for prefilter in (True, False):
+                    del self.seen[:]
+                    analyzer = Analyzer(prefilter, by_timestamp,
+                                        registry=self.registry)
+                    result = analyzer.analyze(source)
+                    self.assertIsNone(result.error)
+                    self.assertEqual(self.seen, ['one', 'two'])
+
+    def test_lazy_sources(self):
+        sources = [LOG_TEXT.encode('utf-8'),
+                   os.path.join(self.log_dir, '01.das'), self.log_dir]
+        for source in sources:
+            for lazy in (False, True):
+                del self.seen[:]
+                analyzer = Analyzer(lazy=lazy, registry=self.registry)
+                result = analyzer.analyze(source)
+                self.assertIsNone(result.error)
+                self.assertEqual(result.read_stats['records'], 3)
+                self.assertEqual(self.seen, ['one', 'two'])
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.log_dirs = [tempfile.mkdtemp() for count in range(2)]
+        for log_dir in self.log_dirs:
+            with open(os.path.join(log_dir, '01.das'), 'w') as log_file:
+                log_file.write(LOG_TEXT)
+
+    def tearDown(self):
+        for log_dir in self.log_dirs:
+            shutil.rmtree(log_dir)
+
+    def test_pool_kept(self):
+        with Analyzer(jobs=2) as analyzer:
+            results = list(analyzer.analyze_many(self.log_dirs))
+            executor = analyzer._executor
+            self.assertIsNotNone(executor)
+            analyzer.analyze(self.log_dirs[0])
+            self.assertIs(analyzer._executor, executor)
+        self.assertIsNone(analyzer._executor)
+        self.assertEqual([result.error for result in results], [None, None])
+        for log_dir, result in zip(self.log_dirs, results):
+            self.assertEqual(result.format_text(),
+                             Analyzer().analyze(log_dir).format_text())
+
+
+if __name__ == '__main__':
+    unittest.main()
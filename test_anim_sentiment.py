@@ -0,0 +1,206 @@
+"""
+Tests of the animation sentiment rules in anim_sentiment.py against the
+results of the anim_analysis method they replaced, run with
+python -m pytest or python -m unittest
+"""
+import os
+import unittest
+
+from anim_sentiment import (AnimationClassifier, classify_animation,
+                            MIXED_NEUTRAL, NEGATIVE, POSITIVE)
+from das_reader import MappedDasLogReader
+from events import TRACKED_KEY_BYTES_PATTERN
+
+SAMPLE_LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'P005_03.07.2017')
+
+ANIMATION_KEY = 'robot.play_animation'
+
+# (animation name, sentiment given by anim_analysis)
+EXPECTED_SENTIMENTS = (
+    ('anim_speedtap_winhand_01', 1),
+    ('anim_speedtap_playerwinhand_01', -1),
+    ('anim_memorymatch_solo_successgame_player_01', 1),
+    ('anim_speedtap_losegame_intensity02_01', -1),
+    ('anim_speedtap_playerlosegame_01', 1),
+    ('anim_memorymatch_failhand_player_01', 1),
+    ('anim_memorymatch_solo_failhand_player_01', -1),
+    ('anim_hiccup_getin_01', -1),
+    ('anim_hiccup_cure_01', 1),
+    ('anim_reacttoface_identified_01', 1),
+    ('anim_reacttoface_unidentified_01', 0),
+    ('anim_petdetection_misc_01', -1),
+    ('anim_petdetection_cat_01', 1),
+    ('anim_memorymatch_playerno_01', -1),
+    ('anim_memorymatch_playeryes_01', 1),
+    ('anim_memorymatch_match_no_01', -1),
+    ('anim_bored_event_01', -1),
+    ('anim_upgrade_reaction_lift_01', 1),
+    ('anim_rtpkeepaway_ideatoplay_01', 1),
+    ('anim_launch_wakeup_01', 0),
+    ('anim_lookinplaceforfaces_keepalive_long', 0),
+    ('anim_turtleroll_success_01', 1),
+    ('anim_dizzy_shake_stop_01', -1),
+    ('anim_wheely_askforhelp_01', 1),
+    ('anim_sparking_success_01', 1),
+    ('anim_reacttocliff_stuckrightside_01', -1),
+    ('anim_greeting_hello_01', 1),
+    ('anim_meetcozmo_celebration', 1),
+    ('anim_cozmosays_badword_01', -1),
+    ('anim_energy_lowenergy_01', -1),
+    ('anim_energy_highenergy_01', 1),
+    ('anim_workout_lowenergy_success_01', 1),
+    ('', 0),
+    ('anim_neutral_eyes_01', 0),
+    ('anim_player_01', 0),
+    ('anim_wiggle_solo_01', 1),
+    ('anim_closedeyes_01', -1),
+    ('anim_swing_player_01', -1),
+    ('anim_playernotice_01', -1),
+    ('anim_match_nope_01', -1),
+    ('anim_asking_bored_01', 1),
+    ('anim_bored_askforhelp_01', 1),
+    ('anim_petdetection_misc_win_01', 1),
+    ('ANIM_HAPPY_01', 0),
+)
+
+
+def old_anim_analysis(anim_name):
+    """
+    The substring rules of SessionData.anim_analysis before they were 
+    moved to anim_sentiment.py, kept as they were
+    @param anim_name: The name of the animation
+    @return: 1 if positive, -1 if negative, 0 if mixed or neutral
+    """
+    anim_id = 0    
+    positive_anim_strings = ['admire',
+                             'ask',
+                            'celebrat',
+                            'find',
+                            'found',
+                            'giggle',
+                            'happy',
+                            'hello',
+                            'highenergy',
+                            'ideatoplay',
+                            'like',
+                            'newarea',
+                            'petdetection',
+                            'playeryes',
+                            'request',
+                            'reacttocube',
+                            'reenrollment',
+                            'thankyou',
+                            'upgrade',
+                            'wheely',
+                            'wiggle',
+                            'turbo'
+                            ]
+    negative_anim_strings = ['badword',
+                             'bored',
+                             'dizzy',
+                             'frustrated',
+                             'lowenergy',
+                             'match_no',
+                             'playerno', 
+                             'struggle',
+                             'stuck',
+                             'upset',
+                             'turtleroll',
+                             'hiccup']
+    if 'cure' in anim_name:
+        # To handle cure of hiccups
+        anim_id = 1
+    if 'win' in anim_name or 'success' in anim_name:
+        if 'player' in anim_name and not 'solo' in anim_name:
+            anim_id = -1
+        else:
+            anim_id = 1
+    elif 'lose' in anim_name or 'fail' in anim_name:
+        if 'player' in anim_name and not 'solo' in anim_name:
+            anim_id = 1
+        else:
+            anim_id = -1
+    elif 'reacttoface' in  anim_name and not 'unidentified' in anim_name:
+        # positive reactions seems to be for known people only
+        anim_id = 1
+    elif 'petdetection' in anim_name and 'misc' in anim_name: 
+        # the sneeze
+        anim_id = -1
+        
+        
+    if not anim_id:
+        # So if we have not already decided 
+        for anim_string in positive_anim_strings:
+            if anim_string in anim_name:
+                anim_id = 1
+                break
+            
+    if not anim_id:
+        # So if we have not already decided 
+        for anim_string in negative_anim_strings:
+            if anim_string in anim_name:
+                anim_id = -1
+                break
+    return anim_id
+
+def sample_animation_names():
+    """
+    @return: Sorted list of the animation names played in the sample logs
+    """
+    anim_names = set()
+    for file_name in os.listdir(SAMPLE_LOG_DIR):
+        if not file_name.endswith(('.das', '.das_inprogress')):
+            continue
+        with open(os.path.join(SAMPLE_LOG_DIR, file_name), 'rb') as log_file:
+            anim_names.update(log_line[ANIMATION_KEY]
+                                for log_line in MappedDasLogReader(
+                                            log_file, 
+                                            TRACKED_KEY_BYTES_PATTERN)
+                                    if ANIMATION_KEY in log_line)
+    return sorted(anim_names)
+
+
+class AnimationClassifierTest(unittest.TestCase):
+
+    def test_known_names(self):
+        classifier = AnimationClassifier()
+        for anim_name, sentiment in EXPECTED_SENTIMENTS:
+            self.assertEqual(classifier.classify(anim_name), sentiment, 
+                             anim_name)
+            # Looked up again from the names remembered
+            self.assertEqual(classify_animation(anim_name), sentiment, 
+                             anim_name)
+
+    def test_sample_names(self):
+        # Every animation the sample participant saw is classified as the
+        # old rules did
+        anim_names = sample_animation_names()
+        self.assertEqual(len(anim_names), 225)
+        classifier = AnimationClassifier()
+        for anim_name in anim_names:
+            self.assertEqual(classifier.classify(anim_name),
+                             old_anim_analysis(anim_name), anim_name)
+        self.assertEqual(classifier.classify_many(anim_names),
+                         [old_anim_analysis(anim_name) 
+                                for anim_name in anim_names])
+
+    def test_table_matches_old_rules(self):
+        for anim_name, sentiment in EXPECTED_SENTIMENTS:
+            self.assertEqual(old_anim_analysis(anim_name), sentiment, 
+                             anim_name)
+
+    def test_classify_many(self):
+        anim_names = [anim_name for anim_name, sentiment
+                                            in EXPECTED_SENTIMENTS] * 2
+        self.assertEqual(AnimationClassifier().classify_many(anim_names),
+                         [sentiment for anim_name, sentiment
+                                            in EXPECTED_SENTIMENTS] * 2)
+
+    def test_sentiment_values(self):
+        # The values the reports and exports have always used
+        self.assertEqual((POSITIVE, NEGATIVE, MIXED_NEUTRAL), (1, -1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
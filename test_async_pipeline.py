@@ -0,0 +1,52 @@
+"""
+Tests of the asyncio pipeline in async_pipeline.py, run with
+python -m pytest or python -m unittest
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from async_pipeline import get_usage_details_async
+from test_das_reader import make_record
+
+
+class BrokenLogCache:
+    """
+    LogCache whose database cannot be read
+    """
+    def get(self, log_file_path, file_stat, version):
+        raise sqlite3.DatabaseError("database disk image is malformed")
+
+    def put(self, log_file_path, file_stat, log_events, version):
+        pass
+
+
+class UsagePipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        for file_number in range(3):
+            log_file_path = os.path.join(self.log_dir,
+                                         '%02d.das' % file_number)
+            with open(log_file_path, 'w') as log_file:
+                log_file.write(make_record(file_number, 'a',
+                                           ('robot.play_animation',
+                                            'anim_bored_01')))
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir)
+
+    def test_read(self):
+        usage_log = get_usage_details_async(self.log_dir)
+        self.assertEqual(len(usage_log), 1)
+
+    def test_feed_error_raised(self):
+        with self.assertRaises(sqlite3.DatabaseError):
+            get_usage_details_async(self.log_dir,
+                                    log_cache=BrokenLogCache())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Tests of the log readers in das_reader.py on small log files written
+here, run with python -m pytest or python -m unittest
+"""
+import json
+import unittest
+
+from das_reader import BytesDasLogReader
+from events import TRACKED_EVENT_KEYS, TRACKED_KEY_BYTES_PATTERN
+
+
+def make_record(seq, data, event=None):
+    """
+    @param seq: The $seq of the record
+    @param data: The $data of the record
+    @param event: Optional (key, value) of a tracked event
+    @return: The text of the record as the app writes it, keys sorted
+    """
+    record = {'$app': '1.5.0', '$apprun': 'run', '$data': data,
+              '$seq': str(seq), '$ts': str(1498490632323 + seq * 1000)}
+    if event is not None:
+        record[event[0]] = event[1]
+    return json.dumps(record, sort_keys=True, separators=(',', ':'))
+
+def read_records(log_text, prefilter=True, lazy=False):
+    """
+    @param log_text: The text of a log file
+    @param prefilter: If True only records with tracked keys are decoded
+    @param lazy: If True records are read as LogLineView objects
+    @return: Tuple of the list of records read and the reader
+    """
+    key_filter = TRACKED_KEY_BYTES_PATTERN if prefilter else None
+    log_reader = BytesDasLogReader(log_text.encode('utf-8'), key_filter,
+                                   TRACKED_EVENT_KEYS.lazy_keys(lazy))
+    return list(log_reader), log_reader
+
+
+class PrefilterTest(unittest.TestCase):
+
+    def test_separator_inside_data(self):
+        # '},{' in the $data of a tracked record is not its start
+        log_text = ','.join([make_record(0, 'a'),
+                             make_record(1, 'x},{"y":1',
+                                         ('robot.vision.detected_pet',
+                                          'dog')),
+                             make_record(2, 'b'),
+                             make_record(3, 'q},{',
+                                         ('robot.play_animation',
+                                          'anim_bored_01'))])
+        for prefilter in (True, False):
+            log_data, log_reader = read_records(log_text, prefilter)
+            self.assertEqual([log_line['$seq'] for log_line in log_data
+                                if 'robot.vision.detected_pet' in log_line
+                                    or 'robot.play_animation' in log_line],
+                             ['1', '3'])
+            self.assertEqual(log_reader.error_line, 0)
+            self.assertEqual(log_reader.damaged, [])
+
+
+class TruncatedRecordTest(unittest.TestCase):
+
+    def check_truncated(self, last_record):
+        whole_records = ','.join([make_record(0, 'a'),
+                                  make_record(1, 'b',
+                                              ('robot.play_animation',
+                                               'anim_bored_01'))])
+        log_text = whole_records + ',' + last_record
+        for prefilter in (True, False):
+            for lazy in (True, False):
+                log_data, log_reader = read_records(log_text, prefilter, 
+                                                    lazy)
+                self.assertEqual([log_line['$seq'] for log_line in log_data
+                                    if 'robot.play_animation' in log_line],
+                                 ['1'])
+                self.assertEqual(log_reader.error_line, 1)
+                self.assertEqual(log_reader.damaged,
+                                 [(len(whole_records) + 1, len(log_text))])
+
+    def test_no_closing_brace(self):
+        self.check_truncated('{"$app":"1.5.0","$data":"x",'
+                             '"robot.play_animation":"anim_bo')
+
+    def test_closing_brace_inside(self):
+        self.check_truncated('{"$app":"1.5.0","$data":{"a":1},'
+                             '"robot.play_animation":"anim_bored_02"')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+"""
+Tests of the event registry in event_handlers.py, run with
+python -m pytest or python -m unittest
+"""
+import unittest
+
+from clean_log import analyse_by_timestamp, extract_log_bytes_events
+from event_handlers import EVENT_REGISTRY
+from events import EVENT_FORMAT_VERSION, TRACKED_KEYS
+from test_das_reader import make_record
+
+CUSTOM_KEY = 'robot.custom_event'
+
+
+def read_custom_events(registry, prefilter=True):
+    """
+    @param registry: The EventRegistry to read and analyse the log with
+    @param prefilter: If True skip decoding log lines without tracked keys
+    @return: List of the values of CUSTOM_KEY its handler was called with
+    """
+    seen = []
+    registry.register(CUSTOM_KEY, lambda session_record, game_state,
+                                        log_line: seen.append(
+                                                    log_line[CUSTOM_KEY]))
+    log_text = ','.join([make_record(0, 'a', ('robot.play_animation',
+                                              'anim_bored_01')),
+                         make_record(1, 'b', (CUSTOM_KEY, 'one')),
+                         make_record(2, 'c'),
+                         make_record(3, 'd', (CUSTOM_KEY, 'two'))])
+    log_events, read_stats = extract_log_bytes_events(
+                                        log_text.encode('utf-8'), prefilter,
+                                        event_keys=registry.event_keys())
+    analyse_by_timestamp([log_events], registry=registry)
+    return seen
+
+
+class EventKeysTest(unittest.TestCase):
+
+    def test_default_keys(self):
+        event_keys = EVENT_REGISTRY.event_keys()
+        self.assertEqual(event_keys.tracked_keys, TRACKED_KEYS)
+        self.assertEqual(event_keys.version, EVENT_FORMAT_VERSION)
+
+    def test_registered_key_fires(self):
+        for prefilter in (True, False):
+            registry = EVENT_REGISTRY.copy()
+            self.assertEqual(read_custom_events(registry, prefilter),
+                             ['one', 'two'])
+            self.assertIn(CUSTOM_KEY, registry.event_keys().tracked_keys)
+            self.assertNotEqual(registry.event_keys().version,
+                                EVENT_FORMAT_VERSION)
+        self.assertNotIn(CUSTOM_KEY, EVENT_REGISTRY.event_keys().tracked_keys)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+"""
+Tests of the event store in event_store.py, run with python -m pytest or
+python -m unittest
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from event_store import EventStore
+from test_das_reader import make_record
+
+
+class EventStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.log_dir = os.path.join(self.work_dir, 'P001')
+        os.mkdir(self.log_dir)
+        with open(os.path.join(self.log_dir, '01.das'), 'w') as log_file:
+            log_file.write(','.join([
+                    make_record(0, 'text', ('robot.play_animation',
+                                            'anim_bored_01')),
+                    make_record(1, {'face': 3}, ('robot.play_animation',
+                                                 'anim_bored_01')),
+                    make_record(2, [1, 2], ('robot.play_animation',
+                                            'anim_bored_01'))]))
+        self.event_store = EventStore(os.path.join(self.work_dir,
+                                                   'store.sqlite'))
+
+    def tearDown(self):
+        self.event_store.close()
+        shutil.rmtree(self.work_dir)
+
+    def test_structured_data(self):
+        # A $data that is an object or array is stored as text
+        self.assertEqual(self.event_store.ingest(self.log_dir, 
+                                                 by_timestamp=True), 3)
+        columns, rows = self.event_store.query("SELECT data FROM events "
+                                               "ORDER BY line")
+        self.assertEqual([data for data, in rows],
+                         ['text', "{'face': 3}", '[1, 2]'])
+
+
+if __name__ == '__main__':
+    unittest.main()
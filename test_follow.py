@@ -0,0 +1,56 @@
+"""
+Tests of the log folder follower in follow.py, run with python -m pytest
+or python -m unittest
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from follow import LogFollower
+from test_das_reader import make_record
+
+
+class RenamingLogFollower(LogFollower):
+    """
+    LogFollower whose in progress file is closed by the app straight after
+    it has been read, before the folder is listed
+    """
+    rename_after_read = False
+
+    def _read_appended(self, log_file_path, final=False):
+        log_data = LogFollower._read_appended(self, log_file_path, final)
+        if self.rename_after_read:
+            self.rename_after_read = False
+            os.rename(log_file_path, log_file_path.replace('_inprogress', ''))
+        return log_data
+
+
+class LogFollowerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.in_progress_path = os.path.join(self.log_dir, '01.das_inprogress')
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir)
+
+    def append(self, log_text):
+        with open(self.in_progress_path, 'a') as log_file:
+            log_file.write(log_text)
+
+    def test_closed_between_read_and_listing(self):
+        log_follower = RenamingLogFollower(self.log_dir)
+        self.append(make_record(0, 'a'))
+        log_data = log_follower.poll()
+        self.append(',' + make_record(1, 'b'))
+        log_follower.rename_after_read = True
+        log_data.extend(log_follower.poll())
+        log_data.extend(log_follower.poll())
+        log_data.extend(log_follower.poll())
+        self.assertEqual([log_line['$seq'] for log_line in log_data],
+                         ['0', '1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+"""
+Tests of the spilling usage log in spill.py, run with python -m pytest or
+python -m unittest
+"""
+import unittest
+
+from spill import SpillingUsageLog
+
+DAYS = ['2017-07-01', '2017-07-02', '2017-07-03']
+
+
+class SpillingUsageLogTest(unittest.TestCase):
+
+    def setUp(self):
+        # No budget at all, so every finished day is spilled
+        self.usage_log = SpillingUsageLog(0)
+        for day in DAYS:
+            self.usage_log[day] = {'day': day, 'sessions': [day] * 100}
+
+    def tearDown(self):
+        self.usage_log.close()
+
+    def test_finished_days_spilled(self):
+        self.assertEqual(self.usage_log.spill_count, 2)
+        self.assertEqual(sorted(self.usage_log), DAYS)
+        self.assertEqual(len(self.usage_log), 3)
+
+    def test_read_back_not_spilled_again(self):
+        spill_bytes = self.usage_log.spill_bytes
+        for count in range(2):
+            for day in sorted(self.usage_log):
+                self.assertEqual(self.usage_log[day]['day'], day)
+                self.assertEqual(len(self.usage_log), 3)
+        self.assertEqual(self.usage_log.spill_count, 2)
+        self.assertEqual(self.usage_log.spill_bytes, spill_bytes)
+
+    def test_later_days_kept(self):
+        # Looking an earlier day up does not spill the days after it
+        self.usage_log[DAYS[0]]
+        self.assertIn(DAYS[2], self.usage_log._resident)
+
+    def test_set_again(self):
+        self.usage_log[DAYS[0]]
+        self.usage_log[DAYS[0]] = {'day': 'changed'}
+        self.usage_log[DAYS[1]]
+        self.assertEqual(self.usage_log[DAYS[0]], {'day': 'changed'})
+        self.assertEqual(self.usage_log.spill_count, 2)
+        del self.usage_log[DAYS[0]]
+        self.assertEqual(sorted(self.usage_log), DAYS[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,246 @@
+"""
+This file writes the usage log in one of several formats:
+    text  : the report as printed by formatted_print
+    jsonl : one json object per session, one per line
+    csv   : a folder of tables, one row per session, game, freeplay
+            activity and animation, ready to be read into Matlab
+Each day is formatted in one go and written with a single write call.
+"""
+import csv
+import json
+import os
+import sys
+
+from anim_sentiment import classify_animation
+
+DAY_SEPARATOR = "################################################################\n"
+
+SESSION_FIELDS = ('date', 'session', 'time', 'play_time', 'play_sessions',
+                  'positive_animations', 'negative_animations',
+                  'mixed_neutral_animations', 'unknown_face_count',
+                  'face_enrolled', 'face_recognized', 'pets_recorded',
+                  'games_unlocked', 'features_unlocked', 'daily_challenge',
+                  'goal_progress', 'robot_requests')
+
+GAME_FIELDS = ('date', 'session', 'game', 'start_count', 'cozmo_win_count',
+               'cozmo_lose_count', 'neutral_outcome', 'game_abort_count',
+               'positive_animations', 'negative_animations',
+               'mixed_neutral_animations')
+
+FREEPLAY_FIELDS = ('date', 'session', 'freeplay', 'start_count')
+
+ANIMATION_FIELDS = ('date', 'session', 'game', 'animation', 'sentiment',
+                    'count')
+
+# Separates the values of a list in a csv cell
+LIST_SEPARATOR = ';'
+
+
+def session_summary(day, session_number, session_record):
+    """
+    @param day: The date string of the session
+    @param session_number: Number of the session within the day from 1
+    @param session_record: The SessionData of the session
+    @return: dict of the session, with the games, freeplay activities and
+             animations played in it, that json can write
+    """
+    return {'date': day,
+            'session': session_number,
+            'time': "%s" % session_record.session_time,
+            'play_time': session_record.play_time.total_seconds(),
+            'play_sessions': session_record.play_sessions,
+            'positive_animations': session_record.positive_animations,
+            'negative_animations': session_record.negative_animations,
+            'mixed_neutral_animations':
+                                    session_record.mixed_neutral_animations,
+            'unknown_face_count': session_record.unknown_face_count,
+            'face_enrolled': list(session_record.face_enrolled),
+            'face_recognized': list(session_record.face_recognized),
+            'pets_recorded': dict(session_record.pets_recorded),
+            'games_unlocked': list(session_record.games_unlocked),
+            'features_unlocked': list(session_record.features_unlocked),
+            'daily_challenge': list(session_record.daily_challenge),
+            'goal_progress': list(session_record.goal_progress),
+            'robot_requests': dict(session_record.robot_requests),
+            'games': [{'game': game_details.name,
+                       'start_count': game_details.start_count,
+                       'cozmo_win_count': game_details.cozmo_win_count,
+                       'cozmo_lose_count': game_details.cozmo_lose_count,
+                       'neutral_outcome': game_details.neutral_outcome,
+                       'game_abort_count': game_details.game_abort_count,
+                       'positive_animations':
+                                        game_details.positive_animations,
+                       'negative_animations':
+                                        game_details.negative_animations,
+                       'mixed_neutral_animations':
+                                        game_details.mixed_neutral_animations,
+                       'animations': dict(game_details.game_animations)}
+                            for game_details in
+                                        session_record.game_record.values()],
+            'freeplay': {name: free_play.start_count
+                            for name, free_play in
+                                    session_record.freeplay_record.items()},
+            'animations': dict(session_record.animations_played)}
+
+
+def iter_sessions(day, daily_record):
+    """
+    @param day: The date string of the day
+    @param daily_record: The DailyData of the day
+    @return: Generator of the session summary of each session of the day
+    """
+    for index, session_record in enumerate(daily_record.sessions_record):
+        yield session_summary(day, index + 1, session_record)
+
+
+class TextWriter:
+    """
+    Writes the report in the text format of formatted_print
+    """
+    def __init__(self, output, close_output=False):
+        """
+        @param output: The text file object to write to
+        @param close_output: If True the file is closed with the writer
+        """
+        self.output = output
+        self.close_output = close_output
+
+    def write_day(self, day, daily_record):
+        self.output.write(DAY_SEPARATOR + daily_record.format_text())
+
+    def close(self):
+        self.output.flush()
+        if self.close_output:
+            self.output.close()
+
+
+class JsonLinesWriter:
+    """
+    Writes a json object for each session on a line of its own
+    """
+    def __init__(self, output, close_output=False):
+        """
+        @param output: The text file object to write to
+        @param close_output: If True the file is closed with the writer
+        """
+        self.output = output
+        self.close_output = close_output
+
+    def write_day(self, day, daily_record):
+        self.output.write("".join(json.dumps(session, sort_keys=True) + "\n"
+                            for session in iter_sessions(day, daily_record)))
+
+    def close(self):
+        self.output.flush()
+        if self.close_output:
+            self.output.close()
+
+
+class CsvWriter:
+    """
+    Writes sessions.csv, games.csv, freeplay.csv and animations.csv to a
+    folder. Lists and counts in a session cell are joined with ';', the
+    counts as name:count. Animations played in a game are listed with the
+    game, and all the animations of the session with an empty game.
+    """
+    def __init__(self, output_dir):
+        """
+        @param output_dir: The folder to write the tables to
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        self._files = []
+        self.sessions = self._open_table(output_dir, 'sessions',
+                                         SESSION_FIELDS)
+        self.games = self._open_table(output_dir, 'games', GAME_FIELDS)
+        self.freeplay = self._open_table(output_dir, 'freeplay',
+                                         FREEPLAY_FIELDS)
+        self.animations = self._open_table(output_dir, 'animations',
+                                           ANIMATION_FIELDS)
+
+    def _open_table(self, output_dir, name, fields):
+        file_pointer = open(os.path.join(output_dir, name + '.csv'), 'w',
+                            newline='', encoding='utf-8')
+        self._files.append(file_pointer)
+        table = csv.writer(file_pointer)
+        table.writerow(fields)
+        return table
+
+    def write_day(self, day, daily_record):
+        session_rows = []
+        game_rows = []
+        freeplay_rows = []
+        animation_rows = []
+        for session in iter_sessions(day, daily_record):
+            key = (day, session['session'])
+            session_rows.append([_csv_cell(session[field])
+                                                for field in SESSION_FIELDS])
+            for game in session['games']:
+                game_rows.append(key + tuple(game[field]
+                                                for field in GAME_FIELDS[2:]))
+                animation_rows.extend(key + (game['game'], anim_name,
+                                             classify_animation(anim_name),
+                                             count)
+                                for anim_name, count in
+                                                game['animations'].items())
+            freeplay_rows.extend(key + (name, count)
+                                for name, count in session['freeplay'].items())
+            animation_rows.extend(key + ('', anim_name,
+                                         classify_animation(anim_name), count)
+                                for anim_name, count in
+                                                session['animations'].items())
+        self.sessions.writerows(session_rows)
+        self.games.writerows(game_rows)
+        self.freeplay.writerows(freeplay_rows)
+        self.animations.writerows(animation_rows)
+
+    def close(self):
+        for file_pointer in self._files:
+            file_pointer.close()
+
+
+def _csv_cell(value):
+    """
+    @param value: A value of a session summary
+    @return: The value as it is written in a csv cell
+    """
+    if isinstance(value, dict):
+        return LIST_SEPARATOR.join("%s:%s" % item for item in value.items())
+    if isinstance(value, list):
+        return LIST_SEPARATOR.join("%s" % item for item in value)
+    return value
+
+
+WRITERS = {'text': TextWriter,
+           'jsonl': JsonLinesWriter,
+           'csv': CsvWriter}
+
+OUTPUT_FORMATS = tuple(sorted(WRITERS))
+
+
+def write_usage_log(usage_log, writer):
+    """
+    Writes each day of the usage log in date order, looking each one up
+    as it is written so a SpillingUsageLog only reads one back at a time
+    @param usage_log: dict of DailyData by date string
+    @param writer: TextWriter, JsonLinesWriter or CsvWriter to write with
+    """
+    for day in sorted(usage_log):
+        writer.write_day(day, usage_log[day])
+
+
+def open_writer(output_format, output_path=None):
+    """
+    @param output_format: One of OUTPUT_FORMATS
+    @param output_path: File to write text or jsonl to, stdout if not
+                        given, or the folder to write the csv tables to
+    @return: The writer, to be closed once the usage log is written
+    """
+    if output_format == 'csv':
+        if not output_path:
+            raise ValueError("csv tables are written to an output folder")
+        return CsvWriter(output_path)
+    if output_path:
+        return WRITERS[output_format](open(output_path, 'w',
+                                           encoding='utf-8'),
+                                      close_output=True)
+    return WRITERS[output_format](sys.stdout)